@@ -0,0 +1,88 @@
+import asyncio
+import types
+
+from .AsyncQuery import AsyncQuery
+from .MayaGraph import MayaGraph
+from .StepState import StepState
+
+
+class AsyncMayaGraph:
+    """
+    Awaitable versions of the MayaGraph accessors. Each accessor runs its query on the
+    AsyncQuery's request threads, so independent reads can be gathered and only cost as
+    much as the slowest of them.
+    """
+    def __init__(self, graph: MayaGraph, concurrency: int = 4):
+        """
+        :param graph: The MayaGraph being read from
+        :param concurrency: The maximum number of queries that are in flight at once
+        """
+        self.graph = graph
+        self.query = AsyncQuery(graph.query, concurrency)
+
+    async def call(self, method, *args):
+        """
+        Runs a MayaGraph method on the request threads. Generators are read to the end on
+        the request thread, since that's where their query is sent.
+
+        :param method: The MayaGraph method
+        :param args: The method's arguments
+        :return: The method's result, as a list if the method is a generator
+        """
+        def collect():
+            result = method(*args)
+            return list(result) if isinstance(result, types.GeneratorType) else result
+        return await self.query.run(collect)
+
+    async def get_all_families(self) -> list:
+        return await self.call(self.graph.get_all_families)
+
+    async def get_living_winiks(self) -> list:
+        return await self.call(self.graph.get_living_winiks)
+
+    async def get_living_with_ages(self) -> list:
+        return await self.call(self.graph.get_living_with_ages)
+
+    async def get_winik(self, winik_id, property) -> list:
+        return await self.call(self.graph.get_winik, winik_id, property)
+
+    async def get_all_winiks(self) -> list:
+        return await self.call(self.graph.get_all_winiks)
+
+    async def get_winik_records(self) -> list:
+        return await self.call(self.graph.get_winik_records)
+
+    async def get_resource_records(self) -> list:
+        return await self.call(self.graph.get_resource_records)
+
+    async def get_emergency_records(self) -> list:
+        return await self.call(self.graph.get_emergency_records)
+
+    async def get_partnerable_winiks(self) -> tuple:
+        return await self.call(self.graph.get_partnerable_winiks)
+
+    async def get_step_state(self) -> StepState:
+        """
+        Takes a snapshot of the village with its three bulk queries in flight at once.
+
+        :return: The snapshot
+        """
+        winiks, resources, emergencies = await asyncio.gather(self.get_winik_records(),
+                                                              self.get_resource_records(),
+                                                              self.get_emergency_records())
+        return StepState(winiks, resources, emergencies)
+
+    async def flush(self) -> None:
+        await self.call(self.graph.flush)
+
+    async def save(self, path) -> None:
+        await self.call(self.graph.save, path)
+
+    def close(self) -> None:
+        self.query.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .Query import Query
+
+
+class AsyncQuery:
+    """
+    An asyncio front end for a store backend (Query or LocalQuery). Requests run on a
+    small pool of threads that share the backend's keep-alive session, so many reads and
+    writes can be in flight at once without opening a connection for each of them.
+    """
+    def __init__(self, query, concurrency: int = 4):
+        """
+        :param query: The Query or LocalQuery that the requests are sent through
+        :param concurrency: The maximum number of requests that are in flight at once
+        """
+        self.query = query
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    @classmethod
+    def connect(cls, endpoint: str, username: str, password: str, concurrency: int = 4):
+        """
+        Creates a client for a GraphDB repository with one pooled connection per request
+        that can be in flight.
+
+        :param endpoint: The repository endpoint (ie http://localhost:7200/repositories/Tests)
+        :param username: The GraphDB username
+        :param password: The GraphDB password
+        :param concurrency: The maximum number of requests that are in flight at once
+        :return: A new AsyncQuery
+        """
+        return cls(Query(endpoint, username, password, pool_size=concurrency), concurrency)
+
+    async def run(self, function, *args):
+        """
+        Runs a blocking call on the request threads.
+
+        :param function: The function being called
+        :param args: The function's arguments
+        :return: The function's result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    async def get(self, query: str) -> dict:
+        logging.debug("Sending async SPARQL GET")
+        return await self.run(self.query.get, query)
+
+    async def post(self, query: str) -> None:
+        logging.debug("Sending async SPARQL POST")
+        await self.run(self.query.post, query)
+
+    async def post_many(self, updates: list) -> None:
+        await self.run(self.query.post_many, updates)
+
+    async def save(self, path) -> None:
+        await self.run(self.query.save, path)
+
+    def close(self) -> None:
+        """
+        Waits for the requests that are in flight and stops the request threads.
+
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
@@ -0,0 +1,103 @@
+import gzip
+import logging
+import time
+import rdflib
+
+from .NTriples import NTriples
+from .Query import Query
+
+
+class BulkLoader:
+    """
+    Streams an initial state into a store (Query or LocalQuery) in chunks of N-Triples
+    lines, so that states of any size can be loaded in one unattended command without
+    going through the GraphDB import page. Files written by InitialGraph.create_initial_triples
+    are read a line at a time; turtle files are parsed first, which holds them in memory.
+    """
+    def __init__(self, query, batch_size: int = 50000, progress=None):
+        """
+        :param query: The store backend that the triples are loaded into
+        :param batch_size: The number of triples sent in each request
+        :param progress: An optional function that's called with the number of triples loaded
+                         so far after every chunk
+        """
+        self.query = query
+        self.batch_size = batch_size
+        self.progress = progress
+
+    @staticmethod
+    def lines(path):
+        """
+        Reads the triples of a file as N-Triples lines.
+
+        :param path: The path to an N-Triples (.nt) or turtle file, which can be gzipped (.gz)
+        :return: A generator of lines
+        """
+        path = str(path)
+        opener = gzip.open if path.endswith(".gz") else open
+        if path.endswith(".nt") or path.endswith(".nt.gz"):
+            with opener(path, "rt") as f:
+                for line in f:
+                    # Skip blank lines and comments
+                    if line.strip() and not line.lstrip().startswith("#"):
+                        yield line
+        else:
+            graph = rdflib.Graph()
+            with opener(path, "rt") as f:
+                graph.parse(data=f"@base <{Query.base}> .\n{f.read()}", format="turtle")
+            for triple in graph:
+                yield NTriples.line(triple)
+
+    def load(self, path) -> int:
+        """
+        Loads a file into the store.
+
+        :param path: The path to an N-Triples (.nt) or turtle file
+        :return: The number of triples loaded
+        """
+        logging.info(f"Loading {path} into {self.query.endpoint} in chunks of {self.batch_size} triples")
+        return self.load_lines(self.lines(path))
+
+    def load_lines(self, lines) -> int:
+        """
+        Loads N-Triples lines into the store, a chunk at a time. Blank node labels are only
+        shared within one request, so the lines that have blank nodes (ie the ontology's
+        restrictions) are held back and sent together in the last request.
+
+        :param lines: An iterable of N-Triples lines
+        :return: The number of triples loaded
+        """
+        start = time.perf_counter()
+        loaded = 0
+        chunk = []
+        blank = []
+        for line in lines:
+            if line.startswith("_:") or " _:" in line:
+                blank.append(line)
+                continue
+            chunk.append(line)
+            if len(chunk) == self.batch_size:
+                loaded = self.send(chunk, loaded, start)
+                chunk = []
+        if chunk or blank:
+            loaded = self.send(chunk + blank, loaded, start)
+        logging.info(f"Loaded {loaded} triples in {time.perf_counter() - start:.1f}s")
+        return loaded
+
+    def send(self, chunk: list, loaded: int, start: float) -> int:
+        """
+        Sends one chunk and reports the progress.
+
+        :param chunk: The N-Triples lines
+        :param loaded: The number of triples loaded before this chunk
+        :param start: The time.perf_counter() reading from when the load started
+        :return: The number of triples loaded including this chunk
+        """
+        self.query.load_triples(chunk)
+        loaded += len(chunk)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Loaded {loaded} triples ({loaded / elapsed if elapsed else 0:.0f} triples/s)")
+        if self.progress is not None:
+            self.progress(loaded)
+        return loaded
+
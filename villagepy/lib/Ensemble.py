@@ -0,0 +1,102 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+
+
+def run_member(initial_state: str, length: int, seed: int) -> list:
+    """
+    Runs one simulation of the ensemble on its own local store. This runs in the worker
+    processes.
+
+    :param initial_state: The path to the turtle file holding the initial state
+    :param length: The number of steps to run
+    :param seed: The seed for the simulation's random draws
+    :return: A list of summary rows, one per step
+    """
+    model = Model(query=LocalQuery(initial_state), seed=seed)
+    summary = Ensemble.Summary()
+    rows = []
+    for step in range(length):
+        logging.info(f"Seed {seed}: starting step {step}")
+        model.run_step(step)
+        rows.append(dict(seed=seed, step=step, **summary.measure(model.graph)))
+    return rows
+
+
+class Ensemble:
+    """
+    Runs the same scenario with many random seeds. Each simulation runs in its own process
+    against an isolated in-memory store that's loaded from the same initial state, so the
+    simulations don't share anything and the ensemble scales with the number of cores.
+    """
+    class Summary:
+        """
+        Measures the village after each step. Births and deaths are counted against the
+        previous measurement.
+        """
+        def __init__(self):
+            self.winiks = None
+            self.dead = None
+
+        def measure(self, graph) -> dict:
+            """
+            Gets the summary metrics of the village.
+
+            :param graph: The MayaGraph holding the village
+            :return: A dictionary of metric name to value
+            """
+            winiks = {}
+            for record in graph.get_winik_records():
+                winiks.setdefault(record[0], record)
+            dead = {winik_id for winik_id, record in winiks.items() if not record[4]}
+            families = {record[6] for record in winiks.values() if record[4]}
+            metrics = {
+                "population": len(winiks) - len(dead),
+                "births": len(winiks.keys() - self.winiks) if self.winiks is not None else 0,
+                "deaths": len(dead - self.dead) if self.dead is not None else 0,
+                "families": len(families),
+            }
+            self.winiks = set(winiks)
+            self.dead = dead
+
+            # The average quantity of each resource over the families
+            totals = {}
+            resource_families = set()
+            for family_id, resource_id, name, quantity in graph.get_resource_records():
+                totals[name] = totals.get(name, 0) + quantity
+                resource_families.add(family_id)
+            for name, total in sorted(totals.items()):
+                metrics[f"{name}_per_family"] = total / len(resource_families)
+            return metrics
+
+    def __init__(self, initial_state: str, length: int, seeds, processes=None):
+        """
+        :param initial_state: The path to the turtle file holding the initial state
+        :param length: The number of steps each simulation runs for
+        :param seeds: The seeds of the simulations, one simulation per seed
+        :param processes: The number of worker processes. Defaults to the number of CPUs
+        """
+        self.initial_state = initial_state
+        self.length = length
+        self.seeds = list(seeds)
+        self.processes = processes or os.cpu_count() or 1
+
+    def run(self) -> pd.DataFrame:
+        """
+        Runs every simulation in the ensemble.
+
+        :return: A data frame with one row per seed and step holding the summary metrics
+        """
+        logging.info(f"Running {len(self.seeds)} simulations with {self.processes} processes")
+        if self.processes == 1:
+            results = [run_member(self.initial_state, self.length, seed) for seed in self.seeds]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.processes, len(self.seeds))) as executor:
+                futures = [executor.submit(run_member, self.initial_state, self.length, seed)
+                           for seed in self.seeds]
+                results = [future.result() for future in futures]
+        return pd.DataFrame.from_records([row for rows in results for row in rows])
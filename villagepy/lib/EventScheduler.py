@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import threading
+
+
+class EventScheduler:
+    """
+    A priority queue of the days that winiks and families next need the threshold
+    subsystems. Most days nothing crosses a threshold: nobody becomes old enough to
+    partner, no winik reaches the next profession age, no mother's youngest child stops
+    being a newborn and no calorie emergency expires. Instead of scanning the whole village
+    every day, the model asks the scheduler which entities are due and only runs
+    partnership, job changes, births and emergency expiry for those.
+
+    The kinds of events are
+        partnership: a winik becomes old enough to be partnered (the whole village is matched)
+        jobs: a family's professions need to be checked
+        births: a winik might be able to have a child
+        emergency: a family's calorie emergency might have expired
+        age: a winik crosses a profession age; it makes its family's jobs due and schedules
+             the next one
+    Resources and calories change every day, so they aren't scheduled.
+    """
+    # Winiks can be partnered once they're older than this (see MayaGraph.get_partnerable_winiks)
+    partner_age = 5844
+    # The ages that Model.job_adjustments changes professions at
+    profession_ages = (1826, 3287, 5113, 14610)
+    # Children are newborns until they're this old (see Model.can_have_child)
+    newborn_age = 365
+
+    def __init__(self):
+        self.events = []
+        self.counter = itertools.count()
+        # Families can be processed on several threads, and each of them can schedule events
+        self.lock = threading.Lock()
+        # Whether the scheduler has been filled from a snapshot of the village
+        self.seeded = False
+
+    def __len__(self):
+        return len(self.events)
+
+    def reset(self) -> None:
+        """
+        Drops every event. The next step runs every subsystem for everyone and seeds the
+        scheduler again, which is needed whenever the graph is changed outside the model.
+
+        :return: None
+        """
+        self.events = []
+        self.seeded = False
+
+    def schedule(self, day: int, kind: str, entity=None) -> None:
+        """
+        Adds an event.
+
+        :param day: The step that the event is due on
+        :param kind: The kind of event (ie births)
+        :param entity: The winik or family that the event is for
+        :return: None
+        """
+        # The counter keeps events on the same day in the order they were scheduled, and
+        # means that the entities never have to be compared
+        with self.lock:
+            heapq.heappush(self.events, (day, next(self.counter), kind, entity))
+
+    def pop(self, day: int) -> dict:
+        """
+        Removes the events that are due on or before a day.
+
+        :param day: The current step
+        :return: A dictionary of kind to a dict of the due entities, in the order they were scheduled
+        """
+        due = {}
+        while self.events and self.events[0][0] <= day:
+            _, _, kind, entity = heapq.heappop(self.events)
+            if kind == "age":
+                winik_id, family_id, birth = entity
+                due.setdefault("jobs", {})[family_id] = True
+                self.schedule_profession(winik_id, family_id, day - birth, day)
+            else:
+                due.setdefault(kind, {})[entity] = True
+        return due
+
+    def schedule_profession(self, winik_id, family_id, age: int, day: int) -> None:
+        """
+        Schedules the next profession age that a winik crosses.
+
+        :param winik_id: The identifier of the winik
+        :param family_id: The identifier of the winik's family
+        :param age: The winik's age on the day
+        :param day: The current step
+        :return: None
+        """
+        for threshold in self.profession_ages:
+            if age <= threshold:
+                self.schedule(day + threshold + 1 - age, "age", (winik_id, family_id, day - age))
+                return
+
+    def schedule_winik(self, winik_id, family_id, age: int, day: int, partnered=False) -> None:
+        """
+        Schedules the age thresholds that a winik still has to cross.
+
+        :param winik_id: The identifier of the winik
+        :param family_id: The identifier of the winik's family
+        :param age: The winik's age on the day
+        :param day: The current step
+        :param partnered: Whether the winik already has a partner
+        :return: None
+        """
+        if not partnered and age <= self.partner_age:
+            self.schedule(day + self.partner_age + 1 - age, "partnership")
+        self.schedule_profession(winik_id, family_id, age, day)
+
+    def seed(self, state, day: int) -> None:
+        """
+        Fills the scheduler from a snapshot of the village. Every family and every living
+        female is due on the day, so the first step runs everything.
+
+        :param state: The StepState of the day
+        :param day: The current step
+        :return: None
+        """
+        for family_id in state.families():
+            self.schedule(day, "jobs", family_id)
+            for winik in state.living_winiks(family_id):
+                self.schedule_winik(winik["id"], family_id, winik["age"], day, bool(winik["partner"]))
+                if winik["gender"] == "F":
+                    self.schedule(day, "births", winik["id"])
+        for family_id in state.emergencies:
+            self.schedule(day, "emergency", family_id)
+        self.seeded = True
@@ -0,0 +1,198 @@
+import logging
+import os
+import re
+import rdflib
+
+
+class HistoryWriter:
+    """
+    Records the state of the graph at each step. A full keyframe is written every
+    'keyframe_interval' steps; the steps in between only store the triples that were added
+    and removed since the step before them.
+
+    Files are written as N-Triples:
+        keyframe_{step}.nt: Every triple in the graph at the start of the step
+        added_{step}.nt: Triples that are in the graph at 'step' but not at 'step - 1'
+        removed_{step}.nt: Triples that are in the graph at 'step - 1' but not at 'step'
+    """
+    def __init__(self, directory: str, keyframe_interval: int = 100):
+        """
+        :param directory: The directory that the history is written to
+        :param keyframe_interval: The number of steps between full keyframes
+        """
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.previous_step = None
+        self.previous = None
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, step: int, lines) -> None:
+        """
+        Records the graph at a step.
+
+        :param step: The step being recorded
+        :param lines: The graph's triples as N-Triples lines
+        :return: None
+        """
+        current = set(lines)
+        if self.previous is None or step % self.keyframe_interval == 0 or step != self.previous_step + 1:
+            logging.info(f"Writing history keyframe for step {step}")
+            self.write_lines(f"keyframe_{step}.nt", current)
+        else:
+            added = current - self.previous
+            removed = self.previous - current
+            logging.info(f"Writing history delta for step {step}: {len(added)} added, {len(removed)} removed")
+            self.write_lines(f"added_{step}.nt", added)
+            self.write_lines(f"removed_{step}.nt", removed)
+        self.previous = current
+        self.previous_step = step
+
+    def write_lines(self, filename: str, lines) -> None:
+        """
+        Writes a set of N-Triples lines to a file in the history directory.
+
+        :param filename: The name of the file
+        :param lines: The lines being written
+        :return: None
+        """
+        with open(os.path.join(self.directory, filename), "w") as f:
+            for line in sorted(lines):
+                f.write(line)
+                f.write("\n")
+
+
+class HistoryReader:
+    """
+    Rebuilds the graph at any recorded step by replaying deltas on top of the nearest
+    keyframe before it.
+    """
+    pattern = re.compile(r"^(keyframe|added|removed)_(\d+)\.nt$")
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory that the history was written to
+        """
+        self.directory = directory
+        self.keyframes = set()
+        self.deltas = set()
+        for filename in os.listdir(directory):
+            match = self.pattern.match(filename)
+            if not match:
+                continue
+            kind, step = match.group(1), int(match.group(2))
+            if kind == "keyframe":
+                self.keyframes.add(step)
+            else:
+                self.deltas.add(step)
+
+    @staticmethod
+    def is_history(directory: str) -> bool:
+        """
+        Checks whether a directory holds a keyframe/delta history.
+
+        :param directory: The directory being checked
+        :return: True if there's at least one keyframe in it
+        """
+        return any(filename.startswith("keyframe_") and filename.endswith(".nt")
+                   for filename in os.listdir(directory))
+
+    def steps(self) -> list:
+        """
+        Gets every step that can be rebuilt, in numeric order.
+
+        :return: A sorted list of steps
+        """
+        return sorted(self.keyframes | self.deltas)
+
+    def read_lines(self, filename: str) -> set:
+        """
+        Reads a file of N-Triples lines from the history directory.
+
+        :param filename: The name of the file
+        :return: A set of lines
+        """
+        with open(os.path.join(self.directory, filename)) as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def lines(self, step: int) -> set:
+        """
+        Rebuilds the graph at a step as a set of N-Triples lines.
+
+        :param step: The step being rebuilt
+        :return: The graph's triples as N-Triples lines
+        """
+        keyframes = [keyframe for keyframe in self.keyframes if keyframe <= step]
+        if not keyframes:
+            raise ValueError(f"There's no keyframe at or before step {step}")
+        keyframe = max(keyframes)
+        current = self.read_lines(f"keyframe_{keyframe}.nt")
+        for delta_step in range(keyframe + 1, step + 1):
+            if delta_step not in self.deltas:
+                raise ValueError(f"The delta for step {delta_step} is missing")
+            current -= self.read_lines(f"removed_{delta_step}.nt")
+            current |= self.read_lines(f"added_{delta_step}.nt")
+        return current
+
+    def iter_lines(self):
+        """
+        Rebuilds every step in order, applying each delta to the step before it instead of
+        replaying from a keyframe each time.
+
+        :return: Tuples of (step, N-Triples lines). The set is reused between steps, so copy
+                 it if it needs to be kept.
+        """
+        current = None
+        previous_step = None
+        for step in self.steps():
+            if step in self.keyframes:
+                current = self.read_lines(f"keyframe_{step}.nt")
+            elif current is not None and step == previous_step + 1:
+                current -= self.read_lines(f"removed_{step}.nt")
+                current |= self.read_lines(f"added_{step}.nt")
+            else:
+                current = self.lines(step)
+            previous_step = step
+            yield step, current
+
+    def iter_graphs(self, start=None, stop=None):
+        """
+        Rebuilds every step in order as an rdflib graph. The same graph is updated in place
+        with each delta, so only the changed triples are parsed.
+
+        :param start: The first step to rebuild. Defaults to the first recorded step
+        :param stop: The step to stop before. Defaults to rebuilding every step after 'start'
+        :return: Tuples of (step, graph). The graph is reused between steps.
+        """
+        graph = None
+        previous_step = None
+        for step in self.steps():
+            if (start is not None and step < start) or (stop is not None and step >= stop):
+                continue
+            if step in self.keyframes or graph is None or step != previous_step + 1:
+                graph = self.load(step)
+            else:
+                graph -= self.to_graph(self.read_lines(f"removed_{step}.nt"))
+                graph += self.to_graph(self.read_lines(f"added_{step}.nt"))
+            previous_step = step
+            yield step, graph
+
+    def load(self, step: int) -> rdflib.Graph:
+        """
+        Rebuilds the graph at a step.
+
+        :param step: The step being rebuilt
+        :return: An rdflib graph holding the step's triples
+        """
+        return self.to_graph(self.lines(step))
+
+    @staticmethod
+    def to_graph(lines) -> rdflib.Graph:
+        """
+        Parses N-Triples lines into a graph.
+
+        :param lines: The N-Triples lines
+        :return: An rdflib graph
+        """
+        graph = rdflib.Graph()
+        graph.parse(data="\n".join(lines), format="nt")
+        return graph
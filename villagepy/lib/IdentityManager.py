@@ -1,23 +1,133 @@
+import json
+import os
+import threading
 import rdflib
 
 
 class IdentityManager:
-    def __init__(self):
+    """
+    Hands out the identifiers of new nodes from blocks that are reserved ahead of time, so
+    minting an identifier never touches the store. The counters start from the highest
+    identifiers in the store (see start), which MayaGraph reads once.
+
+    When the manager has a path, the counters are kept in that file and each block is
+    reserved under a file lock, so several processes sharing the file get ranges that don't
+    overlap. The file is written every time a block is reserved, which keeps it at or ahead
+    of any checkpoint of the graph; identifiers that were reserved but never used are skipped.
+    """
+    def __init__(self, block_size: int = 1000, path=None):
+        """
+        :param block_size: The number of identifiers reserved at a time
+        :param path: An optional JSON file that the counters are kept in
+        """
+        # The last identifier handed out for each kind of node
         self.counts = {'resource': 0, 'winik': 0, 'family': 0, 'calorieEmergency': 0}
+        # The last identifier of each kind's reserved block
+        self.reserved = {}
+        self.block_size = block_size
+        self.path = path
+        self.lock = threading.Lock()
+
+    def start(self, high_water: dict) -> None:
+        """
+        Moves the counters past the identifiers that are already in the store. Counters that
+        are already higher are kept, so identifiers are never handed out twice.
+
+        :param high_water: A dictionary of kind (ie winik) to the highest identifier in use
+        :return: None
+        """
+        with self.lock:
+            for property_name, count in high_water.items():
+                if property_name in self.counts:
+                    self.counts[property_name] = max(self.counts[property_name], int(count))
+
+    def checkpoint(self) -> dict:
+        """
+        Copies the counters, so they can be saved with a snapshot of the graph.
+
+        :return: A dictionary of kind to the last identifier handed out
+        """
+        with self.lock:
+            return dict(self.counts)
+
+    def restore(self, counts: dict) -> None:
+        """
+        Puts the counters back to the ones saved with a snapshot, so a run that's resumed from
+        it hands out the same identifiers as the run that wrote it. Unlike start, this can
+        move the counters backwards, which is safe once the graph holds the snapshot.
+
+        :param counts: The dictionary from checkpoint
+        :return: None
+        """
+        with self.lock:
+            for property_name, count in counts.items():
+                if property_name in self.counts:
+                    self.counts[property_name] = int(count)
+            self.reserved = {}
+
+    def persist(self, path) -> None:
+        """
+        Keeps the counters in a file from now on, and writes them to it straight away.
+
+        :param path: The path of the JSON file
+        :return: None
+        """
+        with self.lock:
+            self.path = path
+            self.reserved = {}
+            with self.locked_counters() as counters:
+                for property_name, count in self.counts.items():
+                    counters[property_name] = max(counters.get(property_name, 0), count)
+                    self.counts[property_name] = counters[property_name]
+
+    def locked_counters(self):
+        """
+        Opens the counter file with an exclusive lock.
+
+        :return: A context manager giving the dictionary of counters, which is written back on exit
+        """
+        return CounterFile(self.path)
+
+    def reserve(self, property_name: str) -> None:
+        """
+        Reserves the next block of identifiers for a kind of node. The lock must be held.
+
+        :param property_name: The kind of node
+        :return: None
+        """
+        start = self.counts[property_name]
+        if self.path is not None:
+            with self.locked_counters() as counters:
+                start = max(start, counters.get(property_name, 0))
+                counters[property_name] = start + self.block_size
+        self.counts[property_name] = start
+        self.reserved[property_name] = start + self.block_size
+
+    def next_count(self, property_name: str) -> int:
+        """
+        Takes the next identifier number for a kind of node.
+
+        :param property_name: The kind of node (resource, winik, family, calorieEmergency)
+        :return: The number
+        """
+        with self.lock:
+            if self.counts[property_name] >= self.reserved.get(property_name, 0):
+                self.reserve(property_name)
+            self.counts[property_name] += 1
+            return self.counts[property_name]
 
     def get_id(self, property_name: str) -> rdflib.URIRef:
         """
         Generates an identifier for a new node. For example,
 
         If the property name is 'Winik', and there are 10 'Winiks' that already exist
-        this will return Winik/10
+        this will return Winik/11
 
         :param property_name: The name of the property (resource, winik, family)
         :return: A compliant, unique URI
          """
         if property_name in self.counts:
-            self.counts[property_name] += 1
-            return rdflib.URIRef(f'{property_name}/{str(self.counts[property_name])}')
+            return rdflib.URIRef(self.get_graph_id(property_name, self.next_count(property_name)))
 
     @staticmethod
     def get_graph_id(class_name, count) -> str:
@@ -27,3 +137,42 @@ class IdentityManager:
         :return:
         """
         return f"{class_name}/{count}"
+
+
+class CounterFile:
+    """
+    A JSON file of counters that's locked while it's read and written.
+    """
+    def __init__(self, path):
+        """
+        :param path: The path of the file. It's created when it doesn't exist
+        """
+        self.path = path
+        self.handle = None
+        self.counters = None
+
+    def __enter__(self) -> dict:
+        # fcntl only exists on POSIX systems; it's imported here so the identity manager (and
+        # every graph) can still be used elsewhere when the counters aren't kept in a file
+        import fcntl
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.handle = open(self.path, "a+")
+        fcntl.flock(self.handle, fcntl.LOCK_EX)
+        self.handle.seek(0)
+        contents = self.handle.read()
+        self.counters = json.loads(contents) if contents.strip() else {}
+        return self.counters
+
+    def __exit__(self, error_type, error, traceback):
+        try:
+            if error_type is None:
+                self.handle.seek(0)
+                self.handle.truncate()
+                json.dump(self.counters, self.handle)
+                self.handle.flush()
+                os.fsync(self.handle.fileno())
+        finally:
+            # Closing the file releases the lock
+            self.handle.close()
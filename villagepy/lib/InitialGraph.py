@@ -3,6 +3,9 @@ import math as math
 import pandas as pd
 
 from .BaseGraph import BaseGraph
+from .NTriples import NTriples
+from .OntologyCache import ontology_cache
+from .Query import Query
 
 
 class InitialGraph(BaseGraph):
@@ -10,12 +13,16 @@ class InitialGraph(BaseGraph):
     A class that represents the initial state of a simulation. It should be used to get
     the initial graph which can be uploaded to a graph database.
     """
-    def __init__(self, winik_file, resource_file):
+    def __init__(self, winik_file, resource_file, cache=ontology_cache):
         """
         Creates a new graph that represents the initial condition
+
+        :param winik_file: The csv file that defines the winiks
+        :param resource_file: The csv file that defines each family's resources
+        :param cache: The OntologyCache that the ontology is read from
         """
         self.database = rdflib.Graph()
-        self.database.parse("../onto/FamilyHealthHistory.owl")
+        cache.load(self.database)
         self.winik_file = winik_file
         self.resource_file = resource_file
         super().__init__()
@@ -65,7 +72,10 @@ class InitialGraph(BaseGraph):
             self.database.add((winik_identifier, self.maya.hasFather, rdflib.URIRef(f'winik/{row["father_id"]}')))
             self.database.add((winik_identifier, self.maya.hasProfession, rdflib.Literal(row['profession'])))
             self.database.add((winik_identifier, self.maya.isAlive, rdflib.Literal(row['alive'])))
-            self.database.add((winik_identifier, self.maya.hasAge, rdflib.Literal(row['age'])))
+            # Ages are kept as the step that the winik was born on; step 0 is the first simulated day
+            self.database.add((winik_identifier, self.maya.hasBirthStep, rdflib.Literal(-1 - int(row['age']))))
+            if not row['alive']:
+                self.database.add((winik_identifier, self.maya.hasDeathStep, rdflib.Literal(-1)))
             # Connect the winik to its family
             self.database.add((winik_identifier, self.maya.hasFamily, rdflib.URIRef(f'family/{row["fam_id"]}')))
             # Handle the winik's partner
@@ -77,6 +87,129 @@ class InitialGraph(BaseGraph):
         # Update the number of winiks
         self.id_manager.counts["winiks"] = len(winik_frame)
 
+    def create_initial_triples(self, path="initial_state.nt", base=Query.base, chunk_size=100000) -> None:
+        """
+        Writes the initial state straight to a file without building the graph in memory,
+        so villages of any size can be generated in bounded memory.
+
+        :param path: The path of the file that's written
+        :param base: The base that the identifiers are resolved against. The default is the
+                     base GraphDB gives imported snippets, so the file is N-Triples that any
+                     importer reads and the identifiers match the turtle file's once it's loaded
+        :param chunk_size: The number of winiks that are read from the csv file at a time
+        :return: None
+        """
+        with open(path, "w") as f:
+            self.write_triples(f, base, chunk_size)
+
+    def write_triples(self, stream, base=Query.base, chunk_size=100000) -> None:
+        """
+        Writes the ontology, winiks, families and resources to a stream as N-Triples lines.
+        The winik file is read in chunks and each chunk is turned into lines a column at a
+        time. Families and their resources are written the first time a family is seen.
+
+        :param stream: A text stream (ie an open file)
+        :param base: The base that the identifiers are resolved against
+        :param chunk_size: The number of winiks that are read from the csv file at a time
+        :return: None
+        """
+        for triple in self.database:
+            stream.write(NTriples.line(triple))
+        resources = pd.read_csv(self.resource_file, skipinitialspace=True) if self.resource_file else None
+        families = set()
+        winiks = 0
+        if self.winik_file:
+            for frame in pd.read_csv(self.winik_file, chunksize=chunk_size):
+                for fam_id in frame["fam_id"].unique():
+                    if fam_id not in families:
+                        families.add(fam_id)
+                        stream.write(self.family_triples(fam_id, resources, base))
+                stream.write(self.winik_triples(frame, base))
+                winiks += len(frame)
+        self.id_manager.counts["family"] = len(families)
+        self.id_manager.counts["winiks"] = winiks
+
+    def family_triples(self, fam_id, resources, base=Query.base) -> str:
+        """
+        Creates the N-Triples lines of a family and its resources.
+
+        :param fam_id: The family's identifier in the winik file
+        :param resources: The resource data frame, or None when there are no resources
+        :param base: The base that the identifiers are resolved against
+        :return: The lines
+        """
+        family = f"<{base}family/{fam_id}>"
+        lines = [f"{family} {rdflib.RDF.type.n3()} {self.maya.Family.n3()} .\n"]
+        if resources is not None:
+            for name, quantity in zip(resources.iloc[:, 0], resources.iloc[:, 1]):
+                resource = f"<{base}{self.id_manager.get_id('resource')}>"
+                lines.append(f"{resource} {rdflib.RDF.type.n3()} {self.maya.Resource.n3()} .\n")
+                lines.append(f"{resource} {self.maya.hasName.n3()} {rdflib.Literal(name).n3()} .\n")
+                lines.append(f"{resource} {self.maya.hasQuantity.n3()} {rdflib.Literal(quantity).n3()} .\n")
+                lines.append(f"{family} {self.maya.hasResource.n3()} {resource} .\n")
+        return "".join(lines)
+
+    def winik_triples(self, frame: pd.DataFrame, base=Query.base) -> str:
+        """
+        Creates the N-Triples lines of a chunk of winiks, a column at a time. They're the same
+        triples that add_winiks adds to the graph.
+
+        :param frame: A chunk of the winik data frame
+        :param base: The base that the identifiers are resolved against
+        :return: The lines
+        """
+        def node(kind, values):
+            return f"<{base}{kind}/" + values.astype(str) + ">"
+
+        winik = node("winik", frame["identifier"])
+        columns = [
+            (rdflib.RDF.type, frame["gender"].map(lambda gender: self.fh.Person_Male.n3() if gender == "M"
+                                                  else self.fh.Person_Female.n3())),
+            (self.maya.hasHealth, self.literals(frame["health"])),
+            (self.maya.hasFirstName, self.literals(frame["first_name"])),
+            (self.maya.hasLastName, self.literals(frame["last_name"])),
+            (self.maya.hasGender, self.literals(frame["gender"])),
+            (self.fh.has_natural_mother, node("winik", frame["mother_id"])),
+            (self.maya.hasMother, node("winik", frame["mother_id"])),
+            (self.fh.has_natural_father, node("winik", frame["father_id"])),
+            (self.maya.hasFather, node("winik", frame["father_id"])),
+            (self.maya.hasProfession, self.literals(frame["profession"])),
+            (self.maya.isAlive, self.literals(frame["alive"])),
+            (self.maya.hasBirthStep, self.literals(-1 - frame["age"].astype(int))),
+            (self.maya.hasFamily, node("family", frame["fam_id"])),
+        ]
+        lines = [winik + f" {predicate.n3()} " + objects + " .\n" for predicate, objects in columns]
+        # Winiks that start out dead died before the first step
+        dead = ~frame["alive"].astype(bool)
+        death = self.literals(pd.Series(-1, index=frame.index[dead]))
+        lines.append(winik[dead] + f" {self.maya.hasDeathStep.n3()} " + death + " .\n")
+
+        # Partners are linked in both directions, like add_winiks does
+        partnered = frame["partner"].notna() & (frame["partner"] != 0)
+        partner = node("winik", frame.loc[partnered, "partner"].astype(int))
+        lines.append(winik[partnered] + f" {self.maya.hasPartner.n3()} " + partner + " .\n")
+        lines.append(partner + f" {self.maya.hasPartner.n3()} " + winik[partnered] + " .\n")
+        return "".join("".join(column) for column in lines)
+
+    @staticmethod
+    def literals(values: pd.Series) -> pd.Series:
+        """
+        Writes a column as N-Triples literals with the datatype that rdflib.Literal would give
+        each value.
+
+        :param values: The column
+        :return: The literals
+        """
+        if pd.api.types.is_bool_dtype(values):
+            return values.map({True: '"true"', False: '"false"'}) + f"^^{rdflib.XSD.boolean.n3()}"
+        if pd.api.types.is_integer_dtype(values):
+            return '"' + values.astype(str) + f'"^^{rdflib.XSD.integer.n3()}'
+        if pd.api.types.is_float_dtype(values):
+            return values.map(lambda value: rdflib.Literal(float(value)).n3())
+        text = values.astype(str).str.replace("\\", "\\\\", regex=False).str.replace('"', '\\"', regex=False) \
+            .str.replace("\n", "\\n", regex=False).str.replace("\r", "\\r", regex=False)
+        return '"' + text + '"'
+
     def create_resource(self, name: str, quantity: int) -> rdflib.URIRef:
         """
         Creates a resource node
@@ -102,7 +235,7 @@ class InitialGraph(BaseGraph):
 
         for family_id in self.get_all_families():
             for index, row in resource_frame.iterrows():
-                res_id = self.create_resource(row[0], row[1])
+                res_id = self.create_resource(row.iloc[0], row.iloc[1])
                 self.database.add((family_id, self.maya.hasResource, res_id))
 
     def get_all_families(self,):
@@ -0,0 +1,394 @@
+import json
+import logging
+import threading
+import time
+import rdflib
+from rdflib.plugins.sparql import prepareQuery, prepareUpdate
+from rdflib.plugins.sparql.algebra import traverse
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.stores.memory import Memory
+
+from .NTriples import NTriples
+from .OntologyCache import ontology_cache
+
+
+class InferenceStore(Memory):
+    """
+    An in-memory rdflib store that materializes rdf:type statements for superclasses, the
+    way GraphDB's RDFS ruleset does. Without it, queries that match on fh:Person would
+    miss every winik, since they are only typed as fh:Person_Male or fh:Person_Female.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.superclasses = {}
+        # While it's a list, every change to the store is recorded in it so that it can be undone
+        self.journal = None
+
+    def add(self, triple, context, quoted=False) -> None:
+        self.add_triple(triple, context, quoted)
+        subject, predicate, obj = triple
+        if predicate == rdflib.RDF.type:
+            for superclass in self.superclasses.get(obj, ()):
+                self.add_triple((subject, predicate, superclass), context, quoted)
+
+    def add_triple(self, triple, context, quoted=False) -> None:
+        """
+        Adds a single triple, recording it in the journal when it's new.
+
+        :param triple: The (subject, predicate, object) triple
+        :param context: The graph that the triple is added to
+        :param quoted: Whether the triple is quoted
+        :return: None
+        """
+        if self.journal is not None and next(super().triples(triple, context), None) is None:
+            self.journal.append((True, triple, context))
+        super().add(triple, context, quoted)
+
+    def remove(self, triple_pattern, context=None) -> None:
+        if self.journal is not None:
+            removed = [triple for triple, _ in super().triples(triple_pattern, context)]
+            self.journal.extend((False, triple, context) for triple in removed)
+        super().remove(triple_pattern, context)
+
+    def rollback(self) -> None:
+        """
+        Undoes every change in the journal, newest first.
+
+        :return: None
+        """
+        journal, self.journal = self.journal or [], None
+        for added, triple, context in reversed(journal):
+            if added:
+                super().remove(triple, context)
+            else:
+                super().add(triple, context)
+
+
+class LocalQuery:
+    """
+    An in-process replacement for Query that keeps the graph in an rdflib store. It
+    honours the same get/post contract, so MayaGraph and Model can run without a
+    GraphDB server.
+    """
+    # The base that GraphDB uses for relative identifiers in imported snippets
+    base = "file:/snippet/generated/"
+    # The prefixes that GraphDB declares for every query
+    namespaces = {"rdf": rdflib.RDF, "rdfs": rdflib.RDFS, "owl": rdflib.OWL, "xsd": rdflib.XSD}
+    # rdflib's SPARQL parser keeps global state and isn't safe to use from several threads
+    # at once, so every store shares one lock
+    lock = threading.RLock()
+
+    def __init__(self, path=None, endpoint="local", cache=None):
+        """
+        Creates a new local store
+
+        :param path: An optional path to a turtle file (ie scripts/initial_state.ttl) to load
+        :param endpoint: A name for the store, used in place of the GraphDB endpoint
+        :param cache: An optional QueryCache. Results are reused until an update touches them
+        """
+        self.endpoint = endpoint
+        self.cache = cache
+        # Query templates that have already been parsed, keyed by their text
+        self.prepared = {}
+        # An optional Profiler that every query and update is reported to
+        self.profiler = None
+        self.store = InferenceStore()
+        self.database = rdflib.Graph(store=self.store)
+        if path:
+            self.load(path)
+
+    def load(self, path) -> None:
+        """
+        Loads a turtle file into the store. Relative identifiers are resolved against the
+        same base that GraphDB uses, so 'winik/1' becomes 'file:/snippet/generated/winik/1'.
+
+        :param path: The path to the turtle file
+        :return: None
+        """
+        logging.info(f"Loading {path} into the local store")
+        with open(path) as f:
+            data = f.read()
+        self.database.parse(data=f"@base <{self.base}> .\n{data}", format="turtle")
+        self.update_superclasses()
+        if self.cache is not None:
+            self.cache.clear()
+
+    def load_triples(self, lines: list) -> None:
+        """
+        Adds a chunk of N-Triples lines to the store. Relative identifiers are resolved
+        against the GraphDB base. The class hierarchy is only rebuilt when the chunk adds to
+        it, so chunks of instance data are inserted without rescanning the graph.
+
+        :param lines: The N-Triples lines
+        :return: None
+        """
+        data = f"@base <{self.base}> .\n" + "\n".join(line.rstrip("\n") for line in lines) + "\n"
+        start = time.perf_counter()
+        with self.lock:
+            classes = sum(1 for _ in self.database.triples((None, rdflib.RDFS.subClassOf, None)))
+            self.database.parse(data=data, format="turtle")
+            if sum(1 for _ in self.database.triples((None, rdflib.RDFS.subClassOf, None))) != classes:
+                self.update_superclasses()
+        if self.profiler is not None:
+            self.profiler.record_query("update", "LOAD", time.perf_counter() - start, len(data), 0)
+        if self.cache is not None:
+            self.cache.clear()
+
+    def load_ontology(self, path=None, cache=ontology_cache) -> None:
+        """
+        Adds an ontology to the store from the ontology cache, for instance data that was
+        written without it.
+
+        :param path: The path to the ontology. Defaults to the Family Health History ontology
+        :param cache: The OntologyCache that the ontology is read from
+        :return: None
+        """
+        with self.lock:
+            cache.load(self.database, path)
+            self.update_superclasses()
+        if self.cache is not None:
+            self.cache.clear()
+
+    def update_superclasses(self) -> None:
+        """
+        Rebuilds the class hierarchy that the store uses for type inference and
+        materializes the superclass types of every typed node already in the graph.
+
+        :return: None
+        """
+        superclasses = {}
+        for subclass in set(self.database.subjects(rdflib.RDFS.subClassOf, None)):
+            if isinstance(subclass, rdflib.BNode):
+                continue
+            parents = set(self.database.transitive_objects(subclass, rdflib.RDFS.subClassOf))
+            parents = {parent for parent in parents if isinstance(parent, rdflib.URIRef)}
+            parents.discard(subclass)
+            if parents:
+                superclasses[subclass] = parents
+        self.store.superclasses = superclasses
+
+        typed = [(subject, obj) for subject, obj in self.database.subject_objects(rdflib.RDF.type)
+                 if obj in superclasses]
+        for subject, obj in typed:
+            for superclass in superclasses[obj]:
+                self.database.add((subject, rdflib.RDF.type, superclass))
+
+    def get(self, query: str) -> dict:
+        """
+        Runs a SPARQL query against the store.
+
+        :param query: The SPARQL query
+        :return: The results in the SPARQL 1.1 JSON results format
+        """
+        if self.cache is not None:
+            cached = self.cache.get(query)
+            if cached is not None:
+                return cached
+        logging.debug("Sending local SPARQL query")
+        start = time.perf_counter()
+        with self.lock:
+            results = self.to_results(self.database.query(query, initNs=self.namespaces))
+        logging.debug("Retrieved local SPARQL query")
+        self.report("read", query, start, results)
+        if self.cache is not None:
+            self.cache.put(query, results)
+        return results
+
+    def get_prepared(self, template, bindings: dict) -> dict:
+        """
+        Runs a query template. The template is parsed the first time it's used and its
+        parameters are bound to the parsed query on every call after that.
+
+        :param template: The QueryTemplate
+        :param bindings: A dictionary of parameter name to value
+        :return: The results in the SPARQL 1.1 JSON results format
+        """
+        key = None
+        if self.cache is not None:
+            key = template.render(bindings)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        start = time.perf_counter()
+        with self.lock:
+            if template.text not in self.prepared:
+                self.prepared[template.text] = prepareQuery(template.text, initNs=self.namespaces)
+            results = self.to_results(self.database.query(self.prepared[template.text],
+                                                          initBindings=template.bindings(bindings)))
+        self.report("read", template.text, start, results)
+        if key is not None:
+            self.cache.put(key, results)
+        return results
+
+    def get_batch(self, template, rows: list) -> dict:
+        """
+        Runs a query template for several sets of parameters and combines the results.
+
+        :param template: The QueryTemplate
+        :param rows: A list of dictionaries of parameter values
+        :return: The results in the SPARQL 1.1 JSON results format
+        """
+        variables = []
+        bindings = []
+        for row in rows:
+            results = self.get_prepared(template, row)
+            variables = results["head"]["vars"]
+            bindings.extend(results["results"]["bindings"])
+        return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+    def to_results(self, result) -> dict:
+        """
+        Converts an rdflib query result into the SPARQL 1.1 JSON results format.
+
+        :param result: The rdflib result
+        :return: The results as a dictionary
+        """
+        if result.type == "ASK":
+            return {"head": {}, "boolean": result.askAnswer}
+        variables = [str(var) for var in result.vars]
+        bindings = []
+        for row in result:
+            binding = {}
+            for var, term in zip(variables, row):
+                if term is not None:
+                    binding[var] = self.to_json(term)
+            bindings.append(binding)
+        return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+    def post(self, query: str) -> None:
+        """
+        Runs a SPARQL update against the store.
+
+        :param query: The SPARQL update
+        :return: None
+        """
+        logging.debug("Sending local SPARQL update")
+        start = time.perf_counter()
+        with self.lock:
+            self.database.update(self.prepare(query))
+        self.report("update", query, start)
+        if self.cache is not None:
+            self.cache.invalidate(query)
+        logging.debug("Retrieved local SPARQL update")
+
+    def post_many(self, updates: list) -> None:
+        """
+        Runs a list of updates against the store as one transaction. Every update is parsed
+        before any of them run, and the changes are rolled back if one of them fails, so the
+        store is never left half-updated.
+
+        :param updates: The SPARQL updates, in the order they should run
+        :return: None
+        """
+        logging.debug(f"Sending {len(updates)} local SPARQL updates")
+        start = time.perf_counter()
+        with self.lock:
+            prepared = [self.prepare(update) for update in updates]
+            self.store.journal = []
+            try:
+                for update in prepared:
+                    self.database.update(update)
+            except Exception:
+                self.store.rollback()
+                raise
+            finally:
+                self.store.journal = None
+        for update in updates:
+            self.report("update", update, start)
+            start = None
+        if self.cache is not None:
+            for update in updates:
+                self.cache.invalidate(update)
+        logging.debug("Retrieved local SPARQL updates")
+
+    def report(self, kind: str, query: str, start, results=None) -> None:
+        """
+        Reports a query or update to the profiler, if there is one. The sizes are those of
+        the SPARQL text and of the JSON results that GraphDB would have sent back.
+
+        :param kind: Either 'read' or 'update'
+        :param query: The SPARQL text
+        :param start: The time.perf_counter() reading from when the request started. It's
+                      None for requests whose time was already reported with another one
+        :param results: The query's results
+        :return: None
+        """
+        if self.profiler is None:
+            return
+        seconds = time.perf_counter() - start if start is not None else 0.0
+        rows = len(results["results"]["bindings"]) if results and "results" in results else 0
+        received = len(json.dumps(results)) if results is not None else 0
+        self.profiler.record_query(kind, query, seconds, len(query.encode()), received, rows)
+
+    def save(self, path) -> None:
+        """
+        Writes the contents of the store to disk as turtle
+
+        :param path: The path on disk where the graph is written to
+        :return: None
+        """
+        with self.lock:
+            self.database.serialize(path, format="turtle")
+
+    def export(self, f) -> None:
+        """
+        Writes the contents of the store as turtle into a file.
+
+        :param f: A file opened for writing bytes (ie from open(path, "wb") or gzip.open)
+        :return: None
+        """
+        with self.lock:
+            self.database.serialize(f, format="turtle")
+
+    def triples(self):
+        """
+        Streams the contents of the store as N-Triples.
+
+        :return: A generator of N-Triples lines
+        """
+        for triple in self.database:
+            yield NTriples.line(triple).rstrip("\n")
+
+    def prepare(self, update: str):
+        """
+        Parses an update. rdflib only plans lazy joins for queries, so the joins in an
+        update's WHERE clause are marked lazy here. Without it a VALUES block is joined
+        against a scan of the whole graph instead of binding the patterns that follow it.
+
+        :param update: The SPARQL update
+        :return: The parsed update
+        """
+        prepared = prepareUpdate(update, initNs=self.namespaces)
+        for operation in prepared.algebra:
+            traverse(operation, visitPost=LocalQuery.mark_lazy)
+        return prepared
+
+    @staticmethod
+    def mark_lazy(node) -> None:
+        """
+        Marks a join in a parsed update as lazy.
+
+        :param node: A node of the update's algebra
+        :return: None
+        """
+        if isinstance(node, CompValue) and node.name == "Join":
+            node["lazy"] = True
+
+    @staticmethod
+    def to_json(term) -> dict:
+        """
+        Converts an rdflib term into a SPARQL JSON results binding.
+
+        :param term: The rdflib term
+        :return: A dictionary with the type and value of the term
+        """
+        if isinstance(term, rdflib.URIRef):
+            return {"type": "uri", "value": str(term)}
+        if isinstance(term, rdflib.BNode):
+            return {"type": "bnode", "value": str(term)}
+        binding = {"type": "literal", "value": str(term)}
+        if term.language:
+            binding["xml:lang"] = term.language
+        elif term.datatype:
+            binding["datatype"] = str(term.datatype)
+        return binding
@@ -1,14 +1,152 @@
 import logging
-import requests
+import re
+import threading
+from contextlib import contextmanager
 from .BaseGraph import BaseGraph
+from .BulkLoader import BulkLoader
 from .Query import Query
+from .QueryTemplate import QueryTemplate
+from .StepState import StepState
+from .WriteBuffer import WriteBuffer
 
 
 class MayaGraph(BaseGraph):
-    def __init__(self, endpoint, username, password):
-        self.query = Query(endpoint, username, password)
+    def __init__(self, endpoint=None, username=None, password=None, query=None):
+        """
+        Creates a graph that's backed by either a GraphDB repository or a local store
+
+        :param endpoint: The GraphDB repository endpoint
+        :param username: The GraphDB username
+        :param password: The GraphDB password
+        :param query: An optional store backend (ie a LocalQuery) that's used instead of GraphDB
+        """
+        if query is None:
+            query = Query(endpoint, username, password)
+        self.query = query
+        # Writes made during a step are held here until the step is flushed
+        self.step_writes = WriteBuffer()
+        # Threads that are capturing their writes keep their own buffer here
+        self.local = threading.local()
+        # Whether the identity manager has read the highest identifiers in the store
+        self.ids_started = False
+        # The step that ages are worked out at. Winiks store the step they were born at
+        # (maya:hasBirthStep) instead of an age that has to be rewritten every day
+        self.step = 0
+        # Whether the graph's stored ages have been converted to birth steps
+        self.birth_steps = False
+        # Guards the one-off conversions and reads that the first step does
+        self.migration_lock = threading.Lock()
         super().__init__()
 
+    def set_step(self, step: int) -> None:
+        """
+        Sets the step that ages are worked out at.
+
+        :param step: The current step
+        :return: None
+        """
+        self.step = step
+        self.ensure_birth_steps()
+
+    def ensure_birth_steps(self) -> None:
+        """
+        Converts the maya:hasAge values of a graph that was written before winiks had birth
+        steps (ie scripts/initial_state.ttl). The stored ages are the ages at the end of the
+        previous step, so a winik of age A has a birth step of step - 1 - A. Winiks that are
+        already dead stopped aging at that point, so they're given it as their death step.
+        The conversion is sent straight away instead of being buffered, since the step's
+        reads depend on it.
+
+        :return: None
+        """
+        if self.birth_steps:
+            return
+        with self.migration_lock:
+            if self.birth_steps:
+                return
+            results = self.query.get("""
+                PREFIX maya: <https://maya.com#>
+                ASK { ?winik maya:hasAge ?age . }
+            """)
+            if results.get("boolean"):
+                logging.info(f"Converting the stored ages to birth steps at step {self.step}")
+                deaths = QueryTemplate("""
+                    PREFIX maya: <https://maya.com#>
+                    INSERT {
+                        ?winik maya:hasDeathStep ?death .
+                    } WHERE {
+                        ?winik maya:hasAge ?age .
+                        ?winik maya:isAlive ?alive .
+                        FILTER(?alive = False)
+                        FILTER NOT EXISTS { ?winik maya:hasDeathStep ?existing }
+                        BIND(?step - 1 AS ?death)
+                    }
+                """, ["step"])
+                births = QueryTemplate("""
+                    PREFIX maya: <https://maya.com#>
+                    DELETE {
+                        ?winik maya:hasAge ?age .
+                    } INSERT {
+                        ?winik maya:hasBirthStep ?birth .
+                    } WHERE {
+                        ?winik maya:hasAge ?age .
+                        BIND(?step - 1 - ?age AS ?birth)
+                    }
+                """, ["step"])
+                self.query.post_many([deaths.render({"step": self.step}), births.render({"step": self.step})])
+            self.birth_steps = True
+
+    @property
+    def writes(self) -> WriteBuffer:
+        """
+        The buffer that writes go to. It's the step's buffer unless the current thread is
+        capturing its writes.
+        """
+        captured = getattr(self.local, "writes", None)
+        return captured if captured is not None else self.step_writes
+
+    @property
+    def capturing(self) -> bool:
+        """
+        Whether the current thread is capturing its writes.
+        """
+        return getattr(self.local, "writes", None) is not None
+
+    @contextmanager
+    def capture(self):
+        """
+        Sends the current thread's writes to a buffer of their own, so that several threads
+        can write at the same time and their writes can be merged in a fixed order.
+
+        :return: The thread's WriteBuffer
+        """
+        buffer = WriteBuffer()
+        self.local.writes = buffer
+        try:
+            yield buffer
+        finally:
+            self.local.writes = None
+
+    def flush(self) -> None:
+        """
+        Sends every buffered write to the graph as a single update, which the database
+        runs as one transaction.
+
+        :return: None
+        """
+        if len(self.writes):
+            logging.debug(f"Flushing {len(self.writes)} buffered writes")
+            self.query.post_many(self.writes.to_updates())
+        self.writes.clear()
+
+    def discard(self) -> None:
+        """
+        Drops every buffered write without sending it to the graph.
+
+        :return: None
+        """
+        self.writes.clear()
+
     def get_all_families(self):
         query = """
         PREFIX maya: <https://maya.com#>
@@ -22,6 +160,22 @@ class MayaGraph(BaseGraph):
         for result in results["results"]["bindings"]:
             yield result["family_id"]["value"]
 
+    def get_living_families(self) -> list:
+        """
+        Gets the families that have at least one living winik.
+        :return: A list of family identifiers, ordered by identifier
+        """
+        query = """
+                PREFIX maya: <https://maya.com#>
+                SELECT DISTINCT ?family WHERE {
+                    ?winik maya:hasFamily ?family .
+                    ?winik maya:isAlive ?is_alive .
+                    FILTER(?is_alive = True)
+                } ORDER BY ?family
+        """
+        results = self.query.get(query)
+        return [result["family"]["value"] for result in results["results"]["bindings"]]
+
     def get_living_winiks(self):
         query = """
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -45,16 +199,18 @@ class MayaGraph(BaseGraph):
         :param property: The property being checked (ie fh:hasHealth)
         :return:
         """
-        query = """
+        if not re.match(r"^\w+:\w+$", property):
+            raise ValueError(f"'{property}' isn't a prefixed property name")
+        query = QueryTemplate("""
                 PREFIX maya: <https://maya.com#>
                 PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                SELECT * WHERE {
-                    <"""+winik_id+"""> """+property+""" ?val.
+                SELECT ?val WHERE {
+                    ?winik """+property+""" ?val.
                 }
-        """
+        """, ["winik"])
         # ?winik maya:isAlive ?is_alive.
         #
-        results = self.query.get(query)
+        results = self.query.get_prepared(query, {"winik": winik_id})
 
         for result in results["results"]["bindings"]:
             yield result["val"]["value"]
@@ -93,63 +249,144 @@ class MayaGraph(BaseGraph):
         Gets all of the winiks that are alive and their age.
         :return: A tuple of values, (winik ID, health)
         """
-        query = """
+        self.ensure_birth_steps()
+        query = QueryTemplate("""
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
                 PREFIX maya: <https://maya.com#>
                 PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
                 SELECT ?winik ?age WHERE {
                     ?winik rdf:type fh:Person.
                     ?winik maya:isAlive ?is_alive.
-                    ?winik maya:hasAge ?age.
+                    ?winik maya:hasBirthStep ?birth.
                     FILTER(?is_alive = True).
+                    BIND(?step - ?birth AS ?age)
+                }
+        """, ["step"])
+        results = self.query.get_prepared(query, {"step": self.step})
+        for result in results["results"]["bindings"]:
+            yield (result["winik"]["value"], result["age"]["value"])
+
+    def get_winik_records(self):
+        """
+        Gets the state of every winik, living or dead, in a single query.
+        :return: Tuples of (winik ID, age, gender, health, alive, profession, family, partner, mother,
+                 last name). The health, partner and mother are None when the winik doesn't have one.
+        """
+        self.ensure_birth_steps()
+        # Dead winiks stopped aging at the step they died
+        query = QueryTemplate("""
+                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                PREFIX maya: <https://maya.com#>
+                PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
+                SELECT ?winik ?age ?gender ?health ?alive ?profession ?family ?partner ?mother ?last_name WHERE {
+                    ?winik rdf:type fh:Person.
+                    ?winik maya:hasBirthStep ?birth.
+                    ?winik maya:hasGender ?gender.
+                    ?winik maya:isAlive ?alive.
+                    ?winik maya:hasProfession ?profession.
+                    ?winik maya:hasFamily ?family.
+                    ?winik maya:hasLastName ?last_name.
+                    OPTIONAL { ?winik maya:hasHealth ?health. }
+                    OPTIONAL { ?winik maya:hasPartner ?partner. }
+                    OPTIONAL { ?winik maya:hasMother ?mother. }
+                    OPTIONAL { ?winik maya:hasDeathStep ?death. }
+                    BIND(COALESCE(?death, ?step) - ?birth AS ?age)
+                }
+        """, ["step"])
+        results = self.query.get_prepared(query, {"step": self.step})
+        for result in results["results"]["bindings"]:
+            yield (result["winik"]["value"], int(result["age"]["value"]), result["gender"]["value"],
+                   float(result["health"]["value"]) if "health" in result else None,
+                   result["alive"]["value"] == "true", result["profession"]["value"], result["family"]["value"],
+                   result["partner"]["value"] if "partner" in result else None,
+                   result["mother"]["value"] if "mother" in result else None,
+                   result["last_name"]["value"])
+
+    def get_resource_records(self):
+        """
+        Gets the resources of every family in a single query.
+        :return: Tuples of (family ID, resource ID, resource name, quantity)
+        """
+        query = """
+                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                PREFIX maya: <https://maya.com#>
+                SELECT ?family ?resource ?name ?quantity WHERE {
+                    ?family rdf:type maya:Family.
+                    ?family maya:hasResource ?resource.
+                    ?resource maya:hasName ?name.
+                    ?resource maya:hasQuantity ?quantity.
                 }
         """
         results = self.query.get(query)
         for result in results["results"]["bindings"]:
-            yield (result["winik"]["value"], result["age"]["value"])
+            yield (result["family"]["value"], result["resource"]["value"], result["name"]["value"],
+                   int(float(result["quantity"]["value"])))
+
+    def get_emergency_records(self):
+        """
+        Gets the calorie emergency of every family in a single query.
+        :return: Tuples of (family ID, emergency ID, is active, start date)
+        """
+        query = """
+                PREFIX maya: <https://maya.com#>
+                SELECT ?family ?emergency ?is_active ?start_date WHERE {
+                    ?family maya:hasCalorieEmergency ?emergency .
+                    ?emergency maya:isActive ?is_active .
+                    ?emergency maya:hasStartDate ?start_date .
+                }
+        """
+        results = self.query.get(query)
+        for result in results["results"]["bindings"]:
+            yield (result["family"]["value"], result["emergency"]["value"], result["is_active"]["value"],
+                   result["start_date"]["value"])
+
+    def get_step_state(self) -> StepState:
+        """
+        Takes a snapshot of the living winiks, resources and calorie emergencies of every
+        family with three bulk queries.
+        :return: The snapshot
+        """
+        logging.debug("=== Getting Step State Queries ===")
+        return StepState(self.get_winik_records(), self.get_resource_records(), self.get_emergency_records())
 
     def get_partnerable_winiks(self) -> tuple:
         """
-        Gets all of the male and female winiks that can be partnered.
+        Gets all of the living male and female winiks that can be partnered.
         The conditions are:
             1. The winiks need to be more than 5844 days old
             2. The winiks need to be single
-            3. The winiks cannot come from the same family
-            4. The winiks need to be within 1460 days old of each other
-        :return: A tuple of winiks that can be paired
+        The remaining conditions (different families and an age gap under 1460 days) depend on
+        both winiks, so they're checked by the PartnerMatcher instead of a male x female join.
+        :return: A tuple of (males, females). Each is a list of (winik ID, age, family ID) tuples
         """
-        query = """
+        self.ensure_birth_steps()
+        query = QueryTemplate("""
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
                 PREFIX maya: <https://maya.com#>
                 PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                SELECT DISTINCT ?winik_male ?male_age ?male_family ?winik_female ?female_age ?female_family WHERE {
-                    ?winik_male rdf:type fh:Person_Male.
-                    ?winik_male maya:hasAge ?male_age.
-                    ?winik_male maya:hasFamily ?male_family.
-                    ?winik_female rdf:type fh:Person_Female.
-                    ?winik_female maya:hasAge ?female_age.
-                    ?winik_female maya:hasFamily ?female_family.
-                    BIND( EXISTS { ?winik_male maya:hasPartner ?male_partner } as ?male_partnered )
-                    BIND( EXISTS { ?winik_female maya:hasPartner ?female_partner } as ?female_partnered )
-                    FILTER(?male_age > 5844)
-                    FILTER(?female_age > 5844)
-                    FILTER(?male_partnered = False)
-                    FILTER(?female_partnered = False)
-                    FILTER(?female_family != ?male_family)
-                    BIND(ABS(?male_age - ?female_age) as ?age_gap)
-                    FILTER(?age_gap < 1460)
+                SELECT ?winik ?gender ?age ?family WHERE {
+                    ?winik rdf:type fh:Person.
+                    ?winik maya:hasGender ?gender.
+                    ?winik maya:hasBirthStep ?birth.
+                    ?winik maya:hasFamily ?family.
+                    ?winik maya:isAlive ?is_alive.
+                    FILTER(?is_alive = True)
+                    BIND(?step - ?birth AS ?age)
+                    FILTER(?age > 5844)
+                    FILTER NOT EXISTS { ?winik maya:hasPartner ?partner }
                 }
-        """
-        results = self.query.get(query)
-
+        """, ["step"])
+        logging.debug("=== Partnerable Winiks Query ===")
+        results = self.query.get_prepared(query, {"step": self.step})
+        males = []
+        females = []
         for result in results["results"]["bindings"]:
-            print(result)
-#            male_data.append([result["winik_male"]["value"], result["male_age"]["value"],
-#                             result["male_partnered"]["value"], result["male_last_name"]["value"]])
-#            female_data.append([result["winik_female"]["value"], result["female_age"]["value"],
-#                                result["female_partnered"]["value"], result["female_last_name"]["value"]])
-
-        return 1, 2
+            winik = (result["winik"]["value"], int(result["age"]["value"]), result["family"]["value"])
+            if result["gender"]["value"] == "F":
+                females.append(winik)
+            else:
+                males.append(winik)
+        return males, females
 
     def update_partner(self, winik, new_partner):
         """
@@ -166,18 +403,34 @@ class MayaGraph(BaseGraph):
         :return: None
         """
         logging.info(f"Saving graph to {path}")
-        headers = {
-            'Accept': 'text/turtle',
-        }
+        self.query.save(path)
 
-        params = (
-            ('infer', 'false'),
-            ('context', 'null'),
-            ('infer', 'true')
-        )
-        response = requests.get(f'{self.query.endpoint}/statements', headers=headers, params=params)
-        with open(path, "w") as f:
-            f.write(response.text)
+    def restore(self, path) -> None:
+        """
+        Replaces the contents of the graph with a snapshot
+
+        :param path: The snapshot (ie history/graph_10.ttl or history/graph_10.ttl.gz)
+        :return: None
+        """
+        logging.info(f"Restoring graph from {path}")
+        self.discard()
+        self.delete()
+        BulkLoader(self.query).load(path)
+        # The snapshot might have been written before winiks had birth steps
+        self.birth_steps = False
+        # The identity manager keeps its own counters if they're higher, so identifiers that
+        # were handed out after the snapshot aren't reused
+        self.ids_started = False
+
+    def record(self, history, step) -> None:
+        """
+        Records the graph in a keyframe/delta history
+        :param history: The HistoryWriter that the step is written to
+        :param step: The step being recorded
+        :return: None
+        """
+        logging.info(f"Recording step {step} in {history.directory}")
+        history.write(step, self.query.triples())
 
     def delete(self) -> None:
         """
@@ -194,23 +447,59 @@ class MayaGraph(BaseGraph):
         """
         self.query.post(query)
 
-    def get_winik_id(self) -> str:
+    def get_high_water(self) -> dict:
         """
-        Gets a new identifier for a winik
+        Gets the highest identifier of each kind of node (ie winik/321) that's in the graph.
 
-        :return: A new, unique identifier
+        :return: A dictionary of kind to the highest identifier
         """
         query = """
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-        SELECT (COUNT(?s) as ?total_count)
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+        SELECT ?kind (MAX(?number) AS ?high)
         WHERE
         {
-            ?s rdf:type fh:Person .
-        }
+            ?s rdf:type ?type .
+            BIND(STR(?s) AS ?iri)
+            FILTER(REGEX(?iri, "/(winik|resource|family|calorieEmergency)/[0-9]+$"))
+            BIND(REPLACE(?iri, "^.*/([A-Za-z]+)/[0-9]+$", "$1") AS ?kind)
+            BIND(xsd:integer(REPLACE(?iri, "^.*/", "")) AS ?number)
+        } GROUP BY ?kind
         """
+        logging.debug("=== Identifier High Water Query ===")
         results = self.query.get(query)
-        assert len(results["results"]["bindings"])
-        res = results["results"]["bindings"][0]
-        new_count = int(res["total_count"]["value"]) + 1
-        return f'file:/snippet/generated/{self.id_manager.get_graph_id("winik", new_count)}'
+        return {result["kind"]["value"]: int(result["high"]["value"])
+                for result in results["results"]["bindings"] if "high" in result}
+
+    def start_ids(self) -> None:
+        """
+        Moves the identity manager past the identifiers that are in the graph. It only reads
+        the graph the first time it's called (and again after a restore).
+
+        :return: None
+        """
+        if self.ids_started:
+            return
+        with self.migration_lock:
+            if not self.ids_started:
+                self.id_manager.start(self.get_high_water())
+                self.ids_started = True
+
+    def get_id(self, kind: str) -> str:
+        """
+        Gets a new identifier for a node. Identifiers come from the blocks that the identity
+        manager reserves, so this doesn't query the graph after the first call.
+
+        :param kind: The kind of node (winik, resource, family or calorieEmergency)
+        :return: A new, unique identifier
+        """
+        self.start_ids()
+        return f'file:/snippet/generated/{self.id_manager.get_id(kind)}'
+
+    def get_winik_id(self) -> str:
+        """
+        Gets a new identifier for a winik
+
+        :return: A new, unique identifier
+        """
+        return self.get_id("winik")
@@ -1,35 +1,231 @@
 from typing import List
-from random import randrange, randint
-import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import rdflib
 
+from villagepy.lib.EventScheduler import EventScheduler
 from villagepy.lib.MayaGraph import MayaGraph
+from villagepy.lib.PartnerMatcher import PartnerMatcher
+from villagepy.lib.Population import Population
+from villagepy.lib.QueryTemplate import QueryTemplate
+from villagepy.lib.RandomStreams import RandomStreams
+from villagepy.lib.SnapshotWriter import SnapshotWriter
 
 
 class Model:
-    def __init__(self, graph_endpoint, username, password):
-        self.graph = MayaGraph(graph_endpoint, username, password)
+    def __init__(self, graph_endpoint=None, username=None, password=None, query=None, seed=None,
+                 concurrency=1):
+        """
+        :param graph_endpoint: The GraphDB repository endpoint
+        :param username: The GraphDB username
+        :param password: The GraphDB password
+        :param query: An optional store backend (ie a LocalQuery) that's used instead of GraphDB
+        :param seed: The seed for the model's random draws
+        :param concurrency: The number of families that are processed at the same time. When
+                            it's above 1, the families read their own inputs instead of sharing
+                            one snapshot of the village, and their reads are sent concurrently
+        """
+        self.graph = MayaGraph(graph_endpoint, username, password, query=query)
+        self.concurrency = concurrency
+        # Every random draw in the model comes from here, keyed by subsystem, family and step
+        self.random = RandomStreams(seed)
+        # An optional Profiler that times each subsystem
+        self.profiler = None
+        # The snapshot that's being written in the background, if there is one
+        self.pending_snapshot = None
+        # An optional EventScheduler. When it's set, the threshold subsystems only run for
+        # the winiks and families that have an event due
+        self.scheduler = None
+
+    def attach_profiler(self, profiler) -> None:
+        """
+        Times the model's subsystems and counts the queries that each of them sends.
+
+        :param profiler: The Profiler, or None to stop profiling
+        :return: None
+        """
+        self.profiler = profiler
+        self.graph.query.profiler = profiler
+
+    def profile(self, subsystem: str):
+        """
+        Times a subsystem when the model is being profiled.
+
+        :param subsystem: The name of the subsystem (ie births)
+        :return: A context manager
+        """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.subsystem(subsystem)
+
+    def run(self, length: int, start=0, history=None, profiler=None, snapshots=None, checkpoint_interval=1,
+            scheduler=None):
+        """
+        Runs the model.
+
+        :param length: The step to stop at
+        :param start: The step to start at
+        :param history: An optional HistoryWriter. When it's given, each step is recorded as a
+                        delta instead of a full turtle file in history/
+        :param profiler: An optional Profiler. Each step's timings and query counts are
+                         reported to it, and it writes a summary when the run ends
+        :param snapshots: An optional SnapshotWriter. When it's given, the snapshots are written
+                          in the background while the next step runs
+        :param checkpoint_interval: The number of steps between snapshots
+        :param scheduler: An optional EventScheduler. When it's given, partnership, job changes,
+                          births and emergency expiry skip the days and entities that don't
+                          have anything due
+        :return: None
+        """
+        if profiler is not None:
+            self.attach_profiler(profiler)
+        if scheduler is not None:
+            self.scheduler = scheduler
+        try:
+            for step in range(start, length):
+                logging.info(f"Starting Step: {step}")
+                print(f"Starting Step: {step}")
+                if self.profiler is not None:
+                    self.profiler.start_step(step)
+                self.graph.set_step(step)
+                # Start by saving the previous step
+                with self.profile("save"):
+                    if history is not None:
+                        self.graph.record(history, step)
+                    elif (step - start) % checkpoint_interval == 0:
+                        if snapshots is not None:
+                            # The identifier counters are saved with the snapshot, so a run
+                            # resumed from it hands out the same identifiers as this one
+                            self.pending_snapshot = snapshots.submit(step, self.graph.query,
+                                                                     self.graph.id_manager.checkpoint())
+                        else:
+                            self.graph.save(f'history/graph_{step}.ttl')
+                self.run_step(step)
+                if self.profiler is not None:
+                    self.profiler.end_step()
+        finally:
+            self.wait_for_snapshot()
+        if self.profiler is not None:
+            self.profiler.finish()
+
+    def resume(self, directory="history") -> int:
+        """
+        Restores the graph from the latest complete snapshot, so that a run can carry on
+        with model.run(length, start=model.resume()).
+
+        :param directory: The directory holding the snapshots
+        :return: The step to start at, or 0 when there aren't any snapshots
+        """
+        latest = SnapshotWriter.latest(directory)
+        if latest is None:
+            logging.info(f"There aren't any snapshots in {directory}, starting from the current graph")
+            return 0
+        step, path = latest
+        self.graph.restore(path)
+        ids = SnapshotWriter.read_ids(directory, step)
+        if ids is not None:
+            # Carry on from the identifiers that the stopped run had handed out at the snapshot.
+            # Snapshots without them fall back to the highest identifiers in the graph
+            self.graph.id_manager.restore(ids)
+        if self.scheduler is not None:
+            self.scheduler.reset()
+        logging.info(f"Resuming from step {step}")
+        return step
+
+    def wait_for_snapshot(self) -> None:
+        """
+        Waits for the snapshot that's being written in the background to finish.
+
+        :return: None
+        """
+        if self.pending_snapshot is not None:
+            snapshot, self.pending_snapshot = self.pending_snapshot, None
+            snapshot.result()
+
+    def run_step(self, step: int) -> None:
+        """
+        Advances the village one step and writes the step's changes in one transaction.
 
-    def run(self, length: int, start=0):
+        :param step: The current step
+        :return: None
+        """
+        # Ages are worked out from each winik's birth step, so nothing is written to age them
+        # (besides converting the ages of a graph that was written before there were birth steps)
+        with self.profile("aging"):
+            self.graph.set_step(step)
+        try:
+            # The events that are due today. A scheduler that hasn't been seeded yet runs
+            # everything, and is seeded from the step's snapshot
+            due = None
+            if self.scheduler is not None and self.scheduler.seeded:
+                due = self.scheduler.pop(step)
+            # Pair up the single winiks
+            with self.profile("partnership"):
+                if due is None or "partnership" in due:
+                    self.partnership()
+            # Read everything that the subsystems need in a few bulk queries. The scheduler is
+            # seeded from the snapshot, so it's always taken when there's a scheduler
+            state = None
+            if self.concurrency == 1 or self.scheduler is not None:
+                with self.profile("snapshot"):
+                    state = self.graph.get_step_state()
+            if self.scheduler is not None and due is None:
+                self.scheduler.seed(state, step)
+                due = self.scheduler.pop(step)
+            # Handle the logic for each family unit
+            self.propagate_family(step, state, due)
+        except Exception:
+            # Don't leave half of the step in the buffer
+            self.graph.discard()
+            raise
+        # Write all of the step's changes in one transaction. The step only reads the graph
+        # until here, so a snapshot that's still being exported must finish first to show
+        # the graph as it was at the start of the step
+        with self.profile("save"):
+            self.wait_for_snapshot()
+        with self.profile("flush"):
+            self.graph.flush()
+
+    def run_vectorized(self, length: int, start=0, checkpoint_interval=30, seed=None):
+        """
+        Runs the model with the population held in NumPy arrays. Aging, calorie needs,
+        health loss, deaths and job changes happen in one pass over the whole village
+        each day, and the graph is only written to (and saved) at checkpoints.
+
+        :param length: The step to stop at
+        :param start: The step to start at
+        :param checkpoint_interval: The number of steps between writes to the graph
+        :param seed: The seed for the coast resource draws. Defaults to the model's seed
+        :return: The population, as it was at the end of the run
+        """
+        self.graph.set_step(start)
+        population = Population.from_graph(self.graph)
+        streams = self.random if seed is None else RandomStreams(seed)
         for step in range(start, length):
             logging.info(f"Starting Step: {step}")
-            print(f"Starting Step: {step}")
-            # Start by saving the previous step
-            self.graph.save(f'history/graph_{step}.ttl')
-            # Increase the age of all the living winiks by '1'
-            self.increase_winik_age()
-            # Handle the logic for each family unit
-            self.propagate_family(step)
+            if (step - start) % checkpoint_interval == 0:
+                population.write_back(self.graph)
+                self.graph.save(f'history/graph_{step}.ttl')
+            population.step(step, streams)
+        population.write_back(self.graph)
+        # Read the graph's ages as of the last step that ran, which is where the population is
+        self.graph.set_step(max(start, length) - 1)
+        return population
 
-
-    def propagate_family(self, step):
+    def propagate_family(self, step, state=None, due=None):
         """
         Advances the family one step in time.
 
+        :param step: The current step
+        :param state: A snapshot of the village from the start of the step
+        :param due: The events that are due from the EventScheduler, or None to run everything
         :return: None
         """
-        self.check_calorie_emergency(step)
-        self.daily_resource_adjustments(step)
+        with self.profile("emergencies"):
+            self.check_calorie_emergency(step, state=state,
+                                         families=None if due is None else due.get("emergency", {}))
+        self.daily_resource_adjustments(step, state, due)
 
     def partnership(self) -> None:
         """
@@ -38,109 +234,137 @@ class Model:
 
         :return: None
         """
-
         males, females = self.graph.get_partnerable_winiks()
         # Logic to figure out which winiks SHOULD be partnered
+        pairs = PartnerMatcher().match(males, females)
+        if pairs:
+            logging.info(f"Partnering {len(pairs)} pairs of winiks")
+        self.partner_all_winiks(pairs)
+        if self.scheduler is not None:
+            # The partners show up in the next step's snapshot, which is when they can have children
+            for bride, groom in pairs:
+                self.scheduler.schedule(self.graph.step + 1, "births", bride)
 
-        pairs = [(1,1)] # Should be a list of tuples (bride, groom) of the winiks that will be partnered
-        for bride, groom in pairs:
-            self.partner_winiks(bride, groom)
-
-    def increase_winik_age(self) -> None:
+    def partner_winiks(self, bride, groom):
         """
-        Increases the age of each winik that is alive by '1'.
+        Partners two winiks together.
 
+        :param bride: The female wink's identifier
+        :param groom: The male winik's identifier
         :return: None
         """
-        query = """
-            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            PREFIX maya: <https://maya.com#>
-            PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-            DELETE {
-                ?winik maya:hasAge ?age .
-            }
-            INSERT {
-                ?winik maya:hasAge ?new_age .
-            } WHERE {
-                ?winik rdf:type fh:Person.
-                ?winik maya:isAlive ?is_alive.
-                ?winik maya:hasAge ?age.
-                FILTER(?is_alive = True)
-                BIND(?age + 1 AS ?new_age)
-            }
-        """
-        logging.debug("=== Updating Winik Age Query ===")
-        self.graph.query.post(query)
+        self.partner_all_winiks([(bride, groom)])
 
-    def partner_winiks(self, bride, groom):
+    def partner_all_winiks(self, pairs) -> None:
         """
-        Partners two winiks together.
+        Partners a list of winiks together with a single insert.
 
-        :param bride: The female wink's identifier
-        :param groom: The male winik's identifier
+        :param pairs: A list of (bride, groom) tuples of winik identifiers
         :return: None
         """
-        query = """
-            PREFIX maya: <https://maya.com#>
-            INSERT {
-                ?bride maya:hasPartner ?groom.
-                ?groom maya:hasPartner ?bride.
-            }
-            WHERE {
-                BIND(<"""+bride+"""> as ?bride)
-                BIND(<"""+groom+"""> as ?groom)
-            }
+        for bride, groom in pairs:
+            self.graph.writes.insert(bride, "maya:hasPartner", rdflib.URIRef(groom))
+            self.graph.writes.insert(groom, "maya:hasPartner", rdflib.URIRef(bride))
+
+    def birth_pass(self, step, state=None, mothers=None) -> list:
         """
-        self.graph.query.post(query)
+        Runs the birth subsystem for the whole village at once. The mothers are found with
+        one scan of the state (or one query when there isn't a state), and all of their
+        children are created with a single update.
 
-    def birth_subsystem(self, family_id) -> None:
+        :param step: The current step, which keys the random draws for the children
+        :param state: A snapshot of the village. When it's given, the mothers are read from it
+        :param mothers: The identifiers of the winiks that are checked, when only some are due.
+                        Defaults to every living winik
+        :return: The identifiers of the children
         """
-        Logic for the birth system. When a female winik
+        if state is None:
+            births = self.get_eligible_mothers()
+        else:
+            if mothers is None:
+                winiks = [winik for family_id in state.families() for winik in state.living_winiks(family_id)]
+            else:
+                winiks = [state.index[winik_id] for winik_id in mothers if winik_id in state.index]
+            births = [(winik["id"], winik["partner"], winik["last_name"], winik["family"])
+                      for winik in winiks if self.can_have_child(winik, state, step)]
+        # The children's identifiers are handed out in this order, so both paths visit the
+        # mothers by family and then by winik, like the families are visited
+        births = sorted(births, key=lambda birth: (birth[3], birth[0]))
+        return self.create_children([(mother_id, father_id, last_name, family_id,
+                                      self.random.uuid("name", mother_id, step))
+                                     for mother_id, father_id, last_name, family_id in births], step)
+
+    def can_have_child(self, winik: dict, state, step) -> bool:
+        """
+        Checks whether a winik can have a child. A female winik has a child when she
             1. Is partnered
             2. Has less than 5 children
             3. Has not had a child in at least 365 days
-        she will have a new child.
-        :return:
-        """
-        query = """
+        When the model has an EventScheduler, a mother who's waiting for her youngest child
+        to stop being a newborn is scheduled for when that happens.
+
+        :param winik: The winik's dictionary from the state
+        :param state: A snapshot of the village
+        :param step: The current step
+        :return: Whether the winik has a child this step
+        """
+        if winik["gender"] != "F" or not winik["partner"]:
+            return False
+        child_ages = state.children.get(winik["id"], [])
+        newborns = [age for age in child_ages if age < 365]
+        if len(child_ages) < 5 and len(newborns) < 1:
+            return True
+        if self.scheduler is not None and len(child_ages) < 5:
+            # Check again once the youngest child isn't a newborn
+            self.scheduler.schedule(step + EventScheduler.newborn_age - min(newborns), "births", winik["id"])
+        return False
+
+    def get_eligible_mothers(self, family_id=None) -> list:
+        """
+        Finds the partnered female winiks that have fewer than 5 children and none that are
+        newborns, with one aggregate query.
+
+        :param family_id: The identifier of a family to look in. Defaults to the whole village
+        :return: A list of (mother, partner, last name, family) tuples
+        """
+        # A child is a newborn while it's under 365 days old; dead children stopped aging when
+        # they died
+        text = """
                 PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
                 PREFIX maya: <https://maya.com#>
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-				SELECT ?winik (COUNT(?child) AS ?child_total) (COUNT(?child_age_newborn) AS ?child_age_newborn_total) ?last_name ?partner WHERE {
-			    {
-        OPTIONAL {
-               		?child maya:hasMother ?winik .
-		   	        ?child maya:hasAge ?child_age .
-            		?child maya:hasAge ?child_age_newborn .
-		            FILTER (?child_age_newborn < 365)
-        		}
-    		}
-        		{
-        			SELECT ?winik ?age ?partner ?last_name WHERE {
-	                	?winik rdf:type fh:Person_Female.
-	                    ?winik maya:hasFamily <"""+family_id+"""> .
-    	                ?winik maya:hasAge ?age .
-        	            ?winik maya:hasPartner ?partner .
-            	        ?winik maya:hasLastName ?last_name .
-	
-					}
-				}
-			} GROUP BY ?winik ?last_name ?partner ?child_age_newborn
+                SELECT ?winik ?family (COUNT(DISTINCT ?child) AS ?child_total) (COUNT(DISTINCT ?newborn) AS ?child_age_newborn_total) ?last_name ?partner WHERE {
+                    ?winik rdf:type fh:Person_Female.
+                    ?winik maya:isAlive True .
+                    ?winik maya:hasFamily ?family .
+                    ?winik maya:hasBirthStep ?birth .
+                    ?winik maya:hasPartner ?partner .
+                    ?winik maya:hasLastName ?last_name .
+                    OPTIONAL { ?child maya:hasMother ?winik . }
+                    OPTIONAL {
+                        ?newborn maya:hasMother ?winik .
+                        ?newborn maya:hasBirthStep ?newborn_birth .
+                        OPTIONAL { ?newborn maya:hasDeathStep ?newborn_death . }
+                        FILTER (COALESCE(?newborn_death, ?step) - ?newborn_birth < 365)
+                    }
+                } GROUP BY ?winik ?family ?last_name ?partner
         """
         logging.debug("=== Birth Subsystem Query ===")
-        results = self.graph.query.get(query)
-
-        # For every winik that is able to have a child
+        self.graph.ensure_birth_steps()
+        if family_id is None:
+            results = self.graph.query.get_prepared(QueryTemplate(text, ["step"]), {"step": self.graph.step})
+        else:
+            results = self.graph.query.get_prepared(QueryTemplate(text, ["family", "step"]),
+                                                    {"family": family_id, "step": self.graph.step})
+        mothers = []
         for result in results["results"]["bindings"]:
             # Has under 5 children and less than 1 that are newborn
             if int(result["child_total"]["value"]) < 5 and int(result["child_age_newborn_total"]["value"]) < 1:
-                winik_id = str(result["winik"]["value"])
-                partner_id = str(result["partner"]["value"])
-                last_name = str(result["last_name"]["value"])
-                # Create the new winik
-                self.create_child(winik_id, partner_id, last_name, family_id, str(uuid.uuid4()))
+                mothers.append((str(result["winik"]["value"]), str(result["partner"]["value"]),
+                                str(result["last_name"]["value"]), family_id or str(result["family"]["value"])))
+        return mothers
 
-    def create_child(self, mother_id, father_id, last_name, family_id, first_name) -> str:
+    def create_child(self, mother_id, father_id, last_name, family_id, first_name, step=None) -> str:
         """
         Creates a winik that has parents.
 
@@ -148,223 +372,230 @@ class Model:
         :param father_id: The father's identifier
         :param last_name:
         :param  family_id:
-        :param gender:
-        :param profession:
+        :param first_name:
+        :param step: The current step, which keys the draw for the child's gender
         :return: The identifier of the child
         """
-        profession= "none"
-        gender_prob = randint(0, 1)
-        if gender_prob:
-            gender="F"
-        else:
-            gender="M"
-
-        new_winik_id = self.new_winik(gender, profession, last_name, family_id, first_name)
-        self.connect_child(mother_id, father_id, new_winik_id)
-        logging.info(f"Created a new winik with id: {new_winik_id}")
-        return new_winik_id
-
-    def new_winik(self, gender, profession, last_name, family_id, first_name) -> str:
-        """
-        Creates a new winik node
-
-        :return: The identifier of the new winik
-        """
-        if gender == "F":
-            gender_class = "fh:Person_Female"
-        else:
-            gender_class = "fh:Person_Male"
-        winik_identifier = self.graph.get_winik_id()
-        query = """
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        return self.create_children([(mother_id, father_id, last_name, family_id, first_name)], step)[0]
+
+    def create_children(self, births: list, step=None) -> list:
+        """
+        Creates children and links them to their parents with one update, no matter how
+        many there are.
+
+        :param births: A list of (mother, father, last name, family, first name) tuples
+        :param step: The current step, which keys the draws for the children's genders.
+                     Defaults to the graph's step
+        :return: The identifiers of the children, in the order of the births
+        """
+        if not births:
+            return []
+        day = self.graph.step if step is None else step
+        rows = []
+        for mother_id, father_id, last_name, family_id, first_name in births:
+            gender = "F" if self.random.integer("gender", mother_id, day, 0, 2) else "M"
+            rows.append({
+                "winik": self.graph.get_winik_id(),
+                "gender_class": self.graph.fh.Person_Female if gender == "F" else self.graph.fh.Person_Male,
+                "first_name": rdflib.Literal(first_name),
+                "family": family_id,
+                "last_name": rdflib.Literal(last_name),
+                "gender": rdflib.Literal(gender),
+                # Newborns are a day old in the step they're born in
+                "birth": rdflib.Literal(day - 1),
+                "mother": mother_id,
+                "father": father_id,
+            })
+        query = QueryTemplate("""
             PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
             PREFIX maya: <https://maya.com#>
             INSERT {
-                <"""+winik_identifier+"""> rdf:type """+gender_class+""" .
-                <"""+winik_identifier+"""> maya:hasFirstName '"""+first_name+"""' .
-                <"""+winik_identifier+"""> maya:hasFamily <"""+family_id+"""> .
-                <"""+winik_identifier+"""> maya:hasLastName '"""+last_name+"""' .
-                <"""+winik_identifier+"""> maya:hasGender '"""+gender+"""' .
-                <"""+winik_identifier+"""> maya:hasProfession '"""+profession+"""' .
-                <"""+winik_identifier+"""> maya:isAlive True .
-                <"""+winik_identifier+"""> maya:hasAge 1 .
+                ?winik rdf:type ?gender_class .
+                ?winik maya:hasFirstName ?first_name .
+                ?winik maya:hasFamily ?family .
+                ?winik maya:hasLastName ?last_name .
+                ?winik maya:hasGender ?gender .
+                ?winik maya:hasProfession "none" .
+                ?winik maya:isAlive True .
+                ?winik maya:hasBirthStep ?birth .
+                ?winik maya:hasMother ?mother .
+                ?winik maya:hasFather ?father .
+                ?mother maya:hasChild ?winik .
+                ?father maya:hasChild ?winik .
             }
             WHERE {}
+        """, ["winik", "gender_class", "first_name", "family", "last_name", "gender", "birth", "mother", "father"])
+        logging.debug("=== New Children Query ===")
+        self.graph.writes.update(query.render(rows))
+
+        children = [row["winik"] for row in rows]
+        for (mother_id, _, _, family_id, _), child_id in zip(births, children):
+            logging.info(f"Created a new winik with id: {child_id}")
+            if self.scheduler is not None:
+                # The child is born a day old, so its mother has a newborn for 364 more steps.
+                # The family's jobs are checked once the child is in the snapshot
+                self.scheduler.schedule(day + EventScheduler.newborn_age - 1, "births", mother_id)
+                self.scheduler.schedule_winik(child_id, family_id, 1, day)
+                self.scheduler.schedule(day + 1, "jobs", family_id)
+        return children
+
+    def daily_resource_adjustments(self, date, state=None, due=None):
         """
-        logging.debug("=== New Winik Query ===")
-        self.graph.query.post(query)
-        return winik_identifier
+        Adjusts the resources and handles consumption/production of them for each family.
 
-    def connect_child(self, mother_id, father_id, child_id) -> None:
+        :param date: The date
+        :param state: A snapshot of the village from the start of the step. When it isn't
+                      given, each family reads its own inputs from the graph
+        :param due: The events that are due from the EventScheduler, or None to check the jobs
+                    and births of everyone
+        :return:
         """
-        Connects parents to a child, and a child to both parents.
+        families = state.families() if state is not None else self.graph.get_living_families()
+        jobs = None if due is None else due.get("jobs", {})
+        with self.profile("resources"):
+            if state is None and self.concurrency > 1 and len(families) > 1:
+                # Without a snapshot every family waits on its own reads, so the families run in
+                # a pool and the step waits on the slowest family instead of on all of them. With
+                # a snapshot there's nothing to wait on and the threads would only contend for
+                # the GIL. Each family writes to its own buffer; the buffers are merged in family
+                # order so the step's writes are the same as when the families run one after another
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    buffers = list(executor.map(
+                        lambda family_id: self.capture_family(family_id, date, state,
+                                                              jobs is None or family_id in jobs),
+                        families))
+                for buffer in buffers:
+                    self.graph.writes.extend(buffer)
+            else:
+                for family_id in families:
+                    self.adjust_family(family_id, date, state, jobs is None or family_id in jobs)
 
-        :param mother_id: The identifier of the child's mother's node
-        :param father_id: The identifier of the child's father's node
-        :param child_id: The identifier of the child's node
-        :return: None
+        # Births take new winik identifiers, so they run in family order after the families
+        with self.profile("births"):
+            self.birth_pass(date, state, None if due is None else due.get("births", {}))
+
+    def capture_family(self, family_id, date, state, jobs=True):
         """
-        query = """
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-            PREFIX maya: <https://maya.com#>
-            INSERT {
-                ?mother_id maya:hasChild ?new_age .
-                ?father_id maya:hasChild ?new_age .
-                ?child_id maya:hasMother ?mother_id .
-                ?child_id maya:hasFather ?father_id .
-            } WHERE {
-                BIND(<"""+father_id+"""> AS ?father_id)
-                BIND(<"""+mother_id+"""> AS ?mother_id)
-                BIND(<"""+child_id+"""> AS ?child_id)
-            }
+        Runs adjust_family with the writes going to a buffer of their own.
+
+        :param family_id: The identifier of the family
+        :param date: The date
+        :param state: A snapshot of the village from the start of the step, or None to query
+        :param jobs: Whether the family's job changes are checked
+        :return: The WriteBuffer holding the family's writes
         """
-        logging.info("=== Connecting Child-Parent Query ===")
-        self.graph.query.post(query)
+        with self.graph.capture() as buffer:
+            self.adjust_family(family_id, date, state, jobs)
+        return buffer
 
-    def daily_resource_adjustments(self, date):
+    def adjust_family(self, family_id, date, state, jobs=True):
         """
-        Adjusts the resources and handles consumption/production of them for each family.
+        Handles the production and consumption of a family's resources, its calorie deficit or
+        surplus and its job changes. The families don't depend on each other, so this can run
+        for several families at once.
 
+        :param family_id: The identifier of the family
         :param date: The date
-        :return:
+        :param state: A snapshot of the village from the start of the step. When it's None the
+                      family's inputs are queried
+        :param jobs: Whether the family's job changes are checked
+        :return: None
         """
-        query = """
-                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX maya: <https://maya.com#>
-                PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                SELECT ?family (count(distinct ?farmer) as ?farmer_count)
-                               (count(distinct ?fisher) as ?fisher_count)
-                               (count(distinct ?forager) as ?forager_count)
-                WHERE {
-                    ?farmer rdf:type fh:Person.
-                    ?farmer maya:isAlive True.
-                    ?farmer maya:hasProfession "farmer".
-                    ?farmer maya:hasFamily ?family .
-    
-                    ?fisher rdf:type fh:Person.
-                    ?fisher maya:isAlive True.
-                    ?fisher maya:hasProfession "fisher".
-                    ?fisher maya:hasFamily ?family .
-    
-                    ?forager rdf:type fh:Person.
-                    ?forager maya:isAlive True.
-                    ?forager maya:hasProfession "forager".
-                    ?forager maya:hasFamily ?family
-                } GROUP BY ?family
-        """
-        logging.debug("=== Profession Counts Family Query ===")
-        results = self.graph.query.get(query)
-
+        if state is not None:
+            professions = [winik["profession"] for winik in state.living_winiks(family_id)]
+        else:
+            professions = [profession for _, _, _, profession in self.get_family_professions(family_id)]
         # Handle the family's logic
         # "Forager" jobs -> coast resources
         # "Fisher" jobs -> marine resources
         # "Farmer" jobs -> ag resources
-        for family in results["results"]["bindings"]:
-            family_id = family["family"]["value"]
-            new_garden_resources = int(family["farmer_count"]["value"]) * 9
-            new_coast_resources = int(family["forager_count"]["value"]) * randrange(1, 5)
-            new_marine_resources = int(family["fisher_count"]["value"]) * 9
-
-            # Get the total number of each resource that the family has access to.
-            # To do this, query the graph to get the totals left over from the previous
-            # day (which is the starting amount today) and then add the new counts to each.
-            resources = self.get_resources(family_id)
-            available_coast_resources = resources["coast"]["quantity"] + new_coast_resources
-            available_marine_resources = resources["marine"]["quantity"] + new_marine_resources
-            available_garden_resources = resources["garden"]["quantity"] + new_garden_resources
-            available_marine_b_resources = resources["marine-b"]["quantity"]
-            available_marine_c_resources = resources["marine-c"]["quantity"]
-
-            # The total number of calories available to the family
-            available_calories = 3000.0 * (available_marine_resources + available_marine_b_resources +
-                                           available_marine_c_resources) + 250.0 * available_garden_resources + \
-                                 10.0 * available_coast_resources
-
-            # How many calories does the family require?
-            family_required_calories = self.get_family_calories(family_id)
-            if available_calories - 100 * family_required_calories < 0:
-                # There's a deficit
-                logging.info(f"Calorie deficit for family {family_id}")
-                self.handle_calorie_deficit(family_id, available_calories, family_required_calories, date)
+        new_garden_resources = professions.count("farmer") * 9
+        new_coast_resources = professions.count("forager") * \
+            self.random.integer("coast", family_id, date, 1, 5)
+        new_marine_resources = professions.count("fisher") * 9
+
+        # Get the total number of each resource that the family has access to.
+        # To do this, query the graph to get the totals left over from the previous
+        # day (which is the starting amount today) and then add the new counts to each.
+        resources = self.get_resources(family_id, state)
+        available_coast_resources = resources["coast"]["quantity"] + new_coast_resources
+        available_marine_resources = resources["marine"]["quantity"] + new_marine_resources
+        available_garden_resources = resources["garden"]["quantity"] + new_garden_resources
+        available_marine_b_resources = resources["marine-b"]["quantity"]
+        available_marine_c_resources = resources["marine-c"]["quantity"]
+
+        # The total number of calories available to the family
+        available_calories = 3000.0 * (available_marine_resources + available_marine_b_resources +
+                                       available_marine_c_resources) + 250.0 * available_garden_resources + \
+                             10.0 * available_coast_resources
+
+        # How many calories does the family require?
+        family_required_calories = self.get_family_calories(family_id, state)
+        if available_calories - 100 * family_required_calories < 0:
+            # There's a deficit
+            logging.info(f"Calorie deficit for family {family_id}")
+            with self.profile("calories"):
+                self.handle_calorie_deficit(family_id, available_calories, family_required_calories, date,
+                                            state)
                 # Set the count of all the resources to 0 since they've been eaten
-                self.reset_resources(family_id)
-            else:
-                # There's a surplus of food
-                logging.info(f"Calorie surplus for family {family_id}")
-                # First, consume coast and ag calories
-                # temp_cals is the amount of calories required from fish
-                temp_cals = 100 * family_required_calories - 250 * available_garden_resources - \
-                            10 * available_coast_resources
-
-                # Now determine how many calories need to be contributed by fish
-                fish_newcals = 3000.0 * available_marine_resources
-                fish_bcals = 3000.0 * available_marine_b_resources
-                fish_ccals = 3000.0 * available_marine_c_resources
-                surplus_cals = temp_cals - fish_newcals
-
-                coast_id = str(resources["coast"]["id"])
-                garden_id = str(resources["garden"]["id"])
-                marine_id = str(resources["marine"]["id"])
-                marine_b_id = str(resources["marine-b"]["id"])
-                marine_c_id = str(resources["marine-c"]["id"])
-                coast_count = 0
-                garden_count = 0
+                self.reset_resources(family_id, state)
+        else:
+            # There's a surplus of food
+            logging.info(f"Calorie surplus for family {family_id}")
+            # First, consume coast and ag calories
+            # temp_cals is the amount of calories required from fish
+            temp_cals = 100 * family_required_calories - 250 * available_garden_resources - \
+                        10 * available_coast_resources
+
+            # Now determine how many calories need to be contributed by fish
+            fish_newcals = 3000.0 * available_marine_resources
+            fish_bcals = 3000.0 * available_marine_b_resources
+            fish_ccals = 3000.0 * available_marine_c_resources
+            surplus_cals = temp_cals - fish_newcals
+
+            coast_id = str(resources["coast"]["id"])
+            garden_id = str(resources["garden"]["id"])
+            marine_id = str(resources["marine"]["id"])
+            marine_b_id = str(resources["marine-b"]["id"])
+            marine_c_id = str(resources["marine-c"]["id"])
+            coast_count = 0
+            garden_count = 0
+            marine_count = 0
+            marine_b_count = 0
+            marine_c_count = 0
+            if surplus_cals > fish_bcals:
                 marine_count = 0
                 marine_b_count = 0
                 marine_c_count = 0
-                if surplus_cals > fish_bcals:
-                    marine_count = 0
-                    marine_b_count = 0
-                    marine_c_count = 0
-                elif surplus_cals > 0:
-                    marine_count = 0
-                    marine_b_count = 0
-                    marine_c_count = (fish_bcals - surplus_cals) / 3000.0
-                else:
-                    marine_count = 0
-                    marine_b_count = int(-surplus_cals / 3000.0)
-                    marine_c_count = int(fish_bcals / 3000.0)
+            elif surplus_cals > 0:
+                marine_count = 0
+                marine_b_count = 0
+                marine_c_count = (fish_bcals - surplus_cals) / 3000.0
+            else:
+                marine_count = 0
+                marine_b_count = int(-surplus_cals / 3000.0)
+                marine_c_count = int(fish_bcals / 3000.0)
 
-                query = """
-                    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                    PREFIX maya: <https://maya.com#>
-                    PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                    DELETE {
-                        ?marine_id maya:hasCount ?old_marine .
-                        ?marine_b_id maya:hasCount ?old_b .
-                        ?marine_c_id maya:hasCount ?old_c .
-                    }
-                    INSERT {
-                        ?marine_id maya:hasCount ?marine_count .
-                        ?marine_b_id maya:hasCount ?marine_b_count .
-                        ?marine_c_id maya:hasCount ?marine_c_count .
-                        ?garden_id maya:hasCount ?garden_count.
-                        ?coast_id maya:hasCount ?coast_count .
-                    } WHERE {
-                    BIND(<"""+marine_id+"""> AS ?marine)
-                    BIND(<"""+marine_b_id+"""> AS ?marine_b)
-                    BIND(<"""+marine_c_id+"""> AS ?marine_c)
-                    BIND(<"""+garden_id+"""> AS ?garden_id)
-                    BIND(<"""+coast_id+"""> AS ?coast_id)                    
-                    BIND("""+str(marine_count)+""" AS ?marine_count)
-                    BIND("""+str(marine_b_count)+""" AS ?marine_b_count)
-                    BIND("""+str(marine_c_count)+""" AS ?marine_c_count)
-                    BIND("""+str(garden_count)+""" AS ?garden_count)
-                    BIND("""+str(coast_count)+""" AS ?coast_count)
-                    }
-                """
-                logging.debug("=== Update Resources Query ===")
-                self.graph.query.post(query)
+            logging.debug("=== Update Resources Query ===")
+            self.graph.writes.set(marine_id, "maya:hasCount", marine_count)
+            self.graph.writes.set(marine_b_id, "maya:hasCount", marine_b_count)
+            self.graph.writes.set(marine_c_id, "maya:hasCount", marine_c_count)
+            self.graph.writes.set(garden_id, "maya:hasCount", garden_count)
+            self.graph.writes.set(coast_id, "maya:hasCount", coast_count)
 
+            with self.profile("calories"):
                 self.handle_calorie_surplus(family_id)
-
-            # Handle job changes
-            self.job_adjustments(family_id)
-            # Handle any births
-            self.birth_subsystem(family_id)
+            weak = state is not None and any(winik["health"] is not None and winik["health"] < 96
+                                             for winik in state.living_winiks(family_id))
+            if self.scheduler is not None and weak:
+                # handle_calorie_surplus writes to the professions of these winiks, which the
+                # next job check puts right
+                self.scheduler.schedule(date + 1, "jobs", family_id)
+
+        # Handle job changes
+        if jobs:
+            with self.profile("jobs"):
+                self.job_adjustments(family_id, state)
 
     def handle_calorie_surplus(self, family_id: str) -> None:
         """
@@ -373,7 +604,7 @@ class Model:
         :param family_id: The identifier of the family that has a surplus
         :return: None
         """
-        query = """
+        query = QueryTemplate("""
                     PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
                     PREFIX maya: <https://maya.com#>
                     PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
@@ -383,7 +614,6 @@ class Model:
                     INSERT {
                         ?winik maya:hasProfession ?new_health .
                     } WHERE {
-                        BIND(<"""+family_id+"""> AS ?family_id)
                         ?winik rdf:type fh:Person .
                         ?winik maya:isAlive ?is_alive .
                         ?winik maya:hasHealth ?health .
@@ -392,9 +622,9 @@ class Model:
                         FILTER(?health <96)
                         BIND(?health + 5 AS ?new_health)
                         
-                    }"""
+                    }""", ["family_id"])
         logging.debug("=== Add 5 to Family Health Query ===")
-        self.graph.query.post(query)
+        self.graph.writes.update(query.render({"family_id": family_id}))
 
 
 
@@ -428,49 +658,33 @@ class Model:
         :param count: The new amount of that resource
         :return: None
         """
-        delete_query = """
-            PREFIX maya: <https://maya.com#>
-            DELETE WHERE {
-                 <"""+resource_id+"""> maya:hasQuantity ?old_count .
-            }
-        """
-        logging.debug("=== Deleting Resource Query ==")
-        self.graph.query.post(delete_query)
-        query = """
-            PREFIX maya: <https://maya.com#>
-            INSERT {
-                ?resource maya:hasQuantity ?new_count .
-            }
-            WHERE {
-                BIND(<"""+resource_id+"""> as ?resource)
-                BIND("""+str(count)+""" as ?new_count)
-            }
-        """
         logging.debug("=== Updating Resources Query ===")
-        self.graph.query.post(query)
+        self.graph.writes.set(resource_id, "maya:hasQuantity", count)
 
-    def get_resources(self, family_id) -> dict:
+    def get_resources(self, family_id, state=None) -> dict:
         """
         Gets all of the resources nodes for a given family.
 
         :param family_id: The identifier of the family
+        :param state: A snapshot of the village. When it's given, the resources are read from it
         :return: A dictionary of values {resource name: count}
         """
-        query = """
+        if state is not None:
+            return state.resources.get(family_id, {})
+        query = QueryTemplate("""
         PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
         PREFIX maya: <https://maya.com#>
         PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
         SELECT ?resource_name ?resource ?quantity
         WHERE {
-            BIND (<"""+family_id+"""> as ?family)
             ?resource rdf:type maya:Resource.
             ?resource maya:hasName ?resource_name .
             ?family maya:hasResource ?resource .
             ?resource maya:hasQuantity ?quantity .
         }
-        """
+        """, ["family"])
         logging.debug("=== Getting Resources Query ===")
-        results = self.graph.query.get(query)
+        results = self.graph.query.get_prepared(query, {"family": family_id})
         resource_info = {}
         for result in results["results"]["bindings"]:
             resource_info[result["resource_name"]["value"]] = {}
@@ -478,32 +692,20 @@ class Model:
             resource_info[result["resource_name"]["value"]]["id"] = result["resource"]["value"]
         return resource_info
 
-    def get_family_calories(self, family_id):
+    def get_family_calories(self, family_id, state=None):
         """
         Gets the number of calories that a family needs for a particular day.
 
         :param family_id: The identifier of the family
+        :param state: A snapshot of the village. When it's given, the winiks are read from it
         :return: The number of calories this family requires
         """
-        query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX maya: <https://maya.com#>
-        PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-        SELECT ?age ?gender ?winik
-        WHERE {
-            BIND(<"""+family_id+"""> as ?family)
-            ?winik ?hasFamily ?family.
-            ?winik maya:isAlive True.
-            ?winik maya:hasAge ?age.
-            ?winik maya:hasGender ?gender.
-        }
-        """
-        logging.debug("=== Getting Family Calorie Requirements Query ===")
-        results = self.graph.query.get(query)
+        if state is not None:
+            winiks = [(winik["id"], winik["age"], winik["gender"]) for winik in state.living_winiks(family_id)]
+        else:
+            winiks = self.get_family_ages(family_id)
         calories = 0
-        for result in results["results"]["bindings"]:
-            age = int(result["age"]["value"])
-            gender = str(result["gender"]["value"])
+        for winik_id, age, gender in winiks:
             if 1825 >= age >= 730:
                 calories += 12
             elif 3285 >= age >= 2190:
@@ -527,11 +729,37 @@ class Model:
                 else:
                     calories += 27
             else:
-                logging.info(f'Failed to find a calorie requirement for winik {str(result["winik"]["value"])}, returning 0')
+                logging.info(f'Failed to find a calorie requirement for winik {winik_id}, returning 0')
                 calories += 0
 
         return calories
 
+    def get_family_ages(self, family_id):
+        """
+        Gets the age and gender of each living winik in a family.
+
+        :param family_id: The identifier of the family
+        :return: A list of tuples, (winik ID, age, gender)
+        """
+        query = QueryTemplate("""
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        PREFIX maya: <https://maya.com#>
+        PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
+        SELECT ?age ?gender ?winik
+        WHERE {
+            ?winik ?hasFamily ?family.
+            ?winik maya:isAlive True.
+            ?winik maya:hasBirthStep ?birth.
+            ?winik maya:hasGender ?gender.
+            BIND(?step - ?birth AS ?age)
+        }
+        """, ["family", "step"])
+        logging.debug("=== Getting Family Calorie Requirements Query ===")
+        self.graph.ensure_birth_steps()
+        results = self.graph.query.get_prepared(query, {"family": family_id, "step": self.graph.step})
+        return [(str(result["winik"]["value"]), int(result["age"]["value"]), str(result["gender"]["value"]))
+                for result in results["results"]["bindings"]]
+
     def update_value(self, subject, predicate, new_value):
         """
         Replaces a value with a new one
@@ -541,34 +769,15 @@ class Model:
         :param new_value:
         :return:
         """
-        delete_query = """
-            PREFIX maya: <https://maya.com#>
-            PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-            DELETE WHERE {
-                 <"""+subject+"""> """+predicate+"""?old_count .
-            }
-        """
-        self.graph.query.post(delete_query)
-
-        query = """
-            PREFIX maya: <https://maya.com#>
-            PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-            INSERT {
-                ?subject maya:hasQuantity ?new_value .
-            }
-            WHERE {
-                BIND(<"""+subject+"""> as ?subject)
-                BIND("""+str(new_value)+""" as ?new_value)
-            }
-        """
-        self.graph.query.post(query)
+        self.graph.writes.set(subject, predicate, new_value)
 
     def handle_calorie_deficit(self, family_id: str, available_calories: int,
-                               required_calories: int, date):
+                               required_calories: int, date, state=None):
         """
         Contains the logic for handling the event where a family doesn't have enough
         calories to feed all of the family members.
 
+        :param state: A snapshot of the village. When it's given, the winiks are read from it
         :return: None
         """
         # Calculate how many 'hitpoints' a the winiks lose
@@ -581,7 +790,7 @@ class Model:
         else:
             health_loss = 15
 
-        winiks = self.get_living_winiks_in_family(family_id)
+        winiks = self.get_living_winiks_in_family(family_id, state)
         for winik in winiks:
             if float(winik[1]) > 0:
                 new_health = float(winik[1]) - health_loss
@@ -591,49 +800,70 @@ class Model:
                 self.update_health(winik[0], new_health)
 
         # Determine if any of the winiks have a 'critical' health value, which is lower than 75.
-        health_critical = """
+        if state is not None:
+            critical_count = sum(1 for winik in state.living_winiks(family_id)
+                                 if winik["health"] is not None and 0 < winik["health"] < 75)
+        else:
+            critical_count = self.get_critical_count(family_id)
+
+        current_calorie_emergency = self.get_calorie_emergency(family_id, state)
+        res = current_calorie_emergency["results"]["bindings"]
+        if critical_count and not len(res):
+            # Then there are hungry winiks and there isn't an emergency; create one
+            self.create_calorie_emergency(True, date)
+            if self.scheduler is not None:
+                # An emergency changes the family's jobs, and has to be checked for expiry
+                self.scheduler.schedule(date + 1, "jobs", family_id)
+                self.scheduler.schedule(date + 1, "emergency", family_id)
+
+    def get_critical_count(self, family_id) -> int:
+        """
+        Counts the living winiks in a family whose health is critical (lower than 75).
+
+        :param family_id: The identifier of the family
+        :return: The number of winiks with critical health
+        """
+        health_critical = QueryTemplate("""
                 PREFIX maya: <https://maya.com#>
                 SELECT (count(?health) as ?hungry_winiks)
                 WHERE {
-                    ?winik maya:hasFamily <"""+family_id+""">.
+                    ?winik maya:hasFamily ?family.
                     ?winik maya:isAlive True.
                     ?winik maya:hasHealth ?health.
                     FILTER(?health < 75)
                     FILTER(?health > 0)
                 }
-        """
+        """, ["family"])
         logging.debug("=== Getting Winiks at Critical Health Query ===")
-        results = self.graph.query.get(health_critical)
+        results = self.graph.query.get_prepared(health_critical, {"family": family_id})
         res = results["results"]["bindings"]
         if len(res) == 0:
             critical_count = 0
         else:
-            critical_count = res[0]["hungry_winiks"]["value"]
-
-        current_calorie_emergency = self.get_calorie_emergency(family_id)
-        res = current_calorie_emergency["results"]["bindings"]
-        if critical_count and not len(res):
-            # Then there are hungry winiks and there isn't an emergency; create one
-            self.create_calorie_emergency(True, date)
+            critical_count = int(res[0]["hungry_winiks"]["value"])
+        return critical_count
 
-    def get_calorie_emergency(self, family_id):
+    def get_calorie_emergency(self, family_id, state=None):
         """
         Gets the current state of a calorie emergency for a family.
 
         :param family_id: The identifier of the family being checked
+        :param state: A snapshot of the village. When it's given, the emergency is read from it
         :return: Information about the emergency
         """
-        query = """
+        if state is not None:
+            return {"results": {"bindings": state.emergencies.get(family_id, [])}}
+        query = QueryTemplate("""
         PREFIX maya: <https://maya.com#>
         SELECT ?emergency ?is_active ?start_date
         WHERE {
-            <"""+family_id+"""> maya:hasCalorieEmergency ?emergency .
+            ?family maya:hasCalorieEmergency ?emergency .
             ?emergency maya:isActive ?is_active .
             ?emergency maya:hasStartDate ?start_date .
         }
-        """
+        """, ["family"])
         logging.debug("=== Getting Family Caloire Emergencies ===")
-        return self.graph.query.get(query)
+        return self.graph.query.get_prepared(query, {"family": family_id})
 
     def create_calorie_emergency(self, start, is_active=True) -> str:
         """
@@ -641,22 +871,37 @@ class Model:
 
         :param start: The start date for the emergency
         :param is_active: Whether the emergency is active
-        :return:
+        :return: The identifier of the emergency, or None when this thread is capturing its
+                 writes and the emergency is created when they're merged
+        """
+        if self.graph.capturing:
+            # Families that run at the same time would take identifiers in whichever order
+            # their threads got here, so the identifier is handed out when the family's
+            # writes are merged, in family order
+            self.graph.writes.defer(self.write_calorie_emergency)
+            return None
+        return self.write_calorie_emergency(self.graph.writes)
+
+    def write_calorie_emergency(self, writes) -> str:
+        """
+        Creates the node for a new calorie emergency.
+
+        :param writes: The WriteBuffer that the node is written to
+        :return: The identifier of the emergency
         """
-        emergency_id = self.graph.id_manager.get_id("calorieEmergency")
-        id = f"<file:/snippet/generated/{emergency_id}>"
-        query = """
+        id = f"<{self.graph.get_id('calorieEmergency')}>"
+        query = QueryTemplate("""
             PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
             PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
             PREFIX maya: <https://maya.com#>
             INSERT {
-                """+id+""" rdf:type maya:calorieEmergency .
-                """+id+""" maya:isActive True .
-                """+id+""" maya:start 1 .
+                ?emergency rdf:type maya:calorieEmergency .
+                ?emergency maya:isActive True .
+                ?emergency maya:start 1 .
             } WHERE {}
-        """
+        """, ["emergency"])
         logging.debug("=== Calorie Emergency Creation Query ===")
-        self.graph.query.post(query)
+        writes.update(query.render({"emergency": id}))
         return id
 
     def connect_calorie_emergency(self, family_id: str, calorie_emergency_id: str) -> None:
@@ -665,16 +910,16 @@ class Model:
 
         :return:
         """
-        query = """
+        query = QueryTemplate("""
             PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
             PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
             PREFIX maya: <https://maya.com#>
             INSERT {
-                """+family_id+""" maya:hasCalorieEmergency """+calorie_emergency_id+"""
+                ?family maya:hasCalorieEmergency ?emergency
             } WHERE {}
-        """
+        """, ["family", "emergency"])
         logging.debug("=== Connecting Calorie Emergency Query ===")
-        self.graph.query.post(query)
+        self.graph.writes.update(query.render({"family": family_id, "emergency": calorie_emergency_id}))
 
     def update_health(self, winik_id, new_health) -> None:
         """
@@ -685,127 +930,121 @@ class Model:
         :param new_health: The new health value
         :return: None
         """
-
-        delete_query = """
-            PREFIX maya: <https://maya.com#>
-            DELETE WHERE {
-                 <"""+winik_id+"""> maya:hasHealth ?health .
-            }
-        """
-        self.graph.query.post(delete_query)
-        query = """
-            PREFIX maya: <https://maya.com#>
-            INSERT {
-                <"""+winik_id+"""> maya:hasHealth ?new_health .
-            } WHERE {
-                BIND("""+str(new_health)+""" as ?new_health)
-            }
-        """
         logging.debug("=== Updating Winik Health Query ===")
-        self.graph.query.post(query)
+        self.graph.writes.set(winik_id, "maya:hasHealth", new_health)
 
-    def get_living_winiks_in_family(self, family_id) -> tuple:
+    def get_living_winiks_in_family(self, family_id, state=None) -> tuple:
         """
         Returns the identifier and health of each winik in a family
 
         :param family_id: The identifier of the family whose winiks are being retrieved
+        :param state: A snapshot of the village. When it's given, the winiks are read from it
         :return:
         """
-        query = """
+        if state is not None:
+            for winik in state.living_winiks(family_id):
+                if winik["health"] is not None:
+                    yield (winik["id"], winik["health"])
+            return
+
+        query = QueryTemplate("""
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
                 PREFIX maya: <https://maya.com#>
                 PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
                 SELECT ?winik ?health WHERE {
                     ?winik rdf:type fh:Person.
                     ?winik maya:isAlive ?is_alive.
-                    ?winik maya:hasFamily <"""+family_id+""">.
+                    ?winik maya:hasFamily ?family.
                     ?winik maya:hasHealth ?health.
                     FILTER(?is_alive = True).
                 }
-        """
+        """, ["family"])
         logging.debug("=== Getting Living Winiks in Family Query ===")
-        results = self.graph.query.get(query)
+        results = self.graph.query.get_prepared(query, {"family": family_id})
 
         for result in results["results"]["bindings"]:
             yield (result["winik"]["value"], result["health"]["value"])
 
     def kill_winik(self, winik_id):
         """
-        Kills a winik. Sets 'alive' to false and the health to 0
+        Kills a winik. Sets 'alive' to false, the health to 0 and the death step, which
+        stops the winik's age from going up
 
         :param winik_id: The winik's identifier
         :return: None
         """
-        query = """
-            PREFIX maya: <https://maya.com#>
-            DELETE WHERE {
-                <"""+winik_id+"""> maya:hasHealth ?health .
-                <"""+winik_id+"""> maya:isAlive ?alive.
-            }
-        """
-        logging.debug("=== Delete Killing Winik Query ==")
-        self.graph.query.post(query)
-
-        query = """
-            PREFIX maya: <https://maya.com#>
-            INSERT {
-                ?winik maya:hasHealth 0 .
-                ?winik maya:isAlive False .
-            }
-            WHERE {
-                BIND(<"""+winik_id+"""> as ?winik)
-            }
-        """
         logging.debug("=== Killing Winik Query ===")
-        self.graph.query.post(query)
+        self.graph.writes.set(winik_id, "maya:hasHealth", 0)
+        self.graph.writes.set(winik_id, "maya:isAlive", False)
+        self.graph.writes.set(winik_id, "maya:hasDeathStep", self.graph.step)
 
-    def reset_resources(self, family_id):
+    def reset_resources(self, family_id, state=None):
         """
         Sets the resource count to 0 for all resources in a particular family.
 
         :param family_id:
+        :param state: A snapshot of the village. When it's given, the resources are read from it
         :return:
         """
+        if state is not None:
+            for resource in state.resources.get(family_id, {}).values():
+                self.update_resource(resource["id"], 0)
+            return
+
         # First get all of the resource ids
-        query = """
+        query = QueryTemplate("""
         PREFIX maya: <https://maya.com#>
         SELECT ?resource
         WHERE {
-            <"""+family_id+"""> maya:hasResource ?resource .
+            ?family maya:hasResource ?resource .
         }
-        """
+        """, ["family"])
         logging.debug("=== Resetting Resources Query ===")
-        results = self.graph.query.get(query)
+        results = self.graph.query.get_prepared(query, {"family": family_id})
         for result in results["results"]["bindings"]:
             self.update_resource(result["resource"]["value"], 0)
 
-    def check_calorie_emergency(self, date, limit=20):
+    def check_calorie_emergency(self, date, limit=20, state=None, families=None):
         """
         First check, to see if each family has a calorie deficit. If it is present, check to see
         if it needs to expire
 
         :param date: The current date
         :param limit: The maximum number of days that the emergency is valid for
+        :param state: A snapshot of the village. When it's given, the emergencies are read from it
+        :param families: The families whose emergencies are checked, when only some are due
         :return:
         """
-        # Query to get all families that have a calorie emergency node
-        query = """
-        PREFIX maya: <https://maya.com#>
-        SELECT ?emergency ?is_active ?start_date
-        WHERE {
-            ?family maya:hasCalorieEmergency ?emergency .
-            ?emergency maya:isActive ?is_active .
-            ?emergency maya:hasStartDate ?start_date .
-        }
-        """
-        logging.debug("=== Get Calorie Emergency Query ===")
-        res = self.graph.query.get(query)
+        if state is not None:
+            emergencies = [dict(emergency, family={"type": "uri", "value": family_id})
+                           for family_id, family_emergencies in state.emergencies.items()
+                           if families is None or family_id in families
+                           for emergency in family_emergencies]
+        else:
+            # Query to get all families that have a calorie emergency node
+            query = """
+            PREFIX maya: <https://maya.com#>
+            SELECT ?family ?emergency ?is_active ?start_date
+            WHERE {
+                ?family maya:hasCalorieEmergency ?emergency .
+                ?emergency maya:isActive ?is_active .
+                ?emergency maya:hasStartDate ?start_date .
+            }
+            """
+            logging.debug("=== Get Calorie Emergency Query ===")
+            emergencies = self.graph.query.get(query)["results"]["bindings"]
         # For each family, check if it's active
-        for result in res["results"]["bindings"]:
+        for result in emergencies:
             if result["is_active"]["value"]:
                 # If it is, check if it's time to delete it
-                if date - result["start_date"]["value"] >= limit:
+                if date - int(result["start_date"]["value"]) >= limit:
                     self.delete_calorie_emergency(result["family"]["value"])
+                    if self.scheduler is not None:
+                        # The family's jobs change back once the emergency is gone
+                        self.scheduler.schedule(date + 1, "jobs", result["family"]["value"])
+                elif self.scheduler is not None:
+                    self.scheduler.schedule(int(result["start_date"]["value"]) + limit, "emergency",
+                                            result["family"]["value"])
 
     def delete_calorie_emergency(self, family_id):
         """
@@ -815,41 +1054,34 @@ class Model:
         :param family_id: The identifier of the family whose calorie emergency is being deleted
         :return:
         """
-        delete_query = """
+        delete_query = QueryTemplate("""
             PREFIX maya: <https://maya.com#>
-            DELETE WHERE {
-                 <"""+family_id+"""> maya:hasCalorieEmergency ?emergency .
+            DELETE {
+                 ?family maya:hasCalorieEmergency ?emergency .
+            } WHERE {
+                 ?family maya:hasCalorieEmergency ?emergency .
             }
-        """
+        """, ["family"])
         logging.debug("=== Deleting Calorie Emergency Query ===")
-        self.graph.query.post(delete_query)
+        self.graph.writes.update(delete_query.render({"family": family_id}))
 
-    def job_adjustments(self, family_id):
+    def job_adjustments(self, family_id, state=None):
         """
+        Gives each winik in a family the profession that matches its age and gender.
 
+        :param family_id: The identifier of the family
+        :param state: A snapshot of the village. When it's given, the winiks are read from it
         :return:
         """
         # Check to see if there's a calorie emergency
-        emergency = self.get_calorie_emergency(family_id)
+        emergency = self.get_calorie_emergency(family_id, state)
         emergency_event = emergency["results"]["bindings"]
-        # Get all of the winiks in the family
-        query = """
-            PREFIX maya: <https://maya.com#>
-            SELECT ?winik ?age ?gender ?profession
-            WHERE {
-                ?winik maya:hasFamily <"""+family_id+"""> .
-                ?winik maya:isAlive ?alive .
-                ?winik maya:hasAge ?age .
-                ?winik maya:hasGender ?gender .
-                ?winik maya:hasProfession ?profession .
-                FILTER (?alive = True)
-            }
-        """
-        res = self.graph.query.get(query)
-        for result in res["results"]["bindings"]:
-            age = int(result["age"]["value"])
-            gender = str(result["gender"]["value"])
-            current_profession = str(result["profession"]["value"])
+        if state is not None:
+            winiks = [(winik["id"], winik["age"], winik["gender"], winik["profession"])
+                      for winik in state.living_winiks(family_id)]
+        else:
+            winiks = self.get_family_professions(family_id)
+        for id, age, gender, current_profession in winiks:
             new_profession = current_profession
             if age > 14610:
                 new_profession = 'forager'
@@ -862,24 +1094,34 @@ class Model:
             elif age > 1826:
                 new_profession = 'forager'
 
-            if len(emergency_event) and emergency_event["is_active"]["value"]:
+            if len(emergency_event) and emergency_event[0]["is_active"]["value"]:
                 new_profession = "farmer"
-            id = str(result["winik"]["value"])
             # Update the profession if it changed
             if new_profession != current_profession:
                 logging.info("=== Setting New Profession Query ===")
-                query = """
-                    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                    PREFIX maya: <https://maya.com#>
-                    PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                    DELETE {
-                        ?winik maya:hasProfession ?prof .
-                    }
-                    INSERT {
-                        ?winik maya:hasProfession ?new_profession .
-                    } WHERE {
-                        BIND(<"""+id+"""> AS ?winik)
-                        BIND('"""+new_profession+"""' AS ?new_profession)
-                    }
-                """
-                self.graph.query.post(query)
+                self.graph.writes.set(id, "maya:hasProfession", new_profession)
+
+    def get_family_professions(self, family_id):
+        """
+        Gets the age, gender and profession of each living winik in a family.
+
+        :param family_id: The identifier of the family
+        :return: A list of tuples, (winik ID, age, gender, profession)
+        """
+        query = QueryTemplate("""
+            PREFIX maya: <https://maya.com#>
+            SELECT ?winik ?age ?gender ?profession
+            WHERE {
+                ?winik maya:hasFamily ?family .
+                ?winik maya:isAlive ?alive .
+                ?winik maya:hasBirthStep ?birth .
+                ?winik maya:hasGender ?gender .
+                ?winik maya:hasProfession ?profession .
+                FILTER (?alive = True)
+                BIND(?step - ?birth AS ?age)
+            }
+        """, ["family", "step"])
+        self.graph.ensure_birth_steps()
+        res = self.graph.query.get_prepared(query, {"family": family_id, "step": self.graph.step})
+        return [(str(result["winik"]["value"]), int(result["age"]["value"]), str(result["gender"]["value"]),
+                 str(result["profession"]["value"])) for result in res["results"]["bindings"]]
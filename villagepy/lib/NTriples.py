@@ -0,0 +1,36 @@
+import rdflib
+
+
+class NTriples:
+    """
+    Writes triples as N-Triples lines using rdflib's public term API. Literal.n3() shortens
+    numbers and booleans and writes multi-line strings in triple quotes, neither of which
+    N-Triples allows, so literals are always written as a quoted, escaped string with their
+    language or datatype.
+    """
+    @staticmethod
+    def line(triple) -> str:
+        """
+        Writes a triple as an N-Triples line.
+
+        :param triple: An rdflib (subject, predicate, object) triple
+        :return: The line, ending in a newline
+        """
+        return " ".join(NTriples.term(term) for term in triple) + " .\n"
+
+    @staticmethod
+    def term(term) -> str:
+        """
+        Writes an rdflib term the way N-Triples spells it.
+
+        :param term: A URIRef, BNode or Literal
+        :return: The term
+        """
+        if not isinstance(term, rdflib.Literal):
+            return term.n3()
+        text = str(term).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"').replace("\r", "\\r")
+        if term.language:
+            return f'"{text}"@{term.language}'
+        if term.datatype:
+            return f'"{text}"^^<{term.datatype}>'
+        return f'"{text}"'
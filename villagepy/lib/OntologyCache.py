@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import rdflib
+
+
+class OntologyCache:
+    """
+    Keeps parsed ontologies on disk as pickled triples, which load several times faster
+    than parsing the RDF/XML. Entries are named after a hash of the ontology file, so
+    editing the ontology makes a new entry instead of reusing a stale one. Parsed
+    ontologies are also kept in memory for the life of the cache.
+    """
+    # The ontology that the winiks are described with
+    ontology = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "onto", "FamilyHealthHistory.owl"))
+
+    def __init__(self, directory=None):
+        """
+        :param directory: Where the parsed ontologies are kept. Defaults to $VILLAGEPY_CACHE,
+                          or ~/.cache/villagepy
+        """
+        self.directory = directory or os.environ.get("VILLAGEPY_CACHE") or \
+            os.path.join(os.path.expanduser("~"), ".cache", "villagepy")
+        self.loaded = {}
+
+    @staticmethod
+    def digest(path) -> str:
+        """
+        Hashes the contents of a file.
+
+        :param path: The path to the file
+        :return: The SHA-256 hex digest
+        """
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def entry(self, path, digest: str) -> str:
+        """
+        Gets the path of the cache entry for a version of an ontology.
+
+        :param path: The path to the ontology
+        :param digest: The hash of the ontology's contents
+        :return: The path of the cached triples
+        """
+        return os.path.join(self.directory, f"{os.path.basename(path)}.{digest[:16]}.pickle")
+
+    def triples(self, path=None) -> list:
+        """
+        Gets the triples of an ontology, parsing it only when it isn't cached.
+
+        :param path: The path to the ontology. Defaults to the Family Health History ontology
+        :return: A list of triples
+        """
+        path = os.path.abspath(path or self.ontology)
+        digest = self.digest(path)
+        if (path, digest) in self.loaded:
+            return self.loaded[(path, digest)]
+
+        entry = self.entry(path, digest)
+        triples = None
+        if os.path.exists(entry):
+            try:
+                with open(entry, "rb") as f:
+                    triples = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as error:
+                logging.warning(f"Ignoring the unreadable ontology cache {entry}: {error}")
+        if triples is None:
+            logging.info(f"Parsing {path}")
+            graph = rdflib.Graph()
+            graph.parse(path)
+            triples = list(graph)
+            self.write(entry, triples)
+        self.loaded[(path, digest)] = triples
+        return triples
+
+    def write(self, entry: str, triples: list) -> None:
+        """
+        Writes a cache entry. The entry is written to a temporary file first and moved into
+        place, so processes that load the ontology at the same time never see half of one.
+
+        :param entry: The path of the cache entry
+        :param triples: The ontology's triples
+        :return: None
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, "wb") as f:
+                pickle.dump(triples, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, entry)
+        except OSError as error:
+            # A read-only cache directory only costs the speed up
+            logging.warning(f"Couldn't write the ontology cache {entry}: {error}")
+
+    def load(self, graph: rdflib.Graph, path=None) -> rdflib.Graph:
+        """
+        Adds an ontology's triples to a graph.
+
+        :param graph: The graph that the ontology is added to
+        :param path: The path to the ontology. Defaults to the Family Health History ontology
+        :return: The graph
+        """
+        graph.addN((subject, predicate, obj, graph) for subject, predicate, obj in self.triples(path))
+        return graph
+
+
+# The cache that's shared by everything in the process
+ontology_cache = OntologyCache()
@@ -0,0 +1,115 @@
+import heapq
+from collections import deque
+
+
+class PartnerMatcher:
+    """
+    Pairs single male and female winiks. Instead of comparing every male with every
+    female, the singles are sorted by age once and swept in order while keeping the
+    unmatched winiks that are still inside the age window, which makes matching
+    O(n log n) in the number of singles.
+    """
+    def __init__(self, window: int = 1460):
+        """
+        :param window: Two winiks can only be partnered when their ages are less than this many days apart
+        """
+        self.window = window
+
+    def match(self, males, females) -> list:
+        """
+        Finds a set of pairs where no winik is used twice, the partners are from different
+        families and their ages are within the window of each other. Each winik is matched
+        with the oldest unmatched winik that's still inside its window, so nobody is passed
+        over in favor of a winik that could still be matched later.
+
+        :param males: An iterable of (winik ID, age, family ID) tuples
+        :param females: An iterable of (winik ID, age, family ID) tuples
+        :return: A list of (bride, groom) tuples
+        """
+        singles = sorted([(age, winik_id, family_id, "M") for winik_id, age, family_id in males] +
+                         [(age, winik_id, family_id, "F") for winik_id, age, family_id in females])
+        # The unmatched winiks of each gender
+        waiting = {"M": WaitingList(), "F": WaitingList()}
+        pairs = []
+        for age, winik_id, family_id, gender in singles:
+            candidates = waiting["F" if gender == "M" else "M"]
+            # Anyone this much older can't be matched with this winik or the ones after it
+            candidates.expire(age, self.window)
+            partner = candidates.take(family_id)
+            if partner is None:
+                waiting[gender].append((age, winik_id, family_id))
+                continue
+            if gender == "F":
+                pairs.append((winik_id, partner))
+            else:
+                pairs.append((partner, winik_id))
+        return pairs
+
+
+class WaitingList:
+    """
+    The unmatched winiks of one gender. Each family's winiks wait in their own queue, oldest
+    first, and a heap holds the oldest winik of every family. The oldest winik outside a
+    family is either the top of the heap or, when that's in the family, the next one down,
+    so finding a partner never steps over the rest of the winik's own family.
+    """
+    def __init__(self):
+        # Family ID -> deque of (age, winik ID, family ID), oldest first
+        self.families = {}
+        # The first winik in each family's queue
+        self.heads = []
+
+    def append(self, winik: tuple) -> None:
+        """
+        Adds a winik. Winiks have to be added from oldest to youngest.
+
+        :param winik: An (age, winik ID, family ID) tuple
+        :return: None
+        """
+        queue = self.families.setdefault(winik[2], deque())
+        queue.append(winik)
+        if len(queue) == 1:
+            heapq.heappush(self.heads, winik)
+
+    def pop(self) -> tuple:
+        """
+        Removes and returns the oldest waiting winik.
+
+        :return: The winik's (age, winik ID, family ID) tuple
+        """
+        winik = heapq.heappop(self.heads)
+        queue = self.families[winik[2]]
+        queue.popleft()
+        if queue:
+            heapq.heappush(self.heads, queue[0])
+        else:
+            del self.families[winik[2]]
+        return winik
+
+    def expire(self, age: int, window: int) -> None:
+        """
+        Drops the winiks that are too much older than 'age' to be matched.
+
+        :param age: The age of the winik being matched
+        :param window: The largest allowed age gap, exclusive
+        :return: None
+        """
+        while self.heads and age - self.heads[0][0] >= window:
+            self.pop()
+
+    def take(self, family_id):
+        """
+        Removes and returns the oldest winik that isn't in the same family.
+
+        :param family_id: The family of the winik being matched
+        :return: The partner's identifier, or None if there isn't one
+        """
+        if not self.heads:
+            return None
+        if self.heads[0][2] != family_id:
+            return self.pop()[1]
+        # Set the family aside while the oldest winik from any other family is taken
+        own = heapq.heappop(self.heads)
+        partner = self.pop() if self.heads else None
+        heapq.heappush(self.heads, own)
+        return None if partner is None else partner[1]
@@ -0,0 +1,309 @@
+import logging
+import numpy as np
+import rdflib
+
+from .QueryTemplate import QueryTemplate
+
+
+class Population:
+    """
+    Holds every winik in NumPy arrays so that the daily subsystems run as one vectorized
+    pass over the whole village instead of a round of queries per winik. The graph stays
+    the system of record: the population is loaded from it at the start of a run and
+    written back to it at checkpoints.
+    """
+    professions = ["none", "forager", "fisher", "farmer"]
+    resources = ["coast", "garden", "marine", "marine-b", "marine-c"]
+
+    def __init__(self, winik_records, resource_records, step=0, emergency_records=()):
+        """
+        Creates the arrays out of the records returned by MayaGraph.get_winik_records,
+        MayaGraph.get_resource_records and MayaGraph.get_emergency_records.
+
+        :param winik_records: An iterable of winik tuples
+        :param resource_records: An iterable of resource tuples
+        :param step: The step that the records' ages are from
+        :param emergency_records: An iterable of calorie emergency tuples
+        """
+        self.professions = list(Population.professions)
+        records = {}
+        for record in winik_records:
+            # A winik can show up more than once when it has several partners; keep one row
+            records.setdefault(record[0], record)
+        records = list(records.values())
+        resource_records = list(resource_records)
+
+        self.ids = np.array([record[0] for record in records], dtype=object)
+        self.index = {winik_id: i for i, winik_id in enumerate(self.ids)}
+        self.family_ids = sorted({record[6] for record in records} |
+                                 {record[0] for record in resource_records})
+        family_index = {family_id: i for i, family_id in enumerate(self.family_ids)}
+
+        self.age = np.array([record[1] for record in records], dtype=np.int64)
+        # The graph stores birth steps; they're needed to give the winiks that die a death step
+        self.birth = step - self.age
+        self.female = np.array([record[2] == "F" for record in records], dtype=bool)
+        # Winiks without a health value are NaN, which keeps them out of the health subsystems
+        self.health = np.array([np.nan if record[3] is None else record[3] for record in records], dtype=np.float64)
+        self.alive = np.array([record[4] for record in records], dtype=bool)
+        self.profession = np.array([self.profession_code(record[5]) for record in records], dtype=np.int64)
+        self.family = np.array([family_index[record[6]] for record in records], dtype=np.int64)
+        self.partner = np.array([self.index.get(record[7], -1) for record in records], dtype=np.int64)
+        self.mother = np.array([self.index.get(record[8], -1) for record in records], dtype=np.int64)
+
+        # One row per family and one column per resource
+        shape = (len(self.family_ids), len(self.resources))
+        self.quantity = np.zeros(shape, dtype=np.int64)
+        self.resource_ids = np.full(shape, None, dtype=object)
+        for family_id, resource_id, name, quantity in resource_records:
+            if name in self.resources:
+                cell = family_index[family_id], self.resources.index(name)
+                self.quantity[cell] = quantity
+                self.resource_ids[cell] = resource_id
+
+        # The start date of each family's calorie emergency, -1 if there isn't one
+        self.emergency_start = np.full(len(self.family_ids), -1, dtype=np.int64)
+        for family_id, emergency_id, is_active, start_date in emergency_records:
+            if family_id in family_index and str(is_active).lower() in ("true", "1"):
+                self.emergency_start[family_index[family_id]] = int(float(start_date))
+        self.mark_written()
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Loads the population from the graph with three bulk queries.
+
+        :param graph: The MayaGraph holding the village
+        :return: A new Population
+        """
+        logging.info("Loading the population from the graph")
+        population = cls(graph.get_winik_records(), graph.get_resource_records(), graph.step,
+                         graph.get_emergency_records())
+        # The graph gives the ages during graph.step, but the population ages itself at the
+        # start of each step, so it starts from the ages of the step before
+        population.age[population.alive] -= 1
+        return population
+
+    def __len__(self):
+        return len(self.ids)
+
+    def profession_code(self, profession: str) -> int:
+        """
+        Gets the integer code that's stored in the profession array.
+
+        :param profession: The name of the profession
+        :return: The profession's code
+        """
+        if profession not in self.professions:
+            self.professions.append(profession)
+        return self.professions.index(profession)
+
+    def step(self, date, streams, emergency_limit=20) -> None:
+        """
+        Advances the whole village one day in time.
+
+        :param date: The current date
+        :param streams: The RandomStreams used for the coast resource draws
+        :param emergency_limit: The maximum number of days that a calorie emergency lasts
+        :return: None
+        """
+        self.increase_age()
+        self.expire_emergencies(date, emergency_limit)
+        available_calories = self.available_calories(streams, date)
+        required_calories = self.calorie_requirements()
+        deficit = available_calories - 100 * required_calories < 0
+        self.handle_calorie_deficit(deficit, available_calories, required_calories, date)
+        self.handle_calorie_surplus(~deficit)
+        self.job_adjustments()
+
+    def increase_age(self) -> None:
+        """
+        Increases the age of each winik that is alive by '1'.
+
+        :return: None
+        """
+        self.age[self.alive] += 1
+
+    def expire_emergencies(self, date, limit) -> None:
+        """
+        Ends the calorie emergencies that have lasted at least 'limit' days.
+
+        :param date: The current date
+        :param limit: The maximum number of days that the emergency is valid for
+        :return: None
+        """
+        expired = (self.emergency_start >= 0) & (date - self.emergency_start >= limit)
+        self.emergency_start[expired] = -1
+
+    def available_calories(self, streams, date) -> np.ndarray:
+        """
+        Gets the number of calories that each family has access to today, which is
+        yesterday's resources plus what the family's workers bring in.
+
+        :param streams: The RandomStreams used for the coast resource draws. The draws are
+                        keyed by family, so they match the ones Model makes family by family
+        :param date: The current date
+        :return: The calories for each family
+        """
+        working = self.alive
+        families = len(self.family_ids)
+        farmers = np.bincount(self.family[working & (self.profession == 3)], minlength=families)
+        fishers = np.bincount(self.family[working & (self.profession == 2)], minlength=families)
+        foragers = np.bincount(self.family[working & (self.profession == 1)], minlength=families)
+
+        coast, garden, marine, marine_b, marine_c = self.quantity.T
+        coast = coast + foragers * streams.integers("coast", self.family_ids, date, 1, 5)
+        garden = garden + farmers * 9
+        marine = marine + fishers * 9
+        return 3000.0 * (marine + marine_b + marine_c) + 250.0 * garden + 10.0 * coast
+
+    def calorie_requirements(self) -> np.ndarray:
+        """
+        Gets the number of calories that each family needs for the day.
+
+        :return: The calories required by each family
+        """
+        age = self.age
+        conditions = [
+            (age >= 730) & (age <= 1825),
+            (age >= 2190) & (age <= 3285),
+            (age >= 3650) & (age <= 5110),
+            (age >= 5475) & (age <= 12775),
+            (age >= 13140) & (age <= 25550),
+        ]
+        choices = [
+            12,
+            np.where(self.female, 18, 20),
+            np.where(self.female, 22, 25),
+            np.where(self.female, 24, 30),
+            np.where(self.female, 22, 27),
+        ]
+        calories = np.select(conditions, choices, default=0)
+        return np.bincount(self.family[self.alive], weights=calories[self.alive],
+                           minlength=len(self.family_ids))
+
+    def handle_calorie_deficit(self, deficit, available_calories, required_calories, date) -> None:
+        """
+        Takes health from the winiks in families that don't have enough calories, kills the
+        ones that run out, empties the families' resources and starts a calorie emergency
+        where any winik's health is critical.
+
+        :param deficit: A mask of the families that have a deficit
+        :param available_calories: The calories each family has
+        :param required_calories: The calories each family needs
+        :param date: The current date
+        :return: None
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(required_calories > 0, available_calories / required_calories, np.inf)
+        health_loss = np.select([ratio > 0.75, ratio > 0.5, ratio > 0.25], [2, 5, 7], default=15)
+
+        hungry = self.alive & deficit[self.family] & (self.health > 0)
+        self.health[hungry] -= health_loss[self.family[hungry]]
+        died = hungry & (self.health <= 0)
+        if died.any():
+            logging.info(f"{int(died.sum())} villagers have died from starvation!")
+        self.alive[died] = False
+        self.quantity[deficit] = 0
+
+        critical = self.alive & (self.health < 75) & (self.health > 0)
+        critical_families = np.bincount(self.family[critical], minlength=len(self.family_ids)) > 0
+        new_emergency = deficit & critical_families & (self.emergency_start < 0)
+        self.emergency_start[new_emergency] = date
+
+    def handle_calorie_surplus(self, surplus) -> None:
+        """
+        Adds '5' to the health of each winik in a family that has a surplus.
+
+        :param surplus: A mask of the families that have a surplus
+        :return: None
+        """
+        fed = self.alive & surplus[self.family] & (self.health < 96)
+        self.health[fed] += 5
+
+    def job_adjustments(self) -> None:
+        """
+        Gives each living winik the profession that matches its age and gender. Every
+        winik in a family with a calorie emergency becomes a farmer.
+
+        :return: None
+        """
+        age = self.age
+        conditions = [
+            age > 14610,
+            (age > 3287) & ~self.female,
+            (age > 5113) & self.female,
+            age > 3287,
+            age > 1826,
+        ]
+        profession = np.select(conditions, [1, 2, 3, 2, 1], default=self.profession)
+        profession = np.where(self.emergency_start[self.family] >= 0, 3, profession)
+        self.profession = np.where(self.alive, profession, self.profession)
+
+    def mark_written(self) -> None:
+        """
+        Records the current state as the state that the graph holds.
+
+        :return: None
+        """
+        self.written = (self.health.copy(), self.alive.copy(), self.profession.copy(), self.quantity.copy(),
+                        self.emergency_start.copy())
+
+    def write_back(self, graph) -> None:
+        """
+        Writes every value that changed since the last checkpoint to the graph as one
+        transaction.
+
+        :param graph: The MayaGraph holding the village
+        :return: None
+        """
+        health, alive, profession, quantity, emergency_start = self.written
+        # Ages come from the birth steps in the graph, so they're never written
+        for i in np.flatnonzero((self.health != health) & ~np.isnan(self.health)):
+            graph.writes.set(self.ids[i], "maya:hasHealth", float(self.health[i]))
+        for i in np.flatnonzero(self.alive != alive):
+            graph.writes.set(self.ids[i], "maya:isAlive", bool(self.alive[i]))
+            if not self.alive[i]:
+                # The winik stopped aging in the step it died
+                graph.writes.set(self.ids[i], "maya:hasDeathStep", int(self.birth[i] + self.age[i]))
+        for i in np.flatnonzero(self.profession != profession):
+            graph.writes.set(self.ids[i], "maya:hasProfession", self.professions[self.profession[i]])
+        for family, resource in zip(*np.nonzero(self.quantity != quantity)):
+            resource_id = self.resource_ids[family, resource]
+            if resource_id is not None:
+                graph.writes.set(resource_id, "maya:hasQuantity", int(self.quantity[family, resource]))
+        self.write_emergencies(graph, np.flatnonzero(self.emergency_start != emergency_start), emergency_start)
+        logging.info(f"Writing {len(graph.writes)} population changes back to the graph")
+        graph.flush()
+        self.mark_written()
+
+    def write_emergencies(self, graph, families, emergency_start) -> None:
+        """
+        Writes the calorie emergencies that started or ended since the last checkpoint. An
+        emergency that ended is unlinked from its family, the way Model ends one, and a new
+        one is linked to its family with its start date.
+
+        :param graph: The MayaGraph holding the village
+        :param families: The indexes of the families whose emergency changed
+        :param emergency_start: The start dates that the graph holds
+        :return: None
+        """
+        ended = [self.family_ids[family] for family in families if emergency_start[family] >= 0]
+        if ended:
+            query = QueryTemplate("""
+                PREFIX maya: <https://maya.com#>
+                DELETE {
+                     ?family maya:hasCalorieEmergency ?emergency .
+                } WHERE {
+                     ?family maya:hasCalorieEmergency ?emergency .
+                }
+            """, ["family"])
+            graph.writes.update(query.render([{"family": family_id} for family_id in ended]))
+        for family in families:
+            if self.emergency_start[family] < 0:
+                continue
+            emergency_id = graph.get_id("calorieEmergency")
+            graph.writes.insert(emergency_id, "rdf:type", rdflib.URIRef("https://maya.com#calorieEmergency"))
+            graph.writes.insert(emergency_id, "maya:isActive", True)
+            graph.writes.insert(emergency_id, "maya:hasStartDate", int(self.emergency_start[family]))
+            graph.writes.insert(self.family_ids[family], "maya:hasCalorieEmergency", rdflib.URIRef(emergency_id))
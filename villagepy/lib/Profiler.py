@@ -0,0 +1,189 @@
+import csv
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Records where the time in a run goes. Model wraps each subsystem in
+    Profiler.subsystem, and the store backends report every query and update they send
+    with Profiler.record_query. Queries are charged to the innermost subsystem that's
+    running when they're sent, and to the template (the query's text with its identifiers
+    and literals taken out) that they were built from.
+
+    When a directory is given, each step is appended to steps.csv and steps.jsonl as it
+    ends, and finish() writes summary.json and templates.csv.
+    """
+    counters = ["seconds", "calls", "reads", "updates", "bytes_sent", "bytes_received", "rows"]
+
+    def __init__(self, directory=None):
+        """
+        :param directory: The directory that the reports are written to. Nothing is written
+                          when it's None.
+        """
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.step = None
+        # {subsystem: counters} for the step that's running
+        self.current = {}
+        # {subsystem: counters} over the whole run
+        self.totals = {}
+        # {template: counters} over the whole run
+        self.templates = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def empty(cls) -> dict:
+        return {counter: 0 for counter in cls.counters}
+
+    @staticmethod
+    def template_key(query: str) -> str:
+        """
+        Reduces a query to the template that it was built from by taking out its prefixes,
+        VALUES blocks, identifiers and literals.
+
+        :param query: The SPARQL query or update
+        :return: The template's key
+        """
+        text = re.sub(r"PREFIX\s+[\w-]*:\s*<[^>]*>", " ", query, flags=re.IGNORECASE)
+        text = re.sub(r"VALUES\s*\([^)]*\)\s*\{[^}]*\}", " VALUES ", text, flags=re.IGNORECASE)
+        text = re.sub(r"<[^<>\s]*>", "<>", text)
+        text = re.sub(r"\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'", "''", text)
+        text = re.sub(r"(?<![\w?$])-?\d+(\.\d+)?", "0", text)
+        return " ".join(text.split())[:200]
+
+    def start_step(self, step) -> None:
+        """
+        Starts collecting the counters of a step.
+
+        :param step: The step that's starting
+        :return: None
+        """
+        with self.lock:
+            self.step = step
+            self.current = {}
+
+    def active(self) -> str:
+        """
+        Gets the innermost subsystem that's running on this thread.
+
+        :return: The subsystem's name
+        """
+        stack = getattr(self.local, "stack", None)
+        return stack[-1] if stack else "other"
+
+    def add(self, subsystem: str, **values) -> None:
+        """
+        Adds to the counters of a subsystem, for the current step and the whole run.
+
+        :param subsystem: The name of the subsystem
+        :param values: The amounts to add to each counter
+        :return: None
+        """
+        with self.lock:
+            for table in (self.current, self.totals):
+                counters = table.setdefault(subsystem, self.empty())
+                for counter, value in values.items():
+                    counters[counter] += value
+
+    @contextmanager
+    def subsystem(self, name: str):
+        """
+        Times a subsystem. Subsystems can be nested; each one's time includes the time of
+        the subsystems that run inside it.
+
+        :param name: The name of the subsystem (ie births)
+        :return: None
+        """
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        self.local.stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.local.stack.pop()
+            self.add(name, seconds=time.perf_counter() - start, calls=1)
+
+    def record_query(self, kind: str, query: str, seconds: float, bytes_sent: int, bytes_received: int,
+                     rows: int = 0) -> None:
+        """
+        Records a query or update that was sent to the store.
+
+        :param kind: Either 'read' or 'update'
+        :param query: The SPARQL text, or the template's text for prepared queries
+        :param seconds: How long the request took
+        :param bytes_sent: The size of the request
+        :param bytes_received: The size of the response
+        :param rows: The number of result rows
+        :return: None
+        """
+        values = {"reads" if kind == "read" else "updates": 1, "bytes_sent": bytes_sent,
+                  "bytes_received": bytes_received, "rows": rows}
+        self.add(self.active(), **values)
+        key = self.template_key(query)
+        with self.lock:
+            counters = self.templates.setdefault(key, self.empty())
+            counters["seconds"] += seconds
+            counters["calls"] += 1
+            for counter, value in values.items():
+                counters[counter] += value
+
+    def end_step(self) -> dict:
+        """
+        Finishes a step and appends its report to steps.csv and steps.jsonl.
+
+        :return: The step's counters, {subsystem: counters}
+        """
+        with self.lock:
+            report = self.current
+            self.current = {}
+        if self.directory:
+            path = os.path.join(self.directory, "steps.csv")
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["step", "subsystem"] + self.counters)
+                for subsystem, counters in sorted(report.items()):
+                    writer.writerow([self.step, subsystem] + [counters[counter] for counter in self.counters])
+            with open(os.path.join(self.directory, "steps.jsonl"), "a") as f:
+                f.write(json.dumps({"step": self.step, "subsystems": report}) + "\n")
+        return report
+
+    def summary(self) -> dict:
+        """
+        Gets the counters of the whole run.
+
+        :return: A dictionary with the counters of each subsystem and each query template
+        """
+        with self.lock:
+            return {"subsystems": {name: dict(counters) for name, counters in self.totals.items()},
+                    "templates": {key: dict(counters) for key, counters in self.templates.items()}}
+
+    def finish(self) -> dict:
+        """
+        Writes summary.json and templates.csv, and logs where the time went.
+
+        :return: The run's summary
+        """
+        summary = self.summary()
+        for name, counters in sorted(summary["subsystems"].items(), key=lambda item: -item[1]["seconds"]):
+            logging.info(f"{name}: {counters['seconds']:.3f}s, {counters['reads']} reads, "
+                         f"{counters['updates']} updates")
+        if self.directory:
+            with open(os.path.join(self.directory, "summary.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+            with open(os.path.join(self.directory, "templates.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["template"] + self.counters)
+                for key, counters in sorted(summary["templates"].items(), key=lambda item: -item[1]["seconds"]):
+                    writer.writerow([key] + [counters[counter] for counter in self.counters])
+        return summary
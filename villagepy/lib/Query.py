@@ -1,28 +1,176 @@
 import logging
-from SPARQLWrapper import JSON, DIGEST, POST, SPARQLWrapper
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+
 
 class Query:
-    def __init__(self, endpoint: str, username: str, password: str):
+    # The base that GraphDB resolves relative identifiers in imported snippets against
+    base = "file:/snippet/generated/"
+
+    def __init__(self, endpoint: str, username: str, password: str, pool_size: int = 4, cache=None):
+        """
+        Creates a client for a GraphDB repository. All of the requests share one session,
+        so connections are kept alive between queries and the DIGEST handshake only
+        happens once per connection.
+
+        :param endpoint: The repository endpoint (ie http://localhost:7200/repositories/Tests)
+        :param username: The GraphDB username
+        :param password: The GraphDB password
+        :param pool_size: The maximum number of connections kept open to the endpoint
+        :param cache: An optional QueryCache. Results are reused until an update touches them
+        """
         self.endpoint = endpoint
         self.username = username
         self.password = password
-        self.sparql = SPARQLWrapper(endpoint)
+        self.cache = cache
+        # An optional Profiler that every request is reported to
+        self.profiler = None
+        self.session = requests.Session()
+        if username:
+            self.session.auth = HTTPDigestAuth(username, password)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def get(self, query: str) -> dict:
-        self.sparql.setMethod("GET")
-        self.sparql.setReturnFormat(JSON)
-        self.sparql.setQuery(query)
+        if self.cache is not None:
+            results = self.cache.get(query)
+            if results is not None:
+                logging.debug("Using cached SPARQL GET")
+                return results
+        headers = {
+            'Accept': 'application/sparql-results+json',
+        }
         logging.debug("Sending SPARQL GET")
-        results = self.sparql.query().convert()
+        start = time.perf_counter()
+        response = self.session.get(self.endpoint, params={'query': query}, headers=headers)
+        response.raise_for_status()
+        results = response.json()
         logging.debug("Retrieved SPARQL GET")
+        if self.profiler is not None:
+            self.profiler.record_query("read", query, time.perf_counter() - start, len(query.encode()),
+                                       len(response.content), len(results.get("results", {}).get("bindings", [])))
+        if self.cache is not None:
+            self.cache.put(query, results)
         return results
 
+    def get_prepared(self, template, bindings: dict) -> dict:
+        """
+        Runs a query template with its parameters sent in a VALUES block.
+
+        :param template: The QueryTemplate
+        :param bindings: A dictionary of parameter name to value
+        :return: The results in the SPARQL 1.1 JSON results format
+        """
+        return self.get(template.render(bindings))
+
+    def get_batch(self, template, rows: list) -> dict:
+        """
+        Runs a query template for several sets of parameters in one request, with one
+        VALUES row per set.
+
+        :param template: The QueryTemplate
+        :param rows: A list of dictionaries of parameter values
+        :return: The results in the SPARQL 1.1 JSON results format
+        """
+        return self.get(template.render(rows))
+
     def post(self, query: str) -> None:
-        endpoint = SPARQLWrapper(f'{self.endpoint}/statements')
-        endpoint.setHTTPAuth(DIGEST)
-        endpoint.setCredentials(self.username, self.password)
-        endpoint.setMethod(POST)
-        endpoint.setQuery(query)
         logging.debug("Sending SPARQL POST")
-        endpoint.query()
+        start = time.perf_counter()
+        response = self.session.post(f'{self.endpoint}/statements', data={'update': query})
+        response.raise_for_status()
+        if self.profiler is not None:
+            self.profiler.record_query("update", query, time.perf_counter() - start, len(query.encode()),
+                                       len(response.content))
+        if self.cache is not None:
+            self.cache.invalidate(query)
         logging.debug("Retrieved SPARQL POST")
+
+    def post_many(self, updates: list) -> None:
+        """
+        Sends a list of updates as one request. GraphDB runs all of the operations in a
+        request as a single transaction.
+
+        :param updates: The SPARQL updates, in the order they should run
+        :return: None
+        """
+        self.post(" ;\n".join(updates))
+
+    def load_triples(self, lines: list) -> None:
+        """
+        Adds a chunk of N-Triples lines to the repository with a Graph Store Protocol POST.
+        The chunk is sent as turtle with the snippet base declared, so lines with relative
+        identifiers (ie <winik/1>) load the same way that pasting them into GraphDB does.
+
+        :param lines: The N-Triples lines
+        :return: None
+        """
+        data = f"@base <{self.base}> .\n" + "\n".join(line.rstrip("\n") for line in lines) + "\n"
+        logging.debug(f"Sending {len(lines)} triples")
+        start = time.perf_counter()
+        response = self.session.post(f'{self.endpoint}/statements', data=data.encode("utf-8"),
+                                     headers={'Content-Type': 'text/turtle'})
+        response.raise_for_status()
+        if self.profiler is not None:
+            self.profiler.record_query("update", "LOAD", time.perf_counter() - start, len(data), len(response.content))
+        if self.cache is not None:
+            self.cache.clear()
+
+    def save(self, path) -> None:
+        """
+        Downloads the contents of the repository as turtle and writes it to disk
+
+        :param path: The path on disk where the graph is written to
+        :return: None
+        """
+        with open(path, "wb") as f:
+            self.export(f)
+
+    def export(self, f, chunk_size: int = 1 << 16) -> None:
+        """
+        Streams the contents of the repository as turtle into a file, a chunk at a time, so
+        the export is never held in memory.
+
+        :param f: A file opened for writing bytes (ie from open(path, "wb") or gzip.open)
+        :param chunk_size: The number of bytes read from the response at a time
+        :return: None
+        """
+        headers = {
+            'Accept': 'text/turtle',
+        }
+
+        params = (
+            ('infer', 'false'),
+            ('context', 'null'),
+            ('infer', 'true')
+        )
+        with self.session.get(f'{self.endpoint}/statements', headers=headers, params=params,
+                              stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+
+    def triples(self):
+        """
+        Streams the contents of the repository as N-Triples.
+
+        :return: A generator of N-Triples lines
+        """
+        headers = {
+            'Accept': 'application/n-triples',
+        }
+        params = (
+            ('context', 'null'),
+            ('infer', 'true')
+        )
+        with self.session.get(f'{self.endpoint}/statements', headers=headers, params=params,
+                              stream=True) as response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    yield line
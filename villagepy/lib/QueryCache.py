@@ -0,0 +1,119 @@
+import re
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    A least recently used cache of SPARQL query results. Every entry is tagged with the
+    local names (ie hasAge) of the IRIs that its query mentions, and an update evicts the
+    entries that share a name with it. Local names are used instead of full IRIs so that a
+    prefix that one query declares and another leaves to the store's defaults can't hide a
+    match. Queries or updates with a variable in the predicate position could touch anything,
+    so those entries are evicted by every update, and those updates clear the whole cache.
+    """
+    prefix_pattern = re.compile(r"PREFIX\s+[\w-]*:\s*<[^>]*>", re.IGNORECASE)
+    iri_pattern = re.compile(r"<([^<>\s]*)>")
+    prefixed_pattern = re.compile(r"(?<![\w?$<#])([A-Za-z][\w-]*)?:([A-Za-z_][\w-]*)")
+    variable_predicate_pattern = re.compile(r"[?$]\w+\s+[?$]\w+")
+    type_pattern = re.compile(r"\sa\s")
+
+    def __init__(self, size: int = 256):
+        """
+        :param size: The maximum number of results that are kept
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str) -> str:
+        """
+        Normalizes a query so that copies that only differ in whitespace share an entry.
+
+        :param query: The SPARQL query
+        :return: The cache key
+        """
+        return " ".join(query.split())
+
+    def tags(self, query: str):
+        """
+        Gets the local names of the IRIs that a query or update mentions.
+
+        :param query: The SPARQL query or update
+        :return: A set of names, or None if the query has a variable predicate
+        """
+        body = self.prefix_pattern.sub(" ", query)
+        # Only look at the patterns; the SELECT clause is a list of variables
+        if "{" in body:
+            body = body[body.index("{"):]
+        if self.variable_predicate_pattern.search(body):
+            return None
+        tags = {re.split(r"[#/:]", iri.rstrip("#/"))[-1] for iri in self.iri_pattern.findall(body)}
+        tags.update(name for prefix, name in self.prefixed_pattern.findall(self.iri_pattern.sub(" ", body)))
+        if self.type_pattern.search(body):
+            tags.add("type")
+        return tags
+
+    def get(self, query: str):
+        """
+        Looks up the results of a query.
+
+        :param query: The SPARQL query
+        :return: The cached results, or None on a miss
+        """
+        key = self.key(query)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, results) -> None:
+        """
+        Caches the results of a query, dropping the least recently used entry when the
+        cache is full.
+
+        :param query: The SPARQL query
+        :param results: The query's results
+        :return: None
+        """
+        tags = self.tags(query)
+        with self.lock:
+            self.entries[self.key(query)] = (results, tags)
+            self.entries.move_to_end(self.key(query))
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, update: str) -> None:
+        """
+        Evicts every entry whose results an update could change.
+
+        :param update: The SPARQL update
+        :return: None
+        """
+        tags = self.tags(update)
+        with self.lock:
+            if tags is None:
+                self.entries.clear()
+                return
+            stale = [key for key, (results, entry_tags) in self.entries.items()
+                     if entry_tags is None or entry_tags & tags]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Gets the cache's counters.
+
+        :return: A dictionary with the hits, misses and number of cached results
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
@@ -0,0 +1,75 @@
+import re
+import rdflib
+
+
+class QueryTemplate:
+    """
+    A SPARQL query or update whose identifiers are passed in as variables instead of being
+    pasted into the text. The text never changes, so a local store only parses it once,
+    and a remote store gets the parameters in a VALUES block at the top of the WHERE
+    clause. Several sets of parameters can be sent as the rows of one VALUES block.
+
+    Parameters that are strings are treated as identifiers (IRIs). Literals should be
+    passed as rdflib.Literal, or as ints, floats and bools.
+    """
+    where_pattern = re.compile(r"WHERE\s*\{", re.IGNORECASE)
+    # Characters that can't appear in an IRI reference; they'd let a value escape the <...>
+    invalid_iri = re.compile(r'[<>"{}|^`\\\s]')
+
+    def __init__(self, text: str, parameters):
+        """
+        :param text: The query or update. It should use '?{parameter}' for each parameter
+        :param parameters: The names of the parameters, without the '?'
+        """
+        self.text = text
+        self.parameters = list(parameters)
+        match = self.where_pattern.search(text)
+        if match is None:
+            raise ValueError("A query template needs a WHERE clause to bind its parameters in")
+        self.insert_at = match.end()
+
+    @classmethod
+    def term(cls, value) -> rdflib.term.Node:
+        """
+        Turns a parameter value into an RDF term.
+
+        :param value: An identifier, rdflib term or Python literal
+        :return: The rdflib term
+        """
+        if isinstance(value, rdflib.term.Node):
+            return value
+        if isinstance(value, str):
+            value = value.strip("<>")
+            if cls.invalid_iri.search(value):
+                raise ValueError(f"'{value}' isn't a valid identifier")
+            return rdflib.URIRef(value)
+        return rdflib.Literal(value)
+
+    def bindings(self, values: dict) -> dict:
+        """
+        Turns a dictionary of parameter values into rdflib terms.
+
+        :param values: A dictionary of parameter name to value
+        :return: A dictionary of parameter name to rdflib term
+        """
+        if set(values) != set(self.parameters):
+            raise ValueError(f"Expected the parameters {self.parameters}, got {sorted(values)}")
+        return {name: self.term(values[name]) for name in self.parameters}
+
+    def render(self, rows) -> str:
+        """
+        Writes the template out with its parameters in a VALUES block.
+
+        :param rows: A dictionary of parameter values, or a list of them to run the template
+                     for several sets of parameters at once
+        :return: The SPARQL text
+        """
+        if isinstance(rows, dict):
+            rows = [rows]
+        variables = " ".join(f"?{name}" for name in self.parameters)
+        lines = []
+        for row in rows:
+            bindings = self.bindings(row)
+            lines.append("(" + " ".join(bindings[name].n3() for name in self.parameters) + ")")
+        values = f"\n VALUES ({variables}) {{ {' '.join(lines)} }}\n"
+        return self.text[:self.insert_at] + values + self.text[self.insert_at:]
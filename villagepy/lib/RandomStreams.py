@@ -0,0 +1,109 @@
+import hashlib
+import uuid
+import numpy as np
+
+
+class RandomStreams:
+    """
+    A counter-based source of random numbers. Every draw is a hash of the run's seed, the
+    subsystem asking for it, a key (usually a family or winik identifier), the step and a
+    draw counter. Nothing is consumed from a shared generator, so the values don't depend
+    on the order that families are processed in, and drawing for a whole array of keys at
+    once gives exactly the same values as drawing for each key on its own.
+    """
+    def __init__(self, seed=None):
+        """
+        :param seed: The seed of the run. A random one is chosen (and kept in self.seed)
+                     when it isn't given so that the run can be reproduced later.
+        """
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy) % 2 ** 64
+        self.seed = seed
+        self.hashes = {}
+
+    def hash(self, value) -> int:
+        """
+        Hashes a key into 64 bits. Python's hash() is salted per process, so a stable hash
+        is used instead.
+
+        :param value: The key being hashed
+        :return: The 64 bit hash
+        """
+        if value not in self.hashes:
+            digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+            self.hashes[value] = int.from_bytes(digest, "little")
+        return self.hashes[value]
+
+    @staticmethod
+    def mix(x: np.ndarray) -> np.ndarray:
+        """
+        The splitmix64 finalizer. It scrambles the bits of each value so that neighbouring
+        inputs give unrelated outputs.
+
+        :param x: An array of uint64 values
+        :return: The scrambled values
+        """
+        with np.errstate(over="ignore"):
+            x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            return x ^ (x >> np.uint64(31))
+
+    def bits(self, subsystem: str, keys, step, draw: int = 0) -> np.ndarray:
+        """
+        Gets 64 random bits for each key.
+
+        :param subsystem: The name of the subsystem drawing the numbers (ie "coast")
+        :param keys: A list of keys, one draw is made for each
+        :param step: The current step
+        :param draw: Which draw this is, when a key needs more than one number in a step
+        :return: An array of uint64 values
+        """
+        key_hashes = np.array([self.hash(key) for key in keys], dtype=np.uint64)
+        state = np.uint64(self.seed % 2 ** 64) ^ np.uint64(self.hash(subsystem))
+        with np.errstate(over="ignore"):
+            x = self.mix(np.full(len(key_hashes), state, dtype=np.uint64) ^ key_hashes)
+            x = self.mix(x ^ np.uint64(self.hash(step)))
+            return self.mix(x + np.uint64(draw) * np.uint64(0x9E3779B97F4A7C15))
+
+    def integers(self, subsystem: str, keys, step, low: int, high: int, draw: int = 0) -> np.ndarray:
+        """
+        Draws one integer in [low, high) for each key.
+
+        :param subsystem: The name of the subsystem drawing the numbers
+        :param keys: A list of keys
+        :param step: The current step
+        :param low: The lowest value that can be drawn
+        :param high: One more than the highest value that can be drawn
+        :param draw: Which draw this is, when a key needs more than one number in a step
+        :return: An array of int64 values
+        """
+        # Use the top 53 bits as a uniform float so small ranges aren't biased
+        uniform = (self.bits(subsystem, keys, step, draw) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+        return low + np.floor(uniform * (high - low)).astype(np.int64)
+
+    def integer(self, subsystem: str, key, step, low: int, high: int, draw: int = 0) -> int:
+        """
+        Draws an integer in [low, high) for a single key.
+
+        :param subsystem: The name of the subsystem drawing the number
+        :param key: The key
+        :param step: The current step
+        :param low: The lowest value that can be drawn
+        :param high: One more than the highest value that can be drawn
+        :param draw: Which draw this is, when the key needs more than one number in a step
+        :return: The integer
+        """
+        return int(self.integers(subsystem, [key], step, low, high, draw)[0])
+
+    def uuid(self, subsystem: str, key, step) -> str:
+        """
+        Makes a random (version 4) UUID that's reproducible from the seed.
+
+        :param subsystem: The name of the subsystem asking for the UUID
+        :param key: The key
+        :param step: The current step
+        :return: The UUID as a string
+        """
+        high = int(self.bits(subsystem, [key], step, draw=0)[0])
+        low = int(self.bits(subsystem, [key], step, draw=1)[0])
+        return str(uuid.UUID(int=(high << 64) | low, version=4))
@@ -0,0 +1,154 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Future
+
+
+class SnapshotWriter:
+    """
+    Writes graph_{step}.ttl snapshots on a background thread so that the export streams
+    to disk while the next step runs. Snapshots wait in a bounded queue; when it's full,
+    submitting another one blocks until the thread catches up.
+
+    Each snapshot is written to a .part file and renamed when it's complete, so a
+    graph_{step}.ttl (or .ttl.gz) file is always a whole checkpoint that a run can be
+    resumed from. The identifier counters from the same point in the run are written to
+    ids_{step}.json before the snapshot is renamed.
+    """
+    pattern = re.compile(r"^graph_(\d+)\.ttl(\.gz)?$")
+
+    def __init__(self, directory="history", compress=False, queue_size: int = 1):
+        """
+        :param directory: The directory that the snapshots are written to
+        :param compress: Whether the snapshots are gzipped
+        :param queue_size: The maximum number of snapshots waiting to be written
+        """
+        self.directory = directory
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, name="SnapshotWriter", daemon=True)
+        self.thread.start()
+
+    def path(self, step: int) -> str:
+        """
+        Gets the path of a step's snapshot.
+
+        :param step: The step
+        :return: The path
+        """
+        return os.path.join(self.directory, f"graph_{step}.ttl" + (".gz" if self.compress else ""))
+
+    @classmethod
+    def ids_path(cls, directory, step: int) -> str:
+        """
+        Gets the path of the identifier counters that go with a step's snapshot.
+
+        :param directory: The directory holding the snapshots
+        :param step: The step
+        :return: The path
+        """
+        return os.path.join(directory, f"ids_{step}.json")
+
+    def submit(self, step: int, query, ids=None) -> Future:
+        """
+        Queues a snapshot of a store.
+
+        :param step: The step that the snapshot is of
+        :param query: The store backend (Query or LocalQuery) that's exported
+        :param ids: The identifier counters at the snapshot (see IdentityManager.checkpoint)
+        :return: A Future that's resolved with the snapshot's path once it's written
+        """
+        future = Future()
+        self.queue.put((step, query, ids, future))
+        return future
+
+    def run(self) -> None:
+        """
+        Writes the queued snapshots until close() is called.
+
+        :return: None
+        """
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            step, query, ids, future = task
+            try:
+                future.set_result(self.write(step, query, ids))
+            except Exception as error:
+                logging.exception(f"Failed to write the snapshot of step {step}")
+                future.set_exception(error)
+
+    def write(self, step: int, query, ids=None) -> str:
+        """
+        Streams a store's export to disk.
+
+        :param step: The step that the snapshot is of
+        :param query: The store backend that's exported
+        :param ids: The identifier counters at the snapshot, or None
+        :return: The snapshot's path
+        """
+        if ids is not None:
+            ids_path = self.ids_path(self.directory, step)
+            with open(f"{ids_path}.part", "w") as f:
+                json.dump(ids, f)
+            os.replace(f"{ids_path}.part", ids_path)
+        path = self.path(step)
+        partial = f"{path}.part"
+        logging.info(f"Writing snapshot {path}")
+        opener = gzip.open if self.compress else open
+        with opener(partial, "wb") as f:
+            query.export(f)
+        os.replace(partial, path)
+        return path
+
+    def close(self) -> None:
+        """
+        Waits for the queued snapshots to be written and stops the thread.
+
+        :return: None
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def latest(cls, directory="history"):
+        """
+        Finds the most recent complete snapshot in a directory.
+
+        :param directory: The directory holding the snapshots
+        :return: A tuple of (step, path), or None when there aren't any snapshots
+        """
+        snapshots = []
+        if os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                match = cls.pattern.match(filename)
+                if match:
+                    snapshots.append((int(match.group(1)), os.path.join(directory, filename)))
+        return max(snapshots) if snapshots else None
+
+    @classmethod
+    def read_ids(cls, directory, step: int):
+        """
+        Reads the identifier counters that were saved with a step's snapshot.
+
+        :param directory: The directory holding the snapshots
+        :param step: The step
+        :return: The dictionary of counters, or None when the snapshot doesn't have them
+        """
+        path = cls.ids_path(directory, step)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
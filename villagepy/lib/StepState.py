@@ -0,0 +1,87 @@
+class StepState:
+    """
+    A snapshot of the village that's taken with a few bulk queries at the start of a step.
+    The subsystems read their inputs from it instead of querying the graph once per
+    family, so the number of reads in a step doesn't grow with the number of families.
+
+    Writes made during a step are buffered until the end of the step, so the snapshot
+    holds exactly what the per-family queries would have returned.
+    """
+    def __init__(self, winik_records, resource_records, emergency_records):
+        """
+        Indexes the records returned by MayaGraph.get_winik_records,
+        MayaGraph.get_resource_records and MayaGraph.get_emergency_records.
+
+        :param winik_records: An iterable of winik tuples
+        :param resource_records: An iterable of resource tuples
+        :param emergency_records: An iterable of calorie emergency tuples
+        """
+        # Living winiks in each family
+        self.winiks = {}
+        # Living winiks by identifier
+        self.index = {}
+        # The ages of each mother's children, living or dead
+        self.children = {}
+        seen = set()
+        for winik_id, age, gender, health, alive, profession, family_id, partner, mother, last_name in winik_records:
+            # A winik shows up once for each partner; only count it once
+            if winik_id in seen:
+                continue
+            seen.add(winik_id)
+            if mother:
+                self.children.setdefault(mother, []).append(age)
+            if alive:
+                winik = {
+                    "id": winik_id,
+                    "age": age,
+                    "gender": gender,
+                    "health": health,
+                    "profession": profession,
+                    "partner": partner,
+                    "last_name": last_name,
+                    "family": family_id,
+                }
+                self.winiks.setdefault(family_id, []).append(winik)
+                self.index[winik_id] = winik
+
+        # {family: {resource name: {"quantity": count, "id": resource identifier}}}
+        self.resources = {}
+        for family_id, resource_id, name, quantity in resource_records:
+            self.resources.setdefault(family_id, {})[name] = {"quantity": quantity, "id": resource_id}
+
+        # Calorie emergencies of each family, as SPARQL JSON bindings
+        self.emergencies = {}
+        for family_id, emergency_id, is_active, start_date in emergency_records:
+            self.emergencies.setdefault(family_id, []).append({
+                "emergency": {"type": "uri", "value": emergency_id},
+                "is_active": {"type": "literal", "value": is_active},
+                "start_date": {"type": "literal", "value": start_date},
+            })
+
+    def families(self) -> list:
+        """
+        Gets the families that have at least one living winik.
+
+        :return: A list of family identifiers, ordered by identifier like
+                 MayaGraph.get_living_families
+        """
+        return sorted(self.winiks)
+
+    def living_winiks(self, family_id) -> list:
+        """
+        Gets the living winiks in a family.
+
+        :param family_id: The identifier of the family
+        :return: A list of winik dictionaries
+        """
+        return self.winiks.get(family_id, [])
+
+    def profession_count(self, family_id, profession: str) -> int:
+        """
+        Counts the living winiks in a family that have a profession.
+
+        :param family_id: The identifier of the family
+        :param profession: The name of the profession
+        :return: The number of winiks with that profession
+        """
+        return sum(1 for winik in self.living_winiks(family_id) if winik["profession"] == profession)
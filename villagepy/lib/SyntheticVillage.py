@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+class SyntheticVillage:
+    """
+    Generates villages of any size in the same format as data/fam_bam_06.csv, so that
+    triplification and the model can be measured at scales that the real data doesn't
+    reach. Each family starts with a partnered couple, and the rest of its winiks are
+    their children.
+    """
+    columns = ["identifier", "first_name", "last_name", "age", "mother_id", "father_id", "profession",
+               "partner", "children", "gender", "alive", "health", "fam_id"]
+    professions = ["forager", "fisher", "farmer"]
+    # The age (in days) that winiks can be partnered at
+    adult_age = 5844
+    max_age = 80 * 365
+
+    def __init__(self, families: int, winiks_per_family: int, age_distribution="pyramid", seed=0):
+        """
+        :param families: The number of families
+        :param winiks_per_family: The number of winiks in each family. It's at least 2, for the
+                                  couple that heads the family
+        :param age_distribution: How the ages are drawn; 'pyramid' (mostly young winiks),
+                                 'uniform' or 'adult' (every winik is old enough to partner)
+        :param seed: The seed for the generator
+        """
+        if age_distribution not in ("pyramid", "uniform", "adult"):
+            raise ValueError(f"Unknown age distribution '{age_distribution}'")
+        self.families = families
+        self.winiks_per_family = max(2, winiks_per_family)
+        self.age_distribution = age_distribution
+        self.seed = seed
+
+    def ages(self, rng, count: int) -> np.ndarray:
+        """
+        Draws ages in days.
+
+        :param rng: The NumPy generator
+        :param count: The number of ages to draw
+        :return: An array of ages
+        """
+        if self.age_distribution == "uniform":
+            ages = rng.integers(0, self.max_age, count)
+        elif self.age_distribution == "adult":
+            ages = rng.integers(self.adult_age, self.max_age, count)
+        else:
+            ages = rng.exponential(25 * 365, count)
+        return np.clip(ages, 0, self.max_age).astype(np.int64)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Generates the village.
+
+        :return: A data frame with one row per winik
+        """
+        rng = np.random.default_rng(self.seed)
+        size = self.families * self.winiks_per_family
+        family = np.repeat(np.arange(self.families), self.winiks_per_family)
+        position = np.tile(np.arange(self.winiks_per_family), self.families)
+        identifier = np.arange(1, size + 1)
+        founder = position < 2
+        # The couple heading the family is the first two winiks; 0 is the father, 1 the mother
+        father = identifier - position
+        mother = father + 1
+
+        ages = self.ages(rng, size)
+        parent_ages = rng.integers(self.adult_age * 2, self.max_age, self.families)
+        ages[founder] = parent_ages[family[founder]]
+        # Children are at least an adult's age younger than their parents
+        ages[~founder] = np.minimum(ages[~founder], parent_ages[family[~founder]] - self.adult_age)
+
+        gender = np.where(position == 0, "M", np.where(position == 1, "F", rng.choice(["M", "F"], size)))
+        partner = np.where(position == 0, identifier + 1, np.where(position == 1, identifier - 1, np.nan))
+        children = np.where(founder, self.winiks_per_family - 2, 0)
+        frame = pd.DataFrame({
+            "identifier": identifier,
+            "first_name": [f"w{i}" for i in identifier],
+            "last_name": [f"f{i}" for i in family],
+            "age": ages,
+            "mother_id": np.where(founder, -2, mother),
+            "father_id": np.where(founder, -1, father),
+            "profession": rng.choice(self.professions, size),
+            "partner": partner,
+            "children": children,
+            "gender": gender,
+            "alive": True,
+            "health": 100,
+            "fam_id": [f"f{i}" for i in family],
+        })
+        return frame[self.columns]
+
+    def write(self, path) -> None:
+        """
+        Writes the village as a winik CSV file that InitialGraph can read.
+
+        :param path: The path of the CSV file
+        :return: None
+        """
+        self.to_frame().to_csv(path)
@@ -0,0 +1,178 @@
+import rdflib
+
+
+class WriteBuffer:
+    """
+    Collects the mutations that are made to the graph during a step so that they can be
+    sent as a single SPARQL update. Repeated writes to the same subject and predicate are
+    merged, keeping only the last value.
+
+    Raw updates (ie pattern based DELETE/INSERT queries) and deferred writes are kept in the
+    order that they were buffered. Values that are set between two raw updates are merged with each other,
+    but never across a raw update, so the final state of the graph is the same as if each
+    write had been posted on its own.
+    """
+    def __init__(self):
+        self.operations = []
+
+    def __len__(self):
+        count = 0
+        for operation in self.operations:
+            if isinstance(operation, str) or callable(operation):
+                count += 1
+            else:
+                count += len(operation["values"]) + len(operation["inserts"])
+        return count
+
+    def set(self, subject, predicate: str, value) -> None:
+        """
+        Replaces every value that a subject has for a predicate with a new value.
+
+        :param subject: The identifier of the node being changed
+        :param predicate: The prefixed predicate (ie maya:hasHealth)
+        :param value: The new value. Identifiers should be passed as rdflib.URIRef
+        :return: None
+        """
+        self.current()["values"][(self.node(subject), predicate)] = self.term(value)
+
+    def insert(self, subject, predicate: str, value) -> None:
+        """
+        Adds a triple without removing any of the subject's existing values.
+
+        :param subject: The identifier of the node
+        :param predicate: The prefixed predicate (ie maya:hasChild)
+        :param value: The value. Identifiers should be passed as rdflib.URIRef
+        :return: None
+        """
+        self.current()["inserts"].append(f"{self.node(subject)} {predicate} {self.term(value)} .")
+
+    def update(self, query: str) -> None:
+        """
+        Buffers a raw SPARQL update.
+
+        :param query: The SPARQL update, including its prefixes
+        :return: None
+        """
+        self.operations.append(query.strip())
+
+    def defer(self, write) -> None:
+        """
+        Buffers a write that's only made when this buffer is appended to another one. It's
+        for writes that take new identifiers in a buffer that's filled by one of several
+        threads, so the identifiers are handed out in the order that the buffers are merged.
+
+        :param write: A function that's called with the WriteBuffer being appended to
+        :return: None
+        """
+        self.operations.append(write)
+
+    def extend(self, other) -> None:
+        """
+        Appends the writes of another buffer, as if they had been made on this one after
+        every write that it already holds. Its deferred writes are made as they're reached.
+
+        :param other: The WriteBuffer being appended
+        :return: None
+        """
+        for operation in other.operations:
+            if callable(operation):
+                operation(self)
+            elif isinstance(operation, str):
+                self.update(operation)
+            else:
+                group = self.current()
+                group["values"].update(operation["values"])
+                group["inserts"].extend(operation["inserts"])
+
+    def current(self) -> dict:
+        """
+        Returns the group of values that's currently being collected, starting a new one if
+        a raw update or a deferred write was buffered after it.
+
+        :return: The group of values and inserts
+        """
+        if not self.operations or not isinstance(self.operations[-1], dict):
+            self.operations.append({"values": {}, "inserts": []})
+        return self.operations[-1]
+
+    def to_updates(self) -> list:
+        """
+        Builds the SPARQL update operations for the buffered writes, in the order that they
+        need to be run.
+
+        :return: A list of SPARQL updates
+        """
+        prefixes = """
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
+            PREFIX maya: <https://maya.com#>
+        """
+        updates = []
+        for operation in self.operations:
+            if isinstance(operation, str):
+                updates.append(operation)
+                continue
+            values = operation["values"]
+            if values:
+                keys = "\n".join(f"({subject} {predicate})" for subject, predicate in values)
+                updates.append(prefixes + """
+            DELETE {
+                ?s ?p ?o .
+            } WHERE {
+                VALUES (?s ?p) {
+                    """+keys+"""
+                }
+                ?s ?p ?o .
+            }""")
+            triples = [f"{subject} {predicate} {value} ." for (subject, predicate), value in values.items()]
+            triples += operation["inserts"]
+            if triples:
+                updates.append(prefixes + """
+            INSERT DATA {
+                """+"\n".join(triples)+"""
+            }""")
+        return updates
+
+    def to_update(self) -> str:
+        """
+        Builds a single SPARQL update request out of the buffered writes. The operations
+        are separated with ';' so that the store runs them in one transaction.
+
+        :return: The SPARQL update
+        """
+        return " ;\n".join(self.to_updates())
+
+    def clear(self) -> None:
+        """
+        Drops all of the buffered writes.
+
+        :return: None
+        """
+        self.operations = []
+
+    @staticmethod
+    def node(identifier) -> str:
+        """
+        Returns the SPARQL form of a node identifier.
+
+        :param identifier: The identifier, with or without angle brackets
+        :return: The identifier wrapped in angle brackets
+        """
+        return rdflib.URIRef(str(identifier).strip("<>")).n3()
+
+    @staticmethod
+    def term(value) -> str:
+        """
+        Returns the SPARQL form of a value.
+
+        :param value: A python value or an rdflib term
+        :return: The value as a SPARQL term
+        """
+        if isinstance(value, rdflib.term.Node):
+            return value.n3()
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (int, float)):
+            return str(value)
+        return rdflib.Literal(value).n3()
+
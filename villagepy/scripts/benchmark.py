@@ -0,0 +1,120 @@
+"""
+Times triplification, loading, a full model step and each of the model's subsystems on
+synthetic villages of increasing size, against a local store.
+
+Run it from the scripts directory (InitialGraph reads the ontology from ../onto):
+
+    python benchmark.py --sizes 1000 10000 100000 --output benchmarks.jsonl
+
+Every measurement is appended to the output as one JSON object per line, tagged with the
+git commit, so runs from different commits can be compared.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+from villagepy.lib.InitialGraph import InitialGraph
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.lib.Profiler import Profiler
+from villagepy.lib.SyntheticVillage import SyntheticVillage
+
+resource_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "resources.csv")
+
+
+def commit() -> str:
+    """
+    Gets the commit that's being measured.
+
+    :return: The commit hash, or 'unknown' outside of a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark(size: int, winiks_per_family: int, age_distribution: str, steps: int, seed: int) -> list:
+    """
+    Measures one village size.
+
+    :param size: The approximate number of winiks in the village
+    :param winiks_per_family: The number of winiks in each family
+    :param age_distribution: The village's age distribution (see SyntheticVillage)
+    :param steps: The number of model steps to run
+    :param seed: The seed for the village and the model
+    :return: A list of measurements
+    """
+    village = SyntheticVillage(max(1, size // winiks_per_family), winiks_per_family, age_distribution, seed)
+    rows = []
+
+    def measure(stage, seconds, step=None, **counters):
+        rows.append(dict(size=size, families=village.families, winiks=village.families * village.winiks_per_family,
+                         age_distribution=age_distribution, stage=stage, step=step, seconds=seconds, **counters))
+        logging.info(f"{size} winiks, {stage}: {seconds:.3f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        winik_file = os.path.join(directory, "village.csv")
+        village.write(winik_file)
+
+        start = time.perf_counter()
+        initial_graph = InitialGraph(winik_file, resource_file)
+        initial_graph.add_winiks()
+        initial_graph.add_resources()
+        measure("triplification", time.perf_counter() - start, triples=len(initial_graph.database))
+
+        start = time.perf_counter()
+        InitialGraph(winik_file, resource_file).create_initial_triples(os.path.join(directory, "village.nt"))
+        measure("streaming triplification", time.perf_counter() - start)
+
+        turtle_file = os.path.join(directory, "village.ttl")
+        start = time.perf_counter()
+        initial_graph.database.serialize(turtle_file, format="turtle")
+        measure("serialization", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        query = LocalQuery(turtle_file)
+        measure("load", time.perf_counter() - start)
+
+        model = Model(query=query, seed=seed)
+        profiler = Profiler()
+        model.attach_profiler(profiler)
+        for step in range(steps):
+            profiler.start_step(step)
+            start = time.perf_counter()
+            model.run_step(step)
+            measure("step", time.perf_counter() - start, step)
+            for subsystem, counters in sorted(profiler.end_step().items()):
+                measure(subsystem, counters["seconds"], step, reads=counters["reads"], updates=counters["updates"],
+                        bytes_sent=counters["bytes_sent"], bytes_received=counters["bytes_received"],
+                        rows=counters["rows"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the model on synthetic villages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="The number of winiks in each village")
+    parser.add_argument("--winiks-per-family", type=int, default=12)
+    parser.add_argument("--age-distribution", choices=["pyramid", "uniform", "adult"], default="pyramid")
+    parser.add_argument("--steps", type=int, default=1, help="The number of model steps to time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks.jsonl")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    revision = commit()
+    for size in args.sizes:
+        rows = benchmark(size, args.winiks_per_family, args.age_distribution, args.steps, args.seed)
+        with open(args.output, "a") as f:
+            for row in rows:
+                f.write(json.dumps(dict(commit=revision, **row)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
+import sys
+
 from villagepy.lib.InitialGraph import InitialGraph
 
 # Generate the initial graph
 initial_graph = InitialGraph("../data/fam_bam_06.csv", "../data/resources.csv")
-initial_graph.create_initial_turtle()
+if "--stream" in sys.argv:
+    # Write the triples as they're generated instead of building the graph in memory
+    initial_graph.create_initial_triples("initial_state.nt")
+else:
+    initial_graph.create_initial_turtle()
@@ -1,6 +1,124 @@
+import gzip
+import logging
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from rdflib import Graph
+from rdflib import Graph, Namespace
+
+from villagepy.lib.History import HistoryReader
+
+maya = Namespace("https://maya.com#")
+
+resource_columns = {"step": np.int64, "family": str, "name": str, "quantity": np.float64}
+winik_columns = {"step": np.int64, "id": str, "family": str, "age": np.int64, "health": np.float64,
+                 "alive": bool, "profession": str}
+
+
+def step_number(filename: str):
+    """
+    Gets the step of a graph_{step}.ttl (or gzipped graph_{step}.ttl.gz) snapshot.
+
+    :param filename: The name of the snapshot file
+    :return: The step, or None if the file isn't a snapshot
+    """
+    match = re.match(r"^graph_(\d+)\.ttl(\.gz)?$", filename)
+    return int(match.group(1)) if match else None
+
+
+def parse_snapshot(path: str) -> Graph:
+    """
+    Parses a turtle snapshot, which may be gzipped.
+
+    :param path: The path to the snapshot
+    :return: The graph
+    """
+    graph = Graph()
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            graph.parse(f, format="turtle")
+    else:
+        graph.parse(path, format="turtle")
+    return graph
+
+
+def extract_records(graph: Graph, step: int = 0):
+    """
+    Pulls the resource counts and winik state out of a graph by walking its triples
+    directly, which is much faster than running SPARQL against every snapshot.
+
+    A snapshot is saved before its step runs, so the winiks' ages are the ones they had on
+    the step before it (or on the step they died). Snapshots from before winiks had birth
+    steps store the ages themselves.
+
+    :param graph: The graph holding one step of the simulation
+    :param step: The step that the graph holds
+    :return: A tuple of (resource rows, winik rows). Resource rows are (family, name, quantity)
+             and winik rows are (winik, family, age, health, alive, profession).
+    """
+    resources = []
+    for family, resource in graph.subject_objects(maya.hasResource):
+        name = graph.value(resource, maya.hasName)
+        quantity = graph.value(resource, maya.hasQuantity)
+        if name is not None and quantity is not None:
+            resources.append((str(family), str(name), float(quantity)))
+    ages = [(winik, int(age)) for winik, age in graph.subject_objects(maya.hasAge)]
+    for winik, birth in graph.subject_objects(maya.hasBirthStep):
+        death = graph.value(winik, maya.hasDeathStep)
+        last = step - 1 if death is None else min(step - 1, int(death))
+        ages.append((winik, last - int(birth)))
+    winiks = []
+    for winik, age in ages:
+        health = graph.value(winik, maya.hasHealth)
+        alive = graph.value(winik, maya.isAlive)
+        winiks.append((str(winik), str(graph.value(winik, maya.hasFamily) or ""), int(age),
+                       np.nan if health is None else float(health),
+                       alive is not None and alive.toPython() is True,
+                       str(graph.value(winik, maya.hasProfession) or "")))
+    return resources, winiks
+
+
+def extract_columns(step: int, graph: Graph) -> dict:
+    """
+    Pulls the records out of one step's graph as numpy columns, which are much smaller to
+    send between processes than the graph itself.
+
+    :param step: The step that the graph holds
+    :param graph: The graph holding the step
+    :return: A dictionary of '{table}_{column}' to numpy arrays
+    """
+    resources, winiks = extract_records(graph, step)
+    columns = {}
+    for table, rows, dtypes in (("resource", resources, resource_columns), ("winik", winiks, winik_columns)):
+        columns[f"{table}_step"] = np.full(len(rows), step, dtype=np.int64)
+        for position, (column, dtype) in enumerate(list(dtypes.items())[1:]):
+            columns[f"{table}_{column}"] = np.array([row[position] for row in rows], dtype=dtype)
+    return columns
+
+
+def index_snapshot(path: str, step: int) -> list:
+    """
+    Parses one turtle snapshot and extracts its records. This runs in the worker processes.
+
+    :param path: The path to the snapshot
+    :param step: The step that the snapshot holds
+    :return: A list holding a (step, columns) tuple
+    """
+    return [(step, extract_columns(step, parse_snapshot(path)))]
+
+
+def index_history(directory: str, start: int, stop) -> list:
+    """
+    Replays a run of steps from a keyframe/delta history and extracts their records. This
+    runs in the worker processes.
+
+    :param directory: The history directory
+    :param start: The keyframe that the run starts at
+    :param stop: The step that the run stops before, or None to read to the end
+    :return: A list of (step, columns) tuples
+    """
+    return [(step, extract_columns(step, graph)) for step, graph in HistoryReader(directory).iter_graphs(start, stop)]
 
 
 class DataManager:
@@ -8,13 +126,23 @@ class DataManager:
     A class that's used to load and query data from the simulation.
     """
 
-    def __init__(self, data_directory):
+    index_name = "index.npz"
+
+    def __init__(self, data_directory, index_path=None):
+        """
+        :param data_directory: The directory holding the simulation history. This is either
+                               the graph_{step}.ttl files from Model.run or a keyframe/delta history
+        :param index_path: Where the columnar index is cached. Defaults to index.npz in the data directory
+        """
         self.data_directory = data_directory
+        self.index_path = index_path or os.path.join(data_directory, self.index_name)
+        self.index = None
         self.current_record: Graph = None
         path, dirs, files = next(os.walk(data_directory))
-        # DEVNOTE: These aren't actually properly sorted. Avoid using for now
-        self.files = sorted(files)
-        self.record_count = len(files)
+        # Snapshots are ordered by their step number; anything else goes after them
+        self.files = sorted((file for file in files if file != self.index_name),
+                            key=lambda file: (step_number(file) is None, step_number(file) or 0, file))
+        self.record_count = len(self.files)
         # There should be more than 0 data files
         assert self.record_count > 0
 
@@ -25,50 +153,148 @@ class DataManager:
         :param filename: The name of the file holding the graph. It should include the .ttl extension
         :return:
         """
-        self.current_record = Graph()
-        self.current_record.parse(f'{self.data_directory}/{filename}', format="turtle")
+        self.current_record = parse_snapshot(f'{self.data_directory}/{filename}')
 
-    def get_family_resources(self, family_id, step=None):
+    def snapshot_files(self) -> list:
         """
-        Gets a list of data frames that contain the counts of each resource for a particular
-        family.
+        Gets the graph_{step}.ttl files in the data directory.
 
-        :param family_id:
-        :param step: The timestep to get the data for. If None, it will iterate over all data files
-        :return: A list of .....
+        :return: A list of (step, file name) tuples, ordered by step
         """
-        query = """
-                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX maya: <https://maya.com#>
-                PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                SELECT ?name ?quantity WHERE {
-                    BIND(<"""+str(family_id)+"""> AS ?family)
-                    ?resource rdf:type maya:Resource .
-                    ?family maya:hasResource ?resource .
-                    ?resource maya:hasName ?name .
-                    ?resource maya:hasQuantity ?quantity .
-                }
-                """
-        if not step:
-
-            records = []
-
-            for file in self.files:
-                self.load_file(file)
-                results = self.current_record.query(query)
-                rows = []
-                row_record = {}
-                for row in results:
-                    row_record.update({str(row[0]): float(row[1])}.copy())
-                records.append(row_record)
-            records = pd.DataFrame.from_records(records)
-            return records
+        return [(step_number(file), file) for file in self.files if step_number(file) is not None]
+
+    def history_steps(self) -> list:
+        """
+        Gets the steps that are recorded in the data directory.
+
+        :return: A sorted list of steps
+        """
+        if HistoryReader.is_history(self.data_directory):
+            return HistoryReader(self.data_directory).steps()
+        return [step for step, file in self.snapshot_files()]
+
+    def sources(self) -> list:
+        """
+        Describes the files that the index is built from by their name, size and modification
+        time, so an index that was built from files which have since been rewritten is noticed.
+
+        :return: A list of 'name:size:mtime' strings, ordered by name
+        """
+        if HistoryReader.is_history(self.data_directory):
+            files = [file for file in os.listdir(self.data_directory) if HistoryReader.pattern.match(file)]
         else:
-            self.load_file(0)
+            files = [file for step, file in self.snapshot_files()]
+        sources = []
+        for file in sorted(files):
+            stat = os.stat(os.path.join(self.data_directory, file))
+            sources.append(f"{file}:{stat.st_size}:{stat.st_mtime_ns}")
+        return sources
+
+    def index_tasks(self) -> list:
+        """
+        Splits the history into pieces of work that can be indexed independently. Each
+        turtle snapshot is its own piece; a keyframe/delta history is split at its keyframes.
+
+        :return: A list of (function, arguments) tuples
+        """
+        if not HistoryReader.is_history(self.data_directory):
+            return [(index_snapshot, (os.path.join(self.data_directory, file), step))
+                    for step, file in self.snapshot_files()]
+        keyframes = sorted(HistoryReader(self.data_directory).keyframes)
+        stops = keyframes[1:] + [None]
+        return [(index_history, (self.data_directory, start, stop)) for start, stop in zip(keyframes, stops)]
+
+    def build_index(self, processes=None) -> dict:
+        """
+        Reads every step of the history once and writes the resource counts and winik state
+        to a columnar table. There's one resource row per step, family and resource and one
+        winik row per step and winik.
+
+        :param processes: The number of worker processes that parse the history. Defaults to
+                          the number of CPUs; use 1 to parse in this process.
+        :return: The index, as a dictionary of numpy arrays
+        """
+        # Taken before the files are read, so files that change while they're read aren't trusted
+        sources = self.sources()
+        tasks = self.index_tasks()
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or len(tasks) == 1:
+            results = [function(*arguments) for function, arguments in tasks]
+        else:
+            logging.info(f"Indexing {len(tasks)} pieces of history with {processes} processes")
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(function, *arguments) for function, arguments in tasks]
+                results = [future.result() for future in futures]
+        # The workers may finish in any order, so put the steps back in numeric order
+        chunks = [columns for step, columns in sorted((chunk for result in results for chunk in result),
+                                                      key=lambda chunk: chunk[0])]
+
+        index = {"steps": np.array(self.history_steps(), dtype=np.int64), "sources": np.array(sources, dtype=str)}
+        for table, dtypes in (("resource", resource_columns), ("winik", winik_columns)):
+            for column, dtype in dtypes.items():
+                key = f"{table}_{column}"
+                index[key] = np.concatenate([chunk[key] for chunk in chunks]) if chunks else np.array([], dtype=dtype)
+        np.savez_compressed(self.index_path, **index)
+        self.index = index
+        return index
+
+    def get_index(self) -> dict:
+        """
+        Loads the columnar index, building it first if it's missing or any of the files in
+        the data directory were added, removed or rewritten since it was built.
 
-            results = self.current_record.query(query)
-            assert len(results["results"]["bindings"])
-            family_resources = results["results"]["bindings"][0]
+        :return: The index, as a dictionary of numpy arrays
+        """
+        if self.index is not None:
+            return self.index
+        if os.path.exists(self.index_path):
+            with np.load(self.index_path) as cached:
+                index = {key: cached[key] for key in cached.files}
+            if "sources" in index and index["sources"].tolist() == self.sources():
+                self.index = index
+                return index
+            logging.info("The history index is out of date, rebuilding it")
+        return self.build_index()
+
+    def get_resource_table(self) -> pd.DataFrame:
+        """
+        Gets the resource counts of every family at every step.
+
+        :return: A data frame with step, family, name and quantity columns
+        """
+        index = self.get_index()
+        return pd.DataFrame({column: index[f"resource_{column}"] for column in ("step", "family", "name", "quantity")})
+
+    def get_winik_table(self) -> pd.DataFrame:
+        """
+        Gets the state of every winik at every step.
+
+        :return: A data frame with step, id, family, age, health, alive and profession columns
+        """
+        index = self.get_index()
+        return pd.DataFrame({column: index[f"winik_{column}"]
+                             for column in ("step", "id", "family", "age", "health", "alive", "profession")})
+
+    def get_family_resources(self, family_id, step=None):
+        """
+        Gets the counts of each resource for a particular family.
+
+        :param family_id: The identifier of the family
+        :param step: The timestep to get the data for. If None, every step is returned
+        :return: A data frame with one row per step and one column per resource
+        """
+        index = self.get_index()
+        rows = index["resource_family"] == str(family_id)
+        if step is not None:
+            rows &= index["resource_step"] == step
+        records = pd.DataFrame({
+            "step": index["resource_step"][rows],
+            "name": index["resource_name"][rows],
+            "quantity": index["resource_quantity"][rows],
+        })
+        records = records.pivot_table(index="step", columns="name", values="quantity", aggfunc="first")
+        records.columns.name = None
+        return records
 
     def get_all_winiks(self):
         """
@@ -91,13 +317,9 @@ class DataManager:
         """
         Gets records of all the winiks between the start and end of a simulation.
 
-        :return:
+        :return: A list with a data frame of winiks for each step, in step order
         """
-        winiks = []
-        for file in self.files:
-            self.load_file(file)
-            winiks += [self.get_all_winiks()]
-        return winiks
+        return [winiks for step, winiks in self.get_winik_table().groupby("step", sort=True)]
 
     def get_winiks_step(self, family_id, step):
         """
@@ -108,8 +330,8 @@ class DataManager:
         :return:
         """
         # Load the file into a graph
-        graph = Graph()
-        graph.parse(f'{self.data_directory}/graph_{step}.ttl', format="turtle")
+        path = f'{self.data_directory}/graph_{step}.ttl'
+        graph = parse_snapshot(path if os.path.exists(path) else f'{path}.gz')
 
         query = """
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -128,21 +350,9 @@ class DataManager:
         Returns a list of all of the identifiers of the families IN THE INITIAL CONDITION
         :return:
         """
-        # Load the initial state
-        self.load_file(self.files[0])
-        query = """
-                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX maya: <https://maya.com#>
-                PREFIX fh: <http://www.owl-ontologies.com/Ontology1172270693.owl#>
-                SELECT ?family WHERE {
-                    ?family rdf:type maya:Family.
-                }
-        """
-        identifiers = []
-        results = self.current_record.query(query)
-        for row in results:
-            identifiers += row
-        return identifiers
+        index = self.get_index()
+        first_step = index["resource_step"] == index["steps"].min()
+        return sorted(set(index["resource_family"][first_step].tolist()))
 
     def resource_records_to_df(self, records):
         """
@@ -0,0 +1,32 @@
+"""
+Loads an initial state into GraphDB in chunks, instead of pasting it into the import page.
+
+    python load_initial_state.py initial_state.nt --endpoint http://localhost:7200/repositories/Village \
+        --username admin --password root --batch-size 50000
+
+Large states should be written with `create_initial_graph.py --stream`, since N-Triples
+files are read a line at a time while turtle files are parsed in memory first.
+"""
+import argparse
+import logging
+
+from villagepy.lib.BulkLoader import BulkLoader
+from villagepy.lib.Query import Query
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loads an initial state into a GraphDB repository")
+    parser.add_argument("path", help="The N-Triples (.nt) or turtle file holding the initial state")
+    parser.add_argument("--endpoint", required=True, help="The repository endpoint")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--batch-size", type=int, default=50000, help="The number of triples sent per request")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    query = Query(args.endpoint, args.username, args.password)
+    BulkLoader(query, args.batch_size).load(args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from villagepy.lib.AsyncMayaGraph import AsyncMayaGraph
+from villagepy.lib.AsyncQuery import AsyncQuery
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.MayaGraph import MayaGraph
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for a GraphDB repository that takes a while to answer each query.
+    """
+    protocol_version = "HTTP/1.1"
+    delay = 0.3
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({"head": {"vars": []}, "results": {"bindings": []}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_reads_are_in_flight_together():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/repositories/Tests"
+
+    async def read():
+        async with AsyncQuery.connect(endpoint, None, None, concurrency=4) as query:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(query.get("SELECT * WHERE { ?s ?p ?o }") for _ in range(4)))
+            return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(read())
+    server.shutdown()
+    assert len(results) == 4
+    assert elapsed < 4 * SlowHandler.delay * 0.75
+
+
+def test_async_graph_matches_graph():
+    graph = MayaGraph(query=LocalQuery(initial_state))
+
+    async def read():
+        async with AsyncMayaGraph(graph) as async_graph:
+            return await asyncio.gather(async_graph.get_all_families(),
+                                        async_graph.get_living_with_ages(),
+                                        async_graph.get_partnerable_winiks(),
+                                        async_graph.get_step_state())
+
+    families, ages, partnerable, state = asyncio.run(read())
+    assert sorted(families) == sorted(graph.get_all_families())
+    assert sorted(ages) == sorted(graph.get_living_with_ages())
+    assert partnerable == graph.get_partnerable_winiks()
+    expected = graph.get_step_state()
+    assert state.winiks == expected.winiks
+    assert state.resources == expected.resources
@@ -0,0 +1,35 @@
+import os
+
+from villagepy.lib.BulkLoader import BulkLoader
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.MayaGraph import MayaGraph
+from villagepy.lib.OntologyCache import OntologyCache
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def test_chunked_load_matches_turtle_load():
+    expected = LocalQuery(initial_state)
+    query = LocalQuery()
+    progress = []
+    loaded = BulkLoader(query, batch_size=1000, progress=progress.append).load(initial_state)
+
+    assert loaded == progress[-1] and len(progress) > 1
+    assert len(query.database) == len(expected.database)
+    assert sorted(MayaGraph(query=query).get_living_winiks()) == \
+        sorted(MayaGraph(query=expected).get_living_winiks())
+
+
+def test_streamed_state_loads(monkeypatch, tmp_path):
+    from villagepy.lib.InitialGraph import InitialGraph
+    monkeypatch.chdir(os.path.join(os.path.dirname(__file__), "..", "scripts"))
+    path = str(tmp_path / "initial_state.nt")
+    InitialGraph("../data/fam_bam_06.csv", "../data/resources.csv",
+                 OntologyCache(str(tmp_path / "cache"))).create_initial_triples(path)
+    query = LocalQuery()
+    BulkLoader(query, batch_size=500).load(path)
+
+    # The winiks are only typed as Person_Male/Person_Female; fh:Person has to be inferred
+    graph = MayaGraph(query=query)
+    assert len(list(graph.get_all_winiks())) == 321
+    assert len(list(graph.get_all_families())) == 26
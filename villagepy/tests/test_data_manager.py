@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+
+from villagepy.lib.History import HistoryWriter
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.scripts.data_utils import DataManager
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def run_model(history=None, directory=None, offset=100):
+    model = Model(query=LocalQuery(initial_state))
+    expected = {}
+    for step in range(3):
+        model.graph.set_step(step)
+        if history is not None:
+            model.graph.record(history, step)
+        else:
+            model.graph.save(os.path.join(directory, f"graph_{step}.ttl"))
+        expected[step] = {(family, name): quantity for family, _, name, quantity in model.graph.get_resource_records()}
+        resource_id = next(model.graph.get_resource_records())[1]
+        model.graph.writes.set(resource_id, "maya:hasQuantity", offset + step)
+        model.graph.flush()
+    return expected
+
+
+def check_index(manager, expected):
+    family_ids = manager.get_all_family_ids()
+    assert family_ids == sorted({family for family, _ in expected[0]})
+    for family_id in family_ids:
+        resources = manager.get_family_resources(family_id)
+        assert resources.index.tolist() == [0, 1, 2]
+        for step, counts in expected.items():
+            for (family, name), quantity in counts.items():
+                if family == family_id:
+                    assert resources.loc[step, name] == quantity
+    winiks = manager.get_winik_table()
+    ages = winiks.groupby("step")["age"].sum()
+    assert ages[1] > ages[0]
+
+
+def test_index_turtle_snapshots(tmp_path):
+    expected = run_model(directory=str(tmp_path))
+    manager = DataManager(str(tmp_path))
+    check_index(manager, expected)
+    assert os.path.exists(tmp_path / "index.npz")
+    # A second manager reads the cached index instead of parsing the snapshots again
+    cached = DataManager(str(tmp_path))
+    cached.load_file = None
+    check_index(cached, expected)
+
+
+def test_rerun_rebuilds_index(tmp_path):
+    run_model(directory=str(tmp_path))
+    DataManager(str(tmp_path)).get_index()
+    # A rerun over the same steps writes different counts into the same directory
+    expected = run_model(directory=str(tmp_path), offset=500)
+    check_index(DataManager(str(tmp_path)), expected)
+
+
+def test_index_history(tmp_path):
+    expected = run_model(history=HistoryWriter(str(tmp_path), keyframe_interval=2))
+    check_index(DataManager(str(tmp_path)), expected)
+
+
+def test_parallel_index_matches_serial(tmp_path):
+    history = tmp_path / "history"
+    run_model(history=HistoryWriter(str(history), keyframe_interval=2))
+    serial = DataManager(str(history), index_path=str(tmp_path / "serial.npz")).build_index(processes=1)
+    parallel = DataManager(str(history), index_path=str(tmp_path / "parallel.npz")).build_index(processes=2)
+    assert serial.keys() == parallel.keys()
+    for key in serial:
+        np.testing.assert_array_equal(serial[key], parallel[key])
+
+
+def test_files_sorted_by_step(tmp_path):
+    for step in (10, 9, 100, 1):
+        (tmp_path / f"graph_{step}.ttl").write_text("")
+    manager = DataManager(str(tmp_path))
+    assert manager.files == ["graph_1.ttl", "graph_9.ttl", "graph_10.ttl", "graph_100.ttl"]
@@ -0,0 +1,17 @@
+import os
+
+from villagepy.lib.Ensemble import Ensemble
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def test_ensemble_collects_every_seed_and_step():
+    results = Ensemble(initial_state, 2, seeds=[3, 3], processes=2).run()
+    assert len(results) == 4
+    assert sorted(results["seed"].unique().tolist()) == [3]
+    assert {"population", "births", "deaths", "families"} <= set(results.columns)
+    assert any(column.endswith("_per_family") for column in results.columns)
+    # Every simulation starts from its own copy of the initial state, so equal seeds agree
+    first = results.iloc[0:2].reset_index(drop=True)
+    second = results.iloc[2:4].reset_index(drop=True)
+    assert first.equals(second)
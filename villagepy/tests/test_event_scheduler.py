@@ -0,0 +1,52 @@
+import os
+
+from villagepy.lib.EventScheduler import EventScheduler
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def test_events_come_out_in_day_order():
+    scheduler = EventScheduler()
+    scheduler.schedule(5, "births", "winik/2")
+    scheduler.schedule(3, "births", "winik/1")
+    scheduler.schedule(3, "births", "winik/1")
+    scheduler.schedule(4, "emergency", "family/a")
+    assert scheduler.pop(2) == {}
+    assert scheduler.pop(4) == {"births": {"winik/1": True}, "emergency": {"family/a": True}}
+    assert list(scheduler.pop(10)["births"]) == ["winik/2"]
+    assert len(scheduler) == 0
+
+
+def test_profession_ages_chain():
+    scheduler = EventScheduler()
+    # 1824 days old on day 10, so the winik is older than 1826 on day 13
+    scheduler.schedule_winik("winik/1", "family/a", 1824, 10)
+    assert scheduler.pop(12) == {}
+    assert scheduler.pop(13) == {"jobs": {"family/a": True}}
+    # The next profession age is 3287, which the winik is past on day 10 - 1824 + 3288
+    assert scheduler.pop(10 - 1824 + 3287) == {}
+    assert scheduler.pop(10 - 1824 + 3288) == {"jobs": {"family/a": True}}
+    assert scheduler.pop(10 - 1824 + 5114) == {"jobs": {"family/a": True}}
+    assert scheduler.pop(10 - 1824 + 5845) == {"partnership": {None: True}}
+
+
+def test_scheduled_run_matches_full_run():
+    models = []
+    for scheduler in (None, EventScheduler()):
+        model = Model(query=LocalQuery(initial_state), seed=3)
+        model.scheduler = scheduler
+        partnerships = []
+        model.partnership = lambda partnership=model.partnership: partnerships.append(1) or partnership()
+        for step in range(3):
+            model.run_step(step)
+        models.append((model, partnerships))
+
+    (full, full_partnerships), (scheduled, scheduled_partnerships) = models
+    # Blank nodes from the ontology get new labels in every store
+    ground = lambda model: {line for line in model.graph.query.triples() if "_:" not in line}
+    assert ground(scheduled) == ground(full)
+    # Nobody turns old enough to partner in the first few steps, so only the first step matches winiks
+    assert len(full_partnerships) == 3
+    assert len(scheduled_partnerships) == 1
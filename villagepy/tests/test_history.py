@@ -0,0 +1,41 @@
+import os
+
+from villagepy.lib.History import HistoryReader, HistoryWriter
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def test_rebuild_steps(tmp_path):
+    model = Model(query=LocalQuery(initial_state))
+    history = HistoryWriter(str(tmp_path), keyframe_interval=3)
+    expected = {}
+    for step in range(5):
+        model.graph.record(history, step)
+        expected[step] = set(model.graph.query.triples())
+        model.update_health("file:/snippet/generated/winik/1", 100 - step)
+        model.graph.flush()
+
+    files = sorted(os.listdir(tmp_path))
+    assert "keyframe_0.nt" in files and "keyframe_3.nt" in files
+    assert "added_1.nt" in files and "removed_4.nt" in files
+    assert "keyframe_1.nt" not in files
+    # A delta only holds the triples that changed
+    assert os.path.getsize(tmp_path / "added_1.nt") < os.path.getsize(tmp_path / "keyframe_0.nt") / 10
+
+    reader = HistoryReader(str(tmp_path))
+    assert reader.steps() == [0, 1, 2, 3, 4]
+    for step in range(5):
+        assert reader.lines(step) == expected[step]
+    for step, lines in reader.iter_lines():
+        assert lines == expected[step]
+    assert len(reader.load(4)) == len(expected[4])
+
+
+def test_run_with_history(tmp_path):
+    model = Model(query=LocalQuery(initial_state))
+    model.run(2, history=HistoryWriter(str(tmp_path)))
+    reader = HistoryReader(str(tmp_path))
+    assert HistoryReader.is_history(str(tmp_path))
+    assert reader.steps() == [0, 1]
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+from villagepy.lib.IdentityManager import IdentityManager
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.MayaGraph import MayaGraph
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def mint(path) -> list:
+    manager = IdentityManager(block_size=10, path=path)
+    return [str(manager.get_id("winik")) for _ in range(25)]
+
+
+def test_starts_past_the_high_water_mark():
+    manager = IdentityManager()
+    manager.start({"winik": 320})
+    assert str(manager.get_id("winik")) == "winik/321"
+    # Counters never go backwards
+    manager.start({"winik": 5})
+    assert str(manager.get_id("winik")) == "winik/322"
+
+
+def test_threads_get_unique_ids():
+    manager = IdentityManager(block_size=7)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(lambda _: manager.get_id("winik"), range(1000)))
+    assert len(set(ids)) == 1000
+
+
+def test_processes_reserve_separate_blocks(tmp_path):
+    path = str(tmp_path / "ids.json")
+    with Pool(4) as pool:
+        ids = [winik_id for batch in pool.map(mint, [path] * 4) for winik_id in batch]
+    assert len(set(ids)) == 100
+    # A manager that picks the file up later carries on after every reserved block
+    assert int(mint(path)[0].split("/")[1]) > max(int(winik_id.split("/")[1]) for winik_id in ids)
+
+
+def test_graph_mints_without_queries():
+    graph = MayaGraph(query=LocalQuery(initial_state))
+    winiks = len(list(graph.get_all_winiks()))
+    assert graph.get_winik_id() == f"file:/snippet/generated/winik/{winiks + 1}"
+    reads = []
+    get = graph.query.get
+    graph.query.get = lambda query: reads.append(query) or get(query)
+    ids = [graph.get_winik_id() for _ in range(2000)]
+    assert len(set(ids)) == 2000
+    assert reads == []
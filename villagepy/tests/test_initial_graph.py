@@ -0,0 +1,55 @@
+import io
+import os
+
+import rdflib
+
+from villagepy.lib.InitialGraph import InitialGraph
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.OntologyCache import OntologyCache
+
+scripts = os.path.join(os.path.dirname(__file__), "..", "scripts")
+
+
+def load(data: str) -> rdflib.Graph:
+    graph = rdflib.Graph()
+    graph.parse(data=f"@base <{LocalQuery.base}> .\n{data}", format="turtle")
+    return graph
+
+
+def ground(graph: rdflib.Graph) -> set:
+    # Blank nodes from the ontology and the order resources are numbered in can differ
+    return {triple for triple in graph if not any(isinstance(term, rdflib.BNode) for term in triple)
+            and "resource/" not in str(triple[0]) and "resource/" not in str(triple[2])}
+
+
+def test_streamed_triples_match_graph(monkeypatch, tmp_path):
+    monkeypatch.chdir(scripts)
+    # Keep the parsed ontology out of the user's cache
+    cache = OntologyCache(str(tmp_path))
+    initial_graph = InitialGraph("../data/fam_bam_06.csv", "../data/resources.csv", cache)
+    initial_graph.add_winiks()
+    initial_graph.add_resources()
+    expected = load(initial_graph.database.serialize(format="turtle"))
+
+    stream = io.StringIO()
+    InitialGraph("../data/fam_bam_06.csv", "../data/resources.csv", cache).write_triples(stream, chunk_size=50)
+    streamed = load(stream.getvalue())
+
+    assert len(streamed) == len(expected)
+    assert ground(streamed) == ground(expected)
+    resources = lambda graph: sorted((p, o) for s, p, o in graph if "resource/" in str(s))
+    assert resources(streamed) == resources(expected)
+
+
+def test_streamed_state_is_ntriples(monkeypatch, tmp_path):
+    monkeypatch.chdir(scripts)
+    path = tmp_path / "initial_state.nt"
+    InitialGraph("../data/fam_bam_06.csv", "../data/resources.csv",
+                 OntologyCache(str(tmp_path / "cache"))).create_initial_triples(str(path))
+    graph = rdflib.Graph()
+    graph.parse(str(path), format="nt")
+    assert (rdflib.URIRef(f"{LocalQuery.base}winik/1"), rdflib.URIRef("https://maya.com#hasPartner"),
+            rdflib.URIRef(f"{LocalQuery.base}winik/14")) in graph
+    # winik/1 is 16511 days old on the first step
+    assert graph.value(rdflib.URIRef(f"{LocalQuery.base}winik/1"),
+                       rdflib.URIRef("https://maya.com#hasBirthStep")).toPython() == -16512
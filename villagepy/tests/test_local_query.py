@@ -0,0 +1,94 @@
+import os
+
+import pytest
+import rdflib
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.MayaGraph import MayaGraph
+from villagepy.lib.Model import Model
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+graph = MayaGraph(query=LocalQuery(initial_state))
+
+
+def test_get_living_winiks():
+    winiks = list(graph.get_living_winiks())
+    assert len(winiks) > 0
+    assert all(winik.startswith("file:/snippet/generated/winik/") for winik in winiks)
+
+
+def test_get_all_families():
+    families = list(graph.get_all_families())
+    assert "file:/snippet/generated/family/a" in families
+
+
+def test_get_winik():
+    health = list(graph.get_winik("file:/snippet/generated/winik/1", "maya:hasHealth"))
+    assert health == ["100"]
+
+
+def test_get_winik_id():
+    winik_count = len(list(graph.get_all_winiks()))
+    assert graph.get_winik_id() == f"file:/snippet/generated/winik/{winik_count + 1}"
+
+
+def test_bindings_format():
+    results = graph.query.get("""
+        PREFIX maya: <https://maya.com#>
+        SELECT ?age ?gender WHERE {
+            <file:/snippet/generated/winik/1> maya:hasAge ?age .
+            <file:/snippet/generated/winik/1> maya:hasGender ?gender .
+        }
+    """)
+    assert results["head"]["vars"] == ["age", "gender"]
+    binding = results["results"]["bindings"][0]
+    assert binding["age"]["type"] == "literal"
+    assert binding["age"]["datatype"] == "http://www.w3.org/2001/XMLSchema#integer"
+    assert binding["gender"]["value"] == "M"
+
+
+def test_post_infers_person():
+    model = Model(query=LocalQuery(initial_state))
+    winik_id = model.create_child("file:/snippet/generated/winik/2", "file:/snippet/generated/winik/1", "a",
+                                  "file:/snippet/generated/family/a", "test")
+    model.graph.flush()
+    assert winik_id in list(model.graph.get_living_winiks())
+
+
+def test_winiks_age_with_the_step():
+    model = Model(query=LocalQuery(initial_state))
+    ages = dict(model.graph.get_living_with_ages())
+    model.graph.set_step(1)
+    assert len(model.graph.writes) == 0
+    for winik, age in model.graph.get_living_with_ages():
+        assert int(age) == int(ages[winik]) + 1
+
+
+def test_legacy_ages_become_birth_steps():
+    model = Model(query=LocalQuery(initial_state), seed=0)
+    database = model.graph.query.database
+    maya = rdflib.Namespace("https://maya.com#")
+    ages = {winik: int(age) for winik, age in database.subject_objects(maya.hasAge)}
+    model.graph.set_step(0)
+    assert not list(database.subject_objects(maya.hasAge))
+    assert {winik: -1 - int(birth) for winik, birth in database.subject_objects(maya.hasBirthStep)} == ages
+
+    births = dict(database.subject_objects(maya.hasBirthStep))
+    model.run_step(0)
+    model.run_step(1)
+    # Aging a step doesn't write anything; only newborns get birth steps
+    assert not list(database.subject_objects(maya.hasAge))
+    assert {winik: birth for winik, birth in database.subject_objects(maya.hasBirthStep) if winik in births} == births
+
+
+def test_failed_updates_roll_back():
+    query = LocalQuery(initial_state)
+    before = set(query.triples())
+    with pytest.raises(Exception):
+        query.post_many([
+            "PREFIX maya: <https://maya.com#> DELETE WHERE { ?winik maya:hasHealth ?health }",
+            "PREFIX maya: <https://maya.com#> INSERT DATA { <winik/9999> a <http://www.owl-ontologies.com/Ontology1172270693.owl#Person_Female> }",
+            # Parses, but fails when it runs
+            "LOAD <file:///nonexistent/graph.ttl>",
+        ])
+    assert set(query.triples()) == before
@@ -0,0 +1,21 @@
+import rdflib
+
+from villagepy.lib.NTriples import NTriples
+
+
+def test_lines_parse_as_ntriples():
+    subject = rdflib.URIRef("file:/snippet/generated/winik/1")
+    triples = [
+        (subject, rdflib.URIRef("https://maya.com#hasFirstName"), rdflib.Literal('a "quoted"\nname\\', lang="en")),
+        (subject, rdflib.URIRef("https://maya.com#hasHealth"), rdflib.Literal(97.5)),
+        (subject, rdflib.URIRef("https://maya.com#isAlive"), rdflib.Literal(True)),
+        (subject, rdflib.URIRef("https://maya.com#hasBirthStep"), rdflib.Literal(-16512)),
+        (subject, rdflib.URIRef("https://maya.com#hasPartner"), rdflib.BNode("b0")),
+    ]
+    lines = [NTriples.line(triple) for triple in triples]
+    assert all(line.endswith(" .\n") and line.count("\n") == 1 for line in lines)
+    graph = rdflib.Graph()
+    graph.parse(data="".join(lines), format="nt")
+    # The parser gives blank nodes new labels
+    assert {triple for triple in graph if not isinstance(triple[2], rdflib.BNode)} == set(triples[:-1])
+    assert len(graph) == len(triples)
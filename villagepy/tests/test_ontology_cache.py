@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import rdflib
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.OntologyCache import OntologyCache
+
+
+def test_cached_ontology_skips_parse(tmp_path, monkeypatch):
+    parsed = OntologyCache(str(tmp_path)).triples()
+    assert len(os.listdir(tmp_path)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The ontology was parsed again")
+    monkeypatch.setattr(rdflib.Graph, "parse", fail)
+    cached = OntologyCache(str(tmp_path)).triples()
+    assert len(cached) == len(parsed)
+    assert set(cached) == set(parsed)
+
+
+def test_edited_ontology_gets_new_entry(tmp_path):
+    ontology = tmp_path / "ontology.owl"
+    shutil.copy(OntologyCache.ontology, ontology)
+    cache = OntologyCache(str(tmp_path / "cache"))
+    before = cache.triples(str(ontology))
+
+    with open(ontology) as f:
+        text = f.read()
+    with open(ontology, "w") as f:
+        f.write(text.replace("</rdf:RDF>", '<owl:Class rdf:about="https://maya.com#Village"/>\n</rdf:RDF>'))
+    after = cache.triples(str(ontology))
+    assert len(after) == len(before) + 1
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+
+def test_local_store_infers_from_cached_ontology(tmp_path):
+    query = LocalQuery()
+    query.load_triples(["<winik/1> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> "
+                        "<http://www.owl-ontologies.com/Ontology1172270693.owl#Person_Male> ."])
+    query.load_ontology(cache=OntologyCache(str(tmp_path)))
+    assert (rdflib.URIRef(f"{LocalQuery.base}winik/1"), rdflib.RDF.type,
+            rdflib.URIRef("http://www.owl-ontologies.com/Ontology1172270693.owl#Person")) in query.database
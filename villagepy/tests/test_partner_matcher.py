@@ -0,0 +1,89 @@
+import os
+import random
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.lib.PartnerMatcher import PartnerMatcher
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def brute_force_valid(pair, males, females, window=1460):
+    bride, groom = pair
+    female = {winik_id: (age, family) for winik_id, age, family in females}[bride]
+    male = {winik_id: (age, family) for winik_id, age, family in males}[groom]
+    return abs(female[0] - male[0]) < window and female[1] != male[1]
+
+
+def test_match_respects_window_and_family():
+    males = [("m1", 6000, "a"), ("m2", 9000, "b"), ("m3", 6100, "c")]
+    females = [("f1", 6050, "a"), ("f2", 20000, "b"), ("f3", 9500, "a")]
+    pairs = PartnerMatcher().match(males, females)
+    assert sorted(pairs) == [("f1", "m3"), ("f3", "m2")]
+    for pair in pairs:
+        assert brute_force_valid(pair, males, females)
+
+
+def test_match_never_reuses_a_winik():
+    males = [(f"m{i}", 6000 + 37 * i, f"family{i % 7}") for i in range(300)]
+    females = [(f"f{i}", 6000 + 41 * i, f"family{i % 5}") for i in range(250)]
+    pairs = PartnerMatcher().match(males, females)
+    brides = [bride for bride, groom in pairs]
+    grooms = [groom for bride, groom in pairs]
+    assert len(set(brides)) == len(brides) and len(set(grooms)) == len(grooms)
+    assert len(pairs) > 200
+    for pair in pairs:
+        assert brute_force_valid(pair, males, females)
+
+
+def scan_match(males, females, window=1460):
+    # The matcher's rule, written as a linear scan over the waiting winiks
+    singles = sorted([(age, winik_id, family, "M") for winik_id, age, family in males] +
+                     [(age, winik_id, family, "F") for winik_id, age, family in females])
+    waiting = {"M": [], "F": []}
+    pairs = []
+    for age, winik_id, family, gender in singles:
+        candidates = waiting["F" if gender == "M" else "M"]
+        candidates[:] = [candidate for candidate in candidates if age - candidate[0] < window]
+        partner = next((candidate for candidate in candidates if candidate[2] != family), None)
+        if partner is None:
+            waiting[gender].append((age, winik_id, family))
+            continue
+        candidates.remove(partner)
+        pairs.append((winik_id, partner[1]) if gender == "F" else (partner[1], winik_id))
+    return pairs
+
+
+def test_match_takes_the_oldest_candidate():
+    generator = random.Random(4)
+    for _ in range(20):
+        # A few large families, so most candidates share a family with the winik being matched
+        males = [(f"m{i}", generator.randint(5845, 12000), f"family{generator.randint(0, 3)}") for i in range(200)]
+        females = [(f"f{i}", generator.randint(5845, 12000), f"family{generator.randint(0, 3)}") for i in range(200)]
+        assert PartnerMatcher().match(males, females) == scan_match(males, females)
+
+
+def test_match_one_large_family():
+    males = [(f"m{i}", 6000 + i, "a") for i in range(50000)]
+    females = [(f"f{i}", 6000 + i, "a") for i in range(50000)] + [("f-b", 6000, "b")]
+    assert PartnerMatcher().match(males, females) == [("f-b", "m0")]
+
+
+def test_partnership_writes_pairs():
+    model = Model(query=LocalQuery(initial_state))
+    males, females = model.graph.get_partnerable_winiks()
+    assert males
+    # Make one of the single men's neighbours a single woman of the right age
+    groom, age, family = males[0]
+    bride = next(winik_id for winik_id, _, _, _, _, _, family_id, partner, _, _
+                 in model.graph.get_winik_records() if family_id != family and partner is None)
+    model.graph.writes.set(bride, "maya:hasBirthStep", model.graph.step - age)
+    model.graph.writes.set(bride, "maya:hasGender", "F")
+    model.graph.flush()
+
+    model.partnership()
+    assert len(model.graph.writes) == 2
+    model.graph.flush()
+    records = {record[0]: record for record in model.graph.get_winik_records()}
+    assert records[bride][7] is not None
+    assert records[records[bride][7]][7] == bride
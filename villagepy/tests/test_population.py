@@ -0,0 +1,89 @@
+import os
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.MayaGraph import MayaGraph
+from villagepy.lib.Population import Population
+from villagepy.lib.RandomStreams import RandomStreams
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def village(winiks, quantity=100):
+    """
+    Builds a population of single winiks that all live in family 'a'.
+    """
+    records = [(f"winik/{i}", age, gender, health, True, profession, "family/a", None, None)
+               for i, (age, gender, health, profession) in enumerate(winiks)]
+    resources = [("family/a", f"resource/{name}", name, quantity) for name in Population.resources]
+    return Population(records, resources)
+
+
+def test_from_graph():
+    graph = MayaGraph(query=LocalQuery(initial_state))
+    population = Population.from_graph(graph)
+    assert len(population) == len(list(graph.get_all_winiks()))
+    assert population.alive.all()
+    assert len(population.family_ids) == len(list(graph.get_all_families()))
+    assert (population.partner >= 0).any()
+
+
+def test_calorie_requirements():
+    population = village([(1000, "F", 100, "none"), (6000, "F", 100, "farmer"), (6000, "M", 100, "fisher")])
+    assert population.calorie_requirements().tolist() == [12 + 24 + 30]
+
+
+def test_job_adjustments():
+    population = village([(15000, "M", 100, "fisher"), (4000, "M", 100, "none"),
+                          (4000, "F", 100, "none"), (6000, "F", 100, "none"), (100, "F", 100, "none")])
+    population.job_adjustments()
+    professions = [population.professions[code] for code in population.profession]
+    assert professions == ["forager", "fisher", "fisher", "farmer", "none"]
+
+    population.emergency_start[0] = 1
+    population.job_adjustments()
+    assert [population.professions[code] for code in population.profession[:4]] == ["farmer"] * 4
+
+
+def test_deficit_kills_and_starts_emergency():
+    population = village([(6000, "M", 1, "none"), (6000, "F", 76, "none")], quantity=0)
+    population.step(3, RandomStreams(0))
+    assert population.alive.tolist() == [False, True]
+    assert population.health.tolist() == [-14, 61]
+    assert population.emergency_start.tolist() == [3]
+    assert not population.quantity.any()
+
+
+def test_write_back():
+    graph = MayaGraph(query=LocalQuery(initial_state))
+    population = Population.from_graph(graph)
+    population.step(0, RandomStreams(0))
+    population.write_back(graph)
+    ages = dict(graph.get_living_with_ages())
+    for winik_id, age in zip(population.ids, population.age):
+        assert int(ages[winik_id]) == age
+
+
+def test_emergencies_round_trip():
+    graph = MayaGraph(query=LocalQuery(initial_state))
+    graph.set_step(0)
+    population = Population.from_graph(graph)
+    # Starve every family so that the ones with critical winiks start an emergency
+    population.quantity[:] = 0
+    population.health[population.alive] = 80
+    population.step(0, RandomStreams(0))
+    started = population.emergency_start.copy()
+    assert (started == 0).any()
+    population.write_back(graph)
+    assert Population.from_graph(graph).emergency_start.tolist() == started.tolist()
+
+    # Emergencies that are already active keep their start date, and turn everyone into farmers
+    loaded = Population.from_graph(graph)
+    loaded.job_adjustments()
+    in_emergency = loaded.alive & (loaded.emergency_start[loaded.family] >= 0)
+    assert (loaded.profession[in_emergency] == loaded.professions.index("farmer")).all()
+
+    # Expired emergencies are unlinked from their families
+    population.expire_emergencies(25, 20)
+    population.write_back(graph)
+    assert not list(graph.get_emergency_records())
+    assert (Population.from_graph(graph).emergency_start == -1).all()
@@ -0,0 +1,48 @@
+import csv
+import json
+import os
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.lib.Profiler import Profiler
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def test_template_key_drops_identifiers():
+    first = Profiler.template_key('SELECT ?v WHERE { <file:/winik/1> maya:hasAge ?v . FILTER(?v > 12) }')
+    second = Profiler.template_key('SELECT ?v WHERE { <file:/winik/2> maya:hasAge ?v . FILTER(?v > 40) }')
+    assert first == second
+
+
+def test_queries_are_charged_to_the_active_subsystem():
+    profiler = Profiler()
+    profiler.start_step(0)
+    with profiler.subsystem("outer"):
+        with profiler.subsystem("inner"):
+            profiler.record_query("read", "SELECT * WHERE { ?s ?p ?o }", 0.1, 10, 20, 3)
+        profiler.record_query("update", "INSERT DATA { <a> <b> <c> }", 0.1, 5, 0)
+    report = profiler.end_step()
+    assert report["inner"]["reads"] == 1 and report["inner"]["rows"] == 3
+    assert report["outer"]["updates"] == 1 and report["outer"]["reads"] == 0
+    assert report["outer"]["seconds"] >= report["inner"]["seconds"]
+
+
+def test_run_writes_reports(tmp_path, monkeypatch):
+    profiler = Profiler(str(tmp_path / "profile"))
+    model = Model(query=LocalQuery(initial_state), seed=0)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("history")
+    model.run(2, profiler=profiler)
+
+    with open(tmp_path / "profile" / "steps.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert {row["step"] for row in rows} == {"0", "1"}
+    assert {"aging", "snapshot", "resources", "births", "flush", "save"} <= {row["subsystem"] for row in rows}
+    with open(tmp_path / "profile" / "summary.json") as f:
+        summary = json.load(f)
+    assert summary["subsystems"]["snapshot"]["reads"] == 6
+    assert summary["subsystems"]["flush"]["updates"] > 0
+    assert sum(counters["calls"] for counters in summary["templates"].values()) == \
+        sum(counters["reads"] + counters["updates"] for counters in summary["subsystems"].values())
+    assert os.path.exists(tmp_path / "profile" / "templates.csv")
@@ -0,0 +1,102 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from villagepy.lib.BulkLoader import BulkLoader
+from villagepy.lib.Query import Query
+
+
+class GraphDBHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for a GraphDB repository that records the connections and requests it sees.
+    """
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    requests = []
+
+    def setup(self):
+        super().setup()
+        GraphDBHandler.connections.add(self.client_address)
+
+    def reply(self, body: bytes, content_type: str):
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        GraphDBHandler.requests.append(("GET", url.path, parse_qs(url.query)))
+        if url.path.endswith("/statements"):
+            self.reply(b"<a:b> <a:c> <a:d> .\n", "text/turtle")
+        else:
+            body = {"head": {"vars": ["x"]}, "results": {"bindings": [{"x": {"type": "literal", "value": "1"}}]}}
+            self.reply(json.dumps(body).encode(), "application/sparql-results+json")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode()
+        if self.headers.get("Content-Type") == "text/turtle":
+            # RDF data posted with the Graph Store Protocol
+            GraphDBHandler.requests.append(("POST", urlparse(self.path).path, body))
+        else:
+            GraphDBHandler.requests.append(("POST", urlparse(self.path).path, parse_qs(body)))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    GraphDBHandler.connections = set()
+    GraphDBHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GraphDBHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/repositories/Tests"
+
+
+def test_requests_share_one_connection(tmp_path):
+    server, endpoint = serve()
+    query = Query(endpoint, None, None)
+    for i in range(5):
+        results = query.get("SELECT ?x WHERE { ?x ?y ?z }")
+        assert results["results"]["bindings"][0]["x"]["value"] == "1"
+        query.post("INSERT DATA { <a:b> <a:c> <a:d> }")
+    query.save(tmp_path / "graph.ttl")
+    server.shutdown()
+
+    assert len(GraphDBHandler.connections) == 1
+    assert (tmp_path / "graph.ttl").read_text() == "<a:b> <a:c> <a:d> .\n"
+
+
+def test_updates_go_to_statements():
+    server, endpoint = serve()
+    query = Query(endpoint, None, None)
+    query.post_many(["INSERT DATA { <a:b> <a:c> 1 }", "INSERT DATA { <a:b> <a:c> 2 }"])
+    server.shutdown()
+
+    method, path, form = GraphDBHandler.requests[0]
+    assert (method, path) == ("POST", "/repositories/Tests/statements")
+    assert form["update"] == ["INSERT DATA { <a:b> <a:c> 1 } ;\nINSERT DATA { <a:b> <a:c> 2 }"]
+
+
+def test_load_triples_posts_turtle_chunks():
+    server, endpoint = serve()
+    query = Query(endpoint, None, None)
+    BulkLoader(query, batch_size=2).load_lines([f"<winik/{i}> <https://maya.com#hasAge> {i} .\n" for i in range(5)])
+    server.shutdown()
+
+    assert [len(body.splitlines()) - 1 for method, path, body in GraphDBHandler.requests] == [2, 2, 1]
+    method, path, body = GraphDBHandler.requests[0]
+    assert path == "/repositories/Tests/statements"
+    assert body.startswith(f"@base <{Query.base}> .\n<winik/0>")
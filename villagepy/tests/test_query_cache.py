@@ -0,0 +1,60 @@
+import os
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.lib.QueryCache import QueryCache
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+ages_query = """
+        PREFIX maya: <https://maya.com#>
+        SELECT ?winik ?age WHERE { ?winik maya:hasAge ?age . }
+"""
+
+
+def test_whitespace_is_normalized():
+    cache = QueryCache()
+    cache.put("SELECT ?a WHERE { ?a <x:p> 1 }", {"results": {"bindings": []}})
+    assert cache.get("SELECT ?a\n  WHERE {\t?a <x:p> 1 }") is not None
+    assert cache.stats() == {"hits": 1, "misses": 0, "size": 1}
+
+
+def test_updates_only_evict_matching_predicates():
+    cache = QueryCache()
+    cache.put(ages_query, 1)
+    cache.put("PREFIX maya: <https://maya.com#> SELECT ?w WHERE { ?w maya:hasHealth ?h }", 2)
+    cache.invalidate("PREFIX maya: <https://maya.com#> INSERT DATA { <winik/1> maya:hasHealth 5 }")
+    assert cache.get(ages_query) == 1
+    assert cache.stats()["size"] == 1
+    # Full IRIs and prefixed names of the same predicate match
+    cache.invalidate("INSERT DATA { <winik/1> <https://maya.com#hasAge> 5 }")
+    assert cache.get(ages_query) is None
+    # An update with a variable predicate could change anything
+    cache.put(ages_query, 1)
+    cache.invalidate("DELETE WHERE { <winik/1> ?p ?o }")
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_is_dropped():
+    cache = QueryCache(size=2)
+    cache.put("SELECT * WHERE { ?s <x:a> ?o }", 1)
+    cache.put("SELECT * WHERE { ?s <x:b> ?o }", 2)
+    cache.get("SELECT * WHERE { ?s <x:a> ?o }")
+    cache.put("SELECT * WHERE { ?s <x:c> ?o }", 3)
+    assert cache.get("SELECT * WHERE { ?s <x:b> ?o }") is None
+    assert cache.get("SELECT * WHERE { ?s <x:a> ?o }") == 1
+
+
+def test_cached_reads_see_every_write():
+    cache = QueryCache()
+    model = Model(query=LocalQuery(initial_state, cache=cache))
+    family_id = next(model.graph.get_all_families())
+    first = model.get_family_calories(family_id)
+    assert model.get_family_calories(family_id) == first
+    assert cache.hits == 1
+    winik_id = next(winik_id for winik_id, _ in model.get_living_winiks_in_family(family_id))
+    model.graph.writes.set(winik_id, "maya:hasBirthStep", -1)
+    model.graph.flush()
+    # An age changed, so the next read goes back to the store
+    misses = cache.misses
+    model.get_family_calories(family_id)
+    assert cache.misses == misses + 1
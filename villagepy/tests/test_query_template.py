@@ -0,0 +1,57 @@
+import os
+
+import pytest
+import rdflib
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.MayaGraph import MayaGraph
+from villagepy.lib.QueryTemplate import QueryTemplate
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+resources = QueryTemplate("""
+        PREFIX maya: <https://maya.com#>
+        SELECT ?family ?name ?quantity WHERE {
+            ?family maya:hasResource ?resource .
+            ?resource maya:hasName ?name .
+            ?resource maya:hasQuantity ?quantity .
+        }
+""", ["family"])
+
+
+def test_render_adds_values_block():
+    text = resources.render([{"family": "file:/snippet/generated/family/a"},
+                             {"family": "<file:/snippet/generated/family/b>"}])
+    assert "VALUES (?family) { (<file:/snippet/generated/family/a>) (<file:/snippet/generated/family/b>) }" in text
+    assert text.index("WHERE {") < text.index("VALUES")
+
+
+def test_render_rejects_injection():
+    with pytest.raises(ValueError):
+        resources.render({"family": "file:/a> } ; DROP ALL ; SELECT * { <x:y"})
+    with pytest.raises(ValueError):
+        resources.render({"winik": "file:/a"})
+    literal = QueryTemplate("INSERT { <x:a> <x:name> ?name } WHERE {}", ["name"])
+    assert '"it\'s \\"quoted\\""' in literal.render({"name": rdflib.Literal('it\'s "quoted"')})
+
+
+def test_prepared_matches_rendered():
+    query = LocalQuery(initial_state)
+    family_ids = sorted(MayaGraph(query=query).get_all_families())
+    for family_id in family_ids[:3]:
+        prepared = query.get_prepared(resources, {"family": family_id})
+        rendered = query.get(resources.render({"family": family_id}))
+        key = lambda binding: binding["name"]["value"]
+        assert prepared["results"]["bindings"]
+        assert sorted(prepared["results"]["bindings"], key=key) == sorted(rendered["results"]["bindings"], key=key)
+    assert list(query.prepared) == [resources.text]
+
+
+def test_batch_matches_single_calls():
+    query = LocalQuery(initial_state)
+    family_ids = sorted(MayaGraph(query=query).get_all_families())[:4]
+    rows = [{"family": family_id} for family_id in family_ids]
+    batch = query.get_batch(resources, rows)["results"]["bindings"]
+    remote_style = query.get(resources.render(rows))["results"]["bindings"]
+    key = lambda binding: (binding["family"]["value"], binding["name"]["value"])
+    assert sorted(batch, key=key) == sorted(remote_style, key=key)
+    assert {binding["family"]["value"] for binding in batch} == set(family_ids)
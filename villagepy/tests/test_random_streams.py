@@ -0,0 +1,46 @@
+import uuid
+
+import numpy as np
+
+from villagepy.lib.RandomStreams import RandomStreams
+
+families = [f"file:/snippet/generated/family/{i}" for i in range(50)]
+
+
+def test_draws_are_reproducible():
+    first = RandomStreams(42).integers("coast", families, 7, 1, 5)
+    second = RandomStreams(42).integers("coast", families, 7, 1, 5)
+    assert first.tolist() == second.tolist()
+    assert RandomStreams(43).integers("coast", families, 7, 1, 5).tolist() != first.tolist()
+
+
+def test_vectorized_draws_match_single_draws():
+    streams = RandomStreams(1)
+    vectorized = streams.integers("coast", families, 3, 1, 5)
+    # The order that the families are visited in doesn't matter
+    single = {family: streams.integer("coast", family, 3, 1, 5) for family in reversed(families)}
+    assert vectorized.tolist() == [single[family] for family in families]
+
+
+def test_streams_are_independent():
+    streams = RandomStreams(5)
+    coast = streams.bits("coast", families, 0)
+    gender = streams.bits("gender", families, 0)
+    next_step = streams.bits("coast", families, 1)
+    assert not set(coast.tolist()) & set(gender.tolist())
+    assert not set(coast.tolist()) & set(next_step.tolist())
+
+
+def test_integers_cover_the_range_evenly():
+    draws = RandomStreams(9).integers("coast", range(20000), 0, 1, 5)
+    counts = np.bincount(draws, minlength=5)
+    assert counts[0] == 0
+    assert all(4500 < count < 5500 for count in counts[1:])
+
+
+def test_uuid():
+    streams = RandomStreams(3)
+    name = streams.uuid("name", "file:/snippet/generated/winik/1", 10)
+    assert uuid.UUID(name).version == 4
+    assert name == RandomStreams(3).uuid("name", "file:/snippet/generated/winik/1", 10)
+    assert name != streams.uuid("name", "file:/snippet/generated/winik/1", 11)
@@ -0,0 +1,54 @@
+import gzip
+import os
+
+import rdflib
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.lib.SnapshotWriter import SnapshotWriter
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def births(graph: rdflib.Graph) -> dict:
+    return {str(s): int(o) for s, o in graph.subject_objects(rdflib.URIRef("https://maya.com#hasBirthStep"))}
+
+
+def test_snapshots_show_the_start_of_each_step(tmp_path):
+    model = Model(query=LocalQuery(initial_state), seed=0)
+    # initial_state.ttl stores ages, which become birth steps before the first step
+    expected = {str(winik): -1 - int(age) for winik, age in model.graph.query.database.subject_objects(
+        rdflib.URIRef("https://maya.com#hasAge"))}
+    with SnapshotWriter(str(tmp_path), compress=True) as snapshots:
+        model.run(3, snapshots=snapshots, checkpoint_interval=2)
+
+    assert sorted(os.listdir(tmp_path)) == ["graph_0.ttl.gz", "graph_2.ttl.gz", "ids_0.json", "ids_2.json"]
+    graph = rdflib.Graph()
+    with gzip.open(tmp_path / "graph_0.ttl.gz", "rb") as f:
+        graph.parse(f, format="turtle")
+    assert births(graph) == expected
+
+
+def test_resume_from_latest_snapshot(tmp_path):
+    model = Model(query=LocalQuery(initial_state), seed=0)
+    with SnapshotWriter(str(tmp_path)) as snapshots:
+        model.run(2, snapshots=snapshots)
+    # A snapshot that was cut off isn't a checkpoint
+    (tmp_path / "graph_5.ttl.part").write_text("")
+    assert SnapshotWriter.latest(str(tmp_path)) == (1, str(tmp_path / "graph_1.ttl"))
+
+    expected = rdflib.Graph()
+    expected.parse(tmp_path / "graph_1.ttl", format="turtle")
+    resumed = Model(query=LocalQuery(), seed=0)
+    assert resumed.resume(str(tmp_path)) == 1
+    assert births(resumed.graph.query.database) == births(expected)
+    assert len(list(resumed.graph.get_all_winiks())) == len(set(expected.subjects(
+        rdflib.RDF.type, rdflib.URIRef("http://www.owl-ontologies.com/Ontology1172270693.owl#Person"))))
+
+    # Running the step again from the checkpoint ends where the original run did
+    with SnapshotWriter(str(tmp_path / "resumed")) as snapshots:
+        resumed.run(2, start=1, snapshots=snapshots)
+    assert births(resumed.graph.query.database) == births(model.graph.query.database)
+    assert sorted(resumed.graph.get_living_winiks()) == sorted(model.graph.get_living_winiks())
+    # ...and carries on handing out the same identifiers
+    assert resumed.graph.get_winik_id() == model.graph.get_winik_id()
@@ -0,0 +1,21 @@
+import pytest
+
+from villagepy.lib.SyntheticVillage import SyntheticVillage
+
+
+def test_village_shape():
+    frame = SyntheticVillage(30, 10, seed=1).to_frame()
+    assert len(frame) == 300
+    assert frame["fam_id"].nunique() == 30
+    assert list(frame.columns) == SyntheticVillage.columns
+    assert frame.equals(SyntheticVillage(30, 10, seed=1).to_frame())
+
+
+@pytest.mark.parametrize("age_distribution", ["pyramid", "uniform", "adult"])
+def test_children_are_younger_than_parents(age_distribution):
+    frame = SyntheticVillage(20, 8, age_distribution, seed=2).to_frame().set_index("identifier")
+    children = frame[frame["mother_id"] > 0]
+    mothers = frame.loc[children["mother_id"]]
+    assert (mothers["age"].values - children["age"].values >= SyntheticVillage.adult_age).all()
+    assert (mothers["fam_id"].values == children["fam_id"].values).all()
+    assert (frame.loc[frame["partner"].dropna().astype(int), "partner"].notna()).all()
@@ -0,0 +1,83 @@
+import os
+
+from villagepy.lib.LocalQuery import LocalQuery
+from villagepy.lib.Model import Model
+from villagepy.lib.WriteBuffer import WriteBuffer
+
+initial_state = os.path.join(os.path.dirname(__file__), "..", "scripts", "initial_state.ttl")
+
+
+def test_set_keeps_last_value():
+    buffer = WriteBuffer()
+    buffer.set("file:/snippet/generated/winik/1", "maya:hasHealth", 90)
+    buffer.set("file:/snippet/generated/winik/1", "maya:hasHealth", 80)
+    assert len(buffer) == 1
+    update = buffer.to_update()
+    assert "<file:/snippet/generated/winik/1> maya:hasHealth 80 ." in update
+    assert "maya:hasHealth 90" not in update
+
+
+def test_raw_updates_split_values():
+    buffer = WriteBuffer()
+    buffer.set("file:/snippet/generated/winik/1", "maya:hasHealth", 90)
+    buffer.update("PREFIX maya: <https://maya.com#> DELETE WHERE { ?s maya:hasHealth ?o }")
+    buffer.set("file:/snippet/generated/winik/1", "maya:hasHealth", 80)
+    assert len(buffer) == 3
+    update = buffer.to_update()
+    assert update.index("maya:hasHealth 90") < update.index("DELETE WHERE") < update.index("maya:hasHealth 80")
+
+
+def test_extend_matches_writing_in_order():
+    first = WriteBuffer()
+    first.set("file:/snippet/generated/winik/1", "maya:hasHealth", 90)
+    second = WriteBuffer()
+    second.set("file:/snippet/generated/winik/1", "maya:hasHealth", 80)
+    second.update("PREFIX maya: <https://maya.com#> DELETE WHERE { ?s maya:hasAge ?o }")
+    second.insert("file:/snippet/generated/winik/2", "maya:hasAge", 1)
+    first.extend(second)
+
+    expected = WriteBuffer()
+    expected.set("file:/snippet/generated/winik/1", "maya:hasHealth", 90)
+    expected.set("file:/snippet/generated/winik/1", "maya:hasHealth", 80)
+    expected.update("PREFIX maya: <https://maya.com#> DELETE WHERE { ?s maya:hasAge ?o }")
+    expected.insert("file:/snippet/generated/winik/2", "maya:hasAge", 1)
+    assert first.to_updates() == expected.to_updates()
+
+
+def test_writes_are_held_until_flush():
+    model = Model(query=LocalQuery(initial_state))
+    winik_id = "file:/snippet/generated/winik/1"
+    model.update_health(winik_id, 50)
+    model.update_health(winik_id, 40)
+    model.kill_winik("file:/snippet/generated/winik/2")
+    assert list(model.graph.get_winik(winik_id, "maya:hasHealth")) == ["100"]
+
+    posts = []
+    post_many = model.graph.query.post_many
+    model.graph.query.post_many = lambda updates: posts.append(updates) or post_many(updates)
+    model.graph.flush()
+    assert len(posts) == 1
+    assert list(model.graph.get_winik(winik_id, "maya:hasHealth")) == ["40"]
+    assert list(model.graph.get_winik("file:/snippet/generated/winik/2", "maya:isAlive")) == ["false"]
+    assert not len(model.graph.writes)
+
+
+def test_discard():
+    model = Model(query=LocalQuery(initial_state))
+    model.update_health("file:/snippet/generated/winik/1", 50)
+    model.graph.discard()
+    model.graph.flush()
+    assert list(model.graph.get_winik("file:/snippet/generated/winik/1", "maya:hasHealth")) == ["100"]
+
+
+def test_deferred_writes_run_when_merged():
+    calls = []
+    captured = WriteBuffer()
+    captured.set("file:/snippet/generated/winik/1", "maya:hasHealth", 90)
+    captured.defer(lambda writes: calls.append(writes) or writes.set("file:/snippet/generated/winik/2",
+                                                                     "maya:hasHealth", 80))
+    assert not calls
+    merged = WriteBuffer()
+    merged.extend(captured)
+    assert calls == [merged]
+    assert "<file:/snippet/generated/winik/2> maya:hasHealth 80 ." in merged.to_update()